@@ -0,0 +1,84 @@
+"""
+Micro-benchmark of event application: EventProcessor.apply_claim /
+apply_revert once per event vs apply_claims / apply_reverts per batch, on
+already decoded records so parsing is excluded. Each is run --repeat
+times, alternating, and the fastest run is reported. Also checks that both
+produce the same outputs and counters.
+
+    PYTHONPATH=src python benchmarks/bench_apply.py --claims 200000 --batch 1024 --repeat 3
+"""
+import argparse
+import gc
+import time
+
+from bench_decode import make_objects
+
+from events_processor.core.money import MONEY_ENGINES
+from events_processor.core.processor import EventProcessor
+from events_processor.core.state import InMemoryState
+from events_processor.destination.builders import (
+    build_goal2_metrics,
+    build_goal3_top2_chains,
+    build_goal4_top_quantities,
+)
+from events_processor.sources.events_json import ClaimDecoder, _decode_revert
+
+
+def run(money, claims, reverts, pharmacies, batch: int):
+    """Applies fresh records (apply mutates them); batch=0 applies one event at a time."""
+    decode = ClaimDecoder(money).decode
+    records = [decode(o) for o in claims]
+    items = [_decode_revert(o) for o in reverts]
+    state = InMemoryState.with_money(money)
+    state.pharmacy_chain_by_npi = pharmacies
+    processor = EventProcessor(state)
+
+    gc.collect()
+    start = time.perf_counter()
+    if batch:
+        for i in range(0, len(records), batch):
+            processor.apply_claims(records[i:i + batch])
+        for i in range(0, len(items), batch):
+            processor.apply_reverts(items[i:i + batch])
+    else:
+        apply_claim, apply_revert = processor.apply_claim, processor.apply_revert
+        for cr, ts in records:
+            apply_claim(cr, ts)
+        for item in items:
+            apply_revert(*item)
+    seconds = time.perf_counter() - start
+
+    outputs = (build_goal2_metrics(state), build_goal3_top2_chains(state), build_goal4_top_quantities(state))
+    return seconds, outputs, processor.counters
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser("bench-apply")
+    parser.add_argument("--claims", type=int, default=200_000)
+    parser.add_argument("--batch", type=int, default=1024)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    claims, reverts, pharmacies = make_objects(args.claims)
+    # duplicates of the first 5% of claims and reverts
+    claims += claims[: len(claims) // 20]
+    reverts += reverts[: len(reverts) // 20]
+    n = len(claims) + len(reverts)
+
+    for name, money in MONEY_ENGINES.items():
+        t_one = t_batch = float("inf")
+        for _ in range(args.repeat):
+            seconds, out_one, counters_one = run(money, claims, reverts, pharmacies, 0)
+            t_one = min(t_one, seconds)
+            seconds, out_batch, counters_batch = run(money, claims, reverts, pharmacies, args.batch)
+            t_batch = min(t_batch, seconds)
+        same = out_one == out_batch and counters_one == counters_batch
+        print(
+            f"{name:>8}: per event {t_one / n * 1e6:6.2f} us/event   "
+            f"batch of {args.batch} {t_batch / n * 1e6:6.2f} us/event   "
+            f"({t_one / t_batch:.2f}x, outputs {'identical' if same else 'DIFFER'})"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Bytes per stored claim for the claim store layouts (--claim-store)
+under both money engines, measured with tracemalloc.
+
+    PYTHONPATH=src python benchmarks/bench_claim_store.py --claims 200000
+"""
+import argparse
+import gc
+import json
+import random
+import tracemalloc
+
+from events_processor.core.claim_store import CompactClaimStore, DictClaimStore
+from events_processor.core.money import MONEY_ENGINES
+from events_processor.core.models import ClaimRecord, normalize_decimal_key
+from events_processor.sources.events_json import _parse_claim
+
+
+def claim_lines(n: int, seed: int = 42):
+    rnd = random.Random(seed)
+    ndcs = [f"{rnd.randrange(100000):05d}-{rnd.randrange(1000):03d}-{rnd.randrange(100):02d}" for _ in range(2000)]
+    for i in range(n):
+        yield json.dumps(
+            {
+                "id": f"{i:08x}-0000-4000-8000-{rnd.getrandbits(48):012x}",
+                "npi": str(1000000000 + rnd.randrange(5000)),
+                "ndc": rnd.choice(ndcs),
+                "price": round(rnd.uniform(1, 5000), 2),
+                "quantity": rnd.choice([30, 60, 90, 10.5]),
+                "timestamp": "2024-03-14T12:00:00",
+            }
+        )
+
+
+def measure(layout: str, engine: str, lines) -> float:
+    money = MONEY_ENGINES[engine]
+    gc.collect()
+    tracemalloc.start()
+    store = CompactClaimStore(money) if layout == "compact" else DictClaimStore()
+    for line in lines:
+        # parse from text so every record owns fresh strings, as in production
+        ev = _parse_claim(json.loads(line), money)
+        store.add(
+            ClaimRecord(
+                claim_id=ev.id,
+                npi=ev.npi,
+                ndc=ev.ndc,
+                chain="chain-" + ev.npi[-1],
+                price=ev.price,
+                quantity_key=normalize_decimal_key(ev.quantity),
+                unit_price=ev.unit_price,
+            )
+        )
+        del ev
+    gc.collect()
+    used, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return used / len(store)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser("bench-claim-store")
+    parser.add_argument("--claims", type=int, default=200_000)
+    args = parser.parse_args()
+
+    lines = list(claim_lines(args.claims))
+    for engine in ("decimal", "fixed"):
+        for layout in ("dict", "compact"):
+            print(f"{layout:>8} / {engine:<8} {measure(layout, engine, lines):8.1f} bytes/claim")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Micro-benchmark of claim/revert decoding: the reference parsers
+(_parse_claim / _parse_revert + EventProcessor.handle) vs the fast path
+(ClaimDecoder / _decode_revert + EventProcessor.apply_*), on already
+JSON-decoded objects so file reading and json.loads are excluded.
+
+    PYTHONPATH=src python benchmarks/bench_decode.py --claims 200000
+"""
+import argparse
+import json
+import random
+import time
+
+from events_processor.core.money import MONEY_ENGINES
+from events_processor.core.processor import EventProcessor
+from events_processor.core.state import InMemoryState
+from events_processor.sources.events_json import ClaimDecoder, _decode_revert, _parse_claim, _parse_revert
+
+
+def make_objects(n: int, seed: int = 42):
+    rnd = random.Random(seed)
+    ndcs = [f"{rnd.randrange(100000):05d}-{rnd.randrange(1000):03d}-{rnd.randrange(100):02d}" for _ in range(2000)]
+    claims = [
+        json.loads(json.dumps({
+            "id": f"{i:08x}-0000-4000-8000-{rnd.getrandbits(48):012x}",
+            "npi": str(1000000000 + rnd.randrange(5000)),
+            "ndc": rnd.choice(ndcs),
+            "price": round(rnd.uniform(1, 5000), 2),
+            "quantity": rnd.choice([30, 60, 90, 30.0, 10.5, 1, 7, 14]),
+            "timestamp": f"2024-03-{rnd.randrange(1, 29):02d}T12:{rnd.randrange(60):02d}:00",
+        }))
+        for i in range(n)
+    ]
+    reverts = [
+        {"id": f"r{i}", "claim_id": c["id"], "timestamp": "2024-04-01T00:00:00"}
+        for i, c in enumerate(rnd.sample(claims, n // 4))
+    ]
+    pharmacies = {str(1000000000 + i): rnd.choice(["cvs", "walgreens", "health"]) for i in range(5000)}
+    return claims, reverts, pharmacies
+
+
+def timed(fn) -> float:
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser("bench-decode")
+    parser.add_argument("--claims", type=int, default=200_000)
+    args = parser.parse_args()
+
+    claims, reverts, pharmacies = make_objects(args.claims)
+    n = len(claims) + len(reverts)
+
+    for name, money in MONEY_ENGINES.items():
+        decode = ClaimDecoder(money).decode
+
+        t_ref = timed(lambda: ([_parse_claim(o, money) for o in claims], [_parse_revert(o) for o in reverts]))
+        t_fast = timed(lambda: ([decode(o) for o in claims], [_decode_revert(o) for o in reverts]))
+        print(f"{name:>8} decode:         reference {n / t_ref:>10,.0f}/s  fast {n / t_fast:>10,.0f}/s"
+              f"  ({t_ref / t_fast:.2f}x)")
+
+        def reference() -> None:
+            state = InMemoryState.with_money(money)
+            state.pharmacy_chain_by_npi = pharmacies
+            handle = EventProcessor(state).handle
+            for o in claims:
+                handle(_parse_claim(o, money))
+            for o in reverts:
+                handle(_parse_revert(o))
+
+        def fast() -> None:
+            state = InMemoryState.with_money(money)
+            state.pharmacy_chain_by_npi = pharmacies
+            processor = EventProcessor(state)
+            decode = ClaimDecoder(money).decode
+            apply_claim = processor.apply_claim
+            apply_revert = processor.apply_revert
+            for o in claims:
+                apply_claim(*decode(o))
+            for o in reverts:
+                apply_revert(*_decode_revert(o))
+
+        t_ref = timed(reference)
+        t_fast = timed(fast)
+        print(f"{name:>8} decode + apply: reference {n / t_ref:>10,.0f}/s  fast {n / t_fast:>10,.0f}/s"
+              f"  ({t_ref / t_fast:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Output cost per streaming update: the full output files (--output-mode full)
+vs the changelog (--output-mode delta), after an initial load of most claims
+followed by small polls. Also replays the changelog the way a consumer
+would (manifest, snapshot, deltas) and checks that it gives exactly the rows
+of the full output files; exits non-zero if not.
+
+    PYTHONPATH=src python benchmarks/bench_delta.py --claims 200000 --polls 20 --per-poll 500
+"""
+import argparse
+import json
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+from bench_decode import make_objects
+
+from events_processor.core.money import FIXED_MONEY
+from events_processor.core.processor import EventProcessor
+from events_processor.core.state import InMemoryState
+from events_processor.destination.changelog import MANIFEST, OUTPUTS, DeltaLog
+from events_processor.destination.incremental import IncrementalOutputs
+from events_processor.main import write_outputs
+from events_processor.sources.events_json import ClaimDecoder, _decode_revert
+
+
+def replay(changes_dir: Path) -> Dict[str, List[dict]]:
+    """Rows of every output as a consumer rebuilds them from the changelog."""
+    manifest = json.loads((changes_dir / MANIFEST).read_text())
+    keys = {name: tuple(fields) for name, fields in manifest["keys"].items()}
+    rows: Dict[str, Dict[Tuple, dict]] = {name: {} for name in keys}
+
+    def apply(file: str) -> None:
+        with (changes_dir / file).open(encoding="utf-8") as f:
+            for line in f:
+                change = json.loads(line)
+                name = change["goal"]
+                if change["op"] == "put":
+                    row = change["row"]
+                    rows[name][tuple(row[k] for k in keys[name])] = row
+                else:
+                    rows[name].pop(tuple(change["key"][k] for k in keys[name]), None)
+
+    apply(manifest["snapshot"]["file"])
+    for delta in manifest["deltas"]:
+        if delta["seq"] > manifest["snapshot"]["seq"]:
+            apply(delta["file"])
+    return {name: [r for _, r in sorted(by_key.items())] for name, by_key in rows.items()}
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser("bench-delta")
+    parser.add_argument("--claims", type=int, default=200_000)
+    parser.add_argument("--polls", type=int, default=20)
+    parser.add_argument("--per-poll", type=int, default=500, help="Claims (and a quarter as many reverts) per poll")
+    parser.add_argument("--snapshot-every", type=int, default=8)
+    args = parser.parse_args()
+
+    claims, reverts, pharmacies = make_objects(args.claims)
+    tail = args.polls * args.per_poll
+    initial = len(claims) - tail
+
+    with tempfile.TemporaryDirectory() as tmp:
+        results = {}
+        for mode in ("full", "delta"):
+            out = Path(tmp) / mode
+            out.mkdir()
+            state = InMemoryState.with_money(FIXED_MONEY)
+            state.pharmacy_chain_by_npi = pharmacies
+            processor = EventProcessor(state)
+            decode = ClaimDecoder(FIXED_MONEY).decode
+            outputs = IncrementalOutputs(track_changes=mode == "delta")
+            changelog = DeltaLog(out / "changes", args.snapshot_every) if mode == "delta" else None
+
+            def poll(claim_objs, revert_objs) -> float:
+                processor.apply_claims([r for r in map(decode, claim_objs) if r is not None])
+                processor.apply_reverts([r for r in map(_decode_revert, revert_objs) if r is not None])
+                start = time.perf_counter()
+                write_outputs(out, state, outputs, changelog=changelog)
+                return time.perf_counter() - start
+
+            first = poll(claims[:initial], reverts[: len(reverts) - tail // 4])
+            seconds = 0.0
+            for i in range(args.polls):
+                start = initial + i * args.per_poll
+                rstart = len(reverts) - tail // 4 + i * (args.per_poll // 4)
+                seconds += poll(claims[start:start + args.per_poll], reverts[rstart:rstart + args.per_poll // 4])
+
+            if changelog is None:
+                written = sum((out / f"{name}.json").stat().st_size for name, _ in OUTPUTS)
+            else:
+                manifest = json.loads((out / "changes" / MANIFEST).read_text())
+                deltas = [d for d in manifest["deltas"] if d["seq"] > 1]
+                written = sum(d["bytes"] for d in deltas) / len(deltas)
+            results[mode] = (first, seconds / args.polls, written)
+            print(f"{mode:>6}: first write {first * 1000:8.1f} ms, then {seconds / args.polls * 1000:7.1f} ms/poll, "
+                  f"{written / 1024:9.1f} KiB/poll")
+
+        expected = {name: json.loads((Path(tmp) / "full" / f"{name}.json").read_text()) for name, _ in OUTPUTS}
+        same = replay(Path(tmp) / "delta" / "changes") == expected
+        print(f"replayed changelog: {'identical' if same else 'DIFFERS'} to the full outputs; "
+              f"{results['full'][1] / results['delta'][1]:.1f}x less write time per poll")
+        return 0 if same else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,64 @@
+"""
+Directory scan cost per poll: a full discover_files() listing vs the cached
+DirectoryIndex used by --streaming, on a generated tree of empty files, with
+and without a new file arriving between polls.
+
+    PYTHONPATH=src python benchmarks/bench_discover.py --files 100000 --dirs 10
+"""
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+from events_processor.sources.discover import DirectoryIndex, ScanStats, discover_files
+
+
+def timed(fn, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser("bench-discover")
+    parser.add_argument("--files", type=int, default=100_000)
+    parser.add_argument("--dirs", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        dirs = [root / f"d{i:03d}" for i in range(args.dirs)]
+        for d in dirs:
+            d.mkdir()
+        for i in range(args.files):
+            (dirs[i % args.dirs] / f"claims_{i:08d}.json").touch()
+
+        stats = ScanStats()
+        full = timed(lambda: discover_files([tmp], stats=stats), args.repeat)
+        print(f"discover_files:              {full * 1000:>9.1f} ms/poll  "
+              f"({stats.entries // args.repeat} entries read)")
+
+        index = DirectoryIndex([root])
+        index.scan()
+        # listings of just-written directories are only trusted once they settle
+        time.sleep(2.1)
+        index.scan()
+        cached = timed(index.scan, args.repeat)
+        print(f"DirectoryIndex, no change:   {cached * 1000:>9.1f} ms/poll  "
+              f"({index.last_stats.entries} entries read)")
+
+        n = iter(range(args.files, 2 * args.files))
+
+        def one_new_file() -> None:
+            (dirs[0] / f"claims_{next(n):08d}.json").touch()
+            index.scan()
+
+        changed = timed(one_new_file, args.repeat)
+        print(f"DirectoryIndex, 1 new file:  {changed * 1000:>9.1f} ms/poll  "
+              f"({index.last_stats.entries} entries read)")
+
+
+if __name__ == "__main__":
+    main()
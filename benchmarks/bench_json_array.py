@@ -0,0 +1,91 @@
+"""
+Throughput and peak RSS of reading a large JSON array file of claims:
+the previous `json.load` path vs the incremental array decoder.
+
+Each variant runs in a fresh subprocess so peak RSS is not shared.
+
+    PYTHONPATH=src python benchmarks/bench_json_array.py --claims 1000000
+"""
+import argparse
+import json
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+
+def write_array_file(path: Path, n: int, seed: int = 42) -> None:
+    rnd = random.Random(seed)
+    with path.open("w", encoding="utf-8") as f:
+        f.write("[\n")
+        for i in range(n):
+            claim = {
+                "id": f"{i:08x}-0000-4000-8000-{rnd.getrandbits(48):012x}",
+                "npi": str(1000000000 + rnd.randrange(5000)),
+                "ndc": f"{rnd.randrange(100000):05d}-{rnd.randrange(1000):03d}-{rnd.randrange(100):02d}",
+                "price": round(rnd.uniform(1, 5000), 2),
+                "quantity": rnd.choice([30, 60, 90, 10.5]),
+                "timestamp": "2024-03-14T12:00:00",
+            }
+            f.write(("  " if i == 0 else ", ") + json.dumps(claim) + "\n")
+        f.write("]\n")
+
+
+def run_variant(variant: str, path: Path) -> dict:
+    from events_processor.sources.events_json import _iter_json_objects, _parse_claim
+
+    start = time.perf_counter()
+    n = 0
+    if variant == "json_load":
+        with path.open("r", encoding="utf-8") as f:
+            data = json.load(f)
+        for obj in data:
+            if _parse_claim(obj) is not None:
+                n += 1
+    else:
+        for obj in _iter_json_objects(path):
+            if _parse_claim(obj) is not None:
+                n += 1
+    elapsed = time.perf_counter() - start
+
+    return {
+        "variant": variant,
+        "claims": n,
+        "seconds": round(elapsed, 3),
+        "claims_per_sec": round(n / elapsed) if elapsed else None,
+        # ru_maxrss is in KiB on Linux
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser("bench-json-array")
+    parser.add_argument("--claims", type=int, default=500_000)
+    parser.add_argument("--variant", choices=["json_load", "stream"], help=argparse.SUPPRESS)
+    parser.add_argument("--file", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.variant:
+        print(json.dumps(run_variant(args.variant, Path(args.file))))
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "claims.json"
+        write_array_file(path, args.claims)
+        print(f"file: {path.stat().st_size / 2**20:.1f} MiB, {args.claims} claims")
+
+        for variant in ("json_load", "stream"):
+            out = subprocess.run(
+                [sys.executable, __file__, "--variant", variant, "--file", str(path)],
+                check=True,
+                capture_output=True,
+                text=True,
+            )
+            print(out.stdout.strip())
+
+
+if __name__ == "__main__":
+    main()
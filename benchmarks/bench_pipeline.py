@@ -0,0 +1,229 @@
+"""
+End-to-end batch benchmark on a generated dataset (see datagen.py):
+events/sec, time per stage and peak RSS, saved as JSON for comparing runs.
+
+Stages:
+- discover: listing the pharmacy, claim and revert directories
+- parse: reading and decoding all events without applying them
+- apply: process_files (parse + apply) minus the parse time (inline serial runs only;
+  --engine columnar: resolving dedup and reverts on the decoded columns)
+- build: the three output builders (--engine columnar: the grouped reductions and rows)
+- write: writing the output files
+
+Each run is a fresh subprocess, so peak RSS belongs to that run only.
+
+    PYTHONPATH=src python benchmarks/bench_pipeline.py --claims 1000000 \\
+        --run default --run "--money fixed --claim-store compact" --json results.json
+
+Full backfill with the NumPy engine (needs numpy):
+
+    PYTHONPATH=src python benchmarks/bench_pipeline.py --claims 10000000 \
+        --run "--money fixed" --run "--engine columnar --money fixed"
+
+Compressed inputs (gz, bz2 or xz; compare with a run on the plain dataset):
+
+    PYTHONPATH=src python benchmarks/bench_pipeline.py --claims 1000000 --compress gz \
+        --run default --run "--workers 4"
+
+Claims and dedup ids in SQLite instead of memory:
+
+    PYTHONPATH=src python benchmarks/bench_pipeline.py --claims 1000000 \
+        --run default --run "--state-backend sqlite" --run "--state-backend sqlite --state-cache 1000000"
+"""
+import argparse
+import json
+import platform
+import resource
+import shlex
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from datagen import add_spec_arguments, generate, spec_from_args
+
+
+def run_once(data: Path, options: list) -> dict:
+    """Runs inside the benchmark subprocess."""
+    from events_processor.columnar import ColumnarProcessor
+    from events_processor.core.claim_store import CompactClaimStore, DictClaimStore
+    from events_processor.core.dedup import new_dedup
+    from events_processor.core.money import MONEY_ENGINES
+    from events_processor.core.processor import EventProcessor
+    from events_processor.core.sqlite_state import SqliteClaimStore, SqliteDatabase, SqliteDedup
+    from events_processor.core.state import InMemoryState
+    from events_processor.destination.builders import (
+        build_goal2_metrics,
+        build_goal3_top2_chains,
+        build_goal4_top_quantities,
+    )
+    from events_processor.destination.writer import write_json_atomic
+    from events_processor.main import process_files
+    from events_processor.metrics import Metrics
+    from events_processor.sharded import ShardedProcessor
+    from events_processor.sources.discover import discover_files
+    from events_processor.sources.events_json import iter_claim_events, iter_revert_events
+    from events_processor.sources.pharmacies import load_pharmacies_csv
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--readers", type=int, default=0)
+    parser.add_argument("--shards", type=int, default=1)
+    parser.add_argument("--money", default="decimal")
+    parser.add_argument("--claim-store", default="dict")
+    parser.add_argument("--dedup", default="exact")
+    parser.add_argument("--engine", default="events")
+    parser.add_argument("--state-backend", default="memory")
+    parser.add_argument("--state-cache", type=int, default=100_000)
+    opts = parser.parse_args(options)
+    if opts.engine == "columnar" and opts.money != "fixed":
+        parser.error("--engine columnar requires --money fixed")
+
+    stages = {}
+    t = time.perf_counter()
+    pharm_files = discover_files([str(data / "pharmacies")]).csv_files
+    claim_files = discover_files([str(data / "claims")]).json_files
+    revert_files = discover_files([str(data / "reverts")]).json_files
+    stages["discover"] = time.perf_counter() - t
+    input_mb = sum(fp.stat().st_size for fp in claim_files + revert_files) / 2 ** 20
+
+    money = MONEY_ENGINES[opts.money]
+    state_db = None
+    db_dir = tempfile.TemporaryDirectory()
+    if opts.state_backend == "sqlite":
+        state_db = SqliteDatabase(Path(db_dir.name) / "state.sqlite3")
+        claims = SqliteClaimStore(state_db, money, opts.state_cache)
+    else:
+        claims = CompactClaimStore(money) if opts.claim_store == "compact" else DictClaimStore()
+    state = InMemoryState.with_money(money, claims, lambda: new_dedup(opts.dedup))
+    if state_db is not None and opts.dedup == "exact":
+        state.seen_claim_ids = SqliteDedup(state_db, "claim_ids")
+        state.seen_revert_ids = SqliteDedup(state_db, "revert_ids")
+    state.pharmacy_chain_by_npi = load_pharmacies_csv(pharm_files)
+    # as a batch run of main: Goal 3 is derived from Goal 2 after all events
+    processor = EventProcessor(state, track_goal3=False)
+    if opts.shards > 1:
+        processor = ShardedProcessor(state, opts.shards)
+        state = processor.state
+
+    t = time.perf_counter()
+    events = sum(1 for _ in iter_claim_events(claim_files, money))
+    events += sum(1 for _ in iter_revert_events(revert_files))
+    stages["parse"] = time.perf_counter() - t
+
+    if opts.engine == "columnar":
+        # decoding, resolving and the grouped goal reductions in one call
+        processor = ColumnarProcessor(state.pharmacy_chain_by_npi)
+        metrics = Metrics()
+        processor.process_files(claim_files, revert_files, metrics)
+        process = metrics.stage_seconds["parse"] + metrics.stage_seconds["apply"]
+        # its own decoding into columns is part of `process`; apply is the array resolve
+        stages["apply"] = metrics.stage_seconds["apply"]
+        stages["build"] = sum(metrics.stage_seconds[f"build_goal{n}"] for n in (2, 3, 4))
+        goal2, goal3, goal4 = processor.goal2, processor.goal3, processor.goal4
+    else:
+        t = time.perf_counter()
+        process_files(processor, claim_files, revert_files, opts.workers, readers=opts.readers)
+        if opts.shards <= 1:
+            processor.rebuild_goal3()
+        if state_db is not None:
+            state_db.flush()
+        process = time.perf_counter() - t
+        serial = opts.workers <= 1 and opts.readers <= 0 and opts.shards <= 1
+        stages["apply"] = process - stages["parse"] if serial else None
+        if opts.shards > 1:
+            processor.close()
+
+        t = time.perf_counter()
+        goal2 = build_goal2_metrics(state)
+        goal3 = build_goal3_top2_chains(state)
+        goal4 = build_goal4_top_quantities(state)
+        stages["build"] = time.perf_counter() - t
+
+    state_db_mb = None
+    if state_db is not None:
+        state_db.close()
+        state_db_mb = sum(p.stat().st_size for p in Path(db_dir.name).iterdir()) / 2 ** 20
+    db_dir.cleanup()
+
+    with tempfile.TemporaryDirectory() as out:
+        t = time.perf_counter()
+        write_json_atomic(Path(out) / "metrics_by_npi_ndc.json", goal2)
+        write_json_atomic(Path(out) / "top2_chain_per_ndc.json", goal3)
+        write_json_atomic(Path(out) / "most_common_qty_per_ndc.json", goal4)
+        stages["write"] = time.perf_counter() - t
+
+    return {
+        "options": options,
+        "events": events,
+        "input_mb": input_mb,
+        "events_per_sec": events / process,
+        "process_seconds": process,
+        "stages": stages,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "state_db_mb": state_db_mb,
+        "counters": {k: getattr(processor.counters, k) for k in processor.counters.__slots__},
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_spec_arguments(parser)
+    parser.add_argument("--data", help="Reuse (or create) the dataset in this directory")
+    parser.add_argument(
+        "--run",
+        action="append",
+        help='Options of one run, e.g. "--workers 4" ("default" for none); repeatable',
+    )
+    parser.add_argument("--json", help="Write results to this file")
+    parser.add_argument("--child", nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        data, options = args.child
+        print(json.dumps(run_once(Path(data), json.loads(options))))
+        return
+
+    spec = spec_from_args(args)
+    with tempfile.TemporaryDirectory() as tmp:
+        data = Path(args.data) if args.data else Path(tmp)
+        if not (data / "claims").exists():
+            t = time.perf_counter()
+            summary = generate(data, spec)
+            print(f"generated {summary['claims']} claims, {summary['reverts']} reverts "
+                  f"in {time.perf_counter() - t:.1f}s")
+
+        results = []
+        for run in args.run or ["default"]:
+            options = [] if run == "default" else shlex.split(run)
+            out = subprocess.run(
+                [sys.executable, __file__, "--child", str(data), json.dumps(options)],
+                check=True,
+                stdout=subprocess.PIPE,
+                text=True,
+            ).stdout
+            result = json.loads(out)
+            results.append(result)
+
+            stages = ", ".join(
+                f"{name}={sec:.3f}s" for name, sec in result["stages"].items() if sec is not None
+            )
+            disk = f", state db {result['state_db_mb']:.0f} MB" if result["state_db_mb"] is not None else ""
+            print(f"{run:40} {result['events_per_sec']:>10,.0f} events/s  "
+                  f"input {result['input_mb']:.0f} MB  peak RSS {result['peak_rss_mb']:.0f} MB{disk}  ({stages})")
+
+    if args.json:
+        report = {
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "dataset": {"path": args.data, "spec": spec_from_args(args).__dict__},
+            "results": results,
+        }
+        Path(args.json).write_text(json.dumps(report, indent=2))
+        print(f"results written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Cost of publishing a query snapshot (QueryStore.publish) per streaming
+update, after initial loads of growing size followed by small polls, and of
+the first Goal 2 query by ndc on each snapshot: both should follow the
+changed rows or the answer, not the total state. Also checks the query
+answers of the last snapshot against the full builders; exits non-zero if
+they differ.
+
+    PYTHONPATH=src python benchmarks/bench_query.py --claims 50000 200000 --polls 20 --per-poll 500
+"""
+import argparse
+import gc
+import sys
+import time
+from typing import Tuple
+
+from bench_decode import make_objects
+
+from events_processor.core.money import FIXED_MONEY
+from events_processor.core.processor import EventProcessor
+from events_processor.core.state import InMemoryState
+from events_processor.destination.builders import build_goal2_metrics, build_goal4_top_quantities
+from events_processor.destination.incremental import IncrementalOutputs
+from events_processor.query import QueryStore
+from events_processor.sources.events_json import ClaimDecoder, _decode_revert
+
+
+def run(n_claims: int, polls: int, per_poll: int) -> bool:
+    claims, reverts, pharmacies = make_objects(n_claims)
+    tail = polls * per_poll
+    initial = len(claims) - tail
+    state = InMemoryState.with_money(FIXED_MONEY)
+    state.pharmacy_chain_by_npi = pharmacies
+    processor = EventProcessor(state)
+    decode = ClaimDecoder(FIXED_MONEY).decode
+    outputs = IncrementalOutputs(ndc_index=True)
+    store = QueryStore()
+
+    def poll(claim_objs, revert_objs) -> Tuple[float, float]:
+        processor.apply_claims([r for r in map(decode, claim_objs) if r is not None])
+        processor.apply_reverts([r for r in map(_decode_revert, revert_objs) if r is not None])
+        outputs.build(state)
+        # a collection of the whole heap would be timed as publishing
+        gc.collect()
+        start = time.perf_counter()
+        store.publish(outputs)
+        published = time.perf_counter()
+        store.snapshot.metrics(None, claim_objs[-1]["ndc"])
+        return published - start, time.perf_counter() - published
+
+    poll(claims[:initial], reverts[: len(reverts) - tail // 4])
+    seconds = query_seconds = 0.0
+    for i in range(polls):
+        start = initial + i * per_poll
+        rstart = len(reverts) - tail // 4 + i * (per_poll // 4)
+        publish, query = poll(claims[start:start + per_poll], reverts[rstart:rstart + per_poll // 4])
+        seconds += publish
+        query_seconds += query
+
+    snap = store.snapshot
+    goal2 = build_goal2_metrics(state)
+    npi, ndc = goal2[len(goal2) // 2]["npi"], goal2[len(goal2) // 2]["ndc"]
+    goal4 = build_goal4_top_quantities(state)
+    same = (
+        list(snap.goal2) == goal2
+        and snap.metrics(npi, ndc) == [r for r in goal2 if r["npi"] == npi and r["ndc"] == ndc]
+        and snap.metrics(npi, None) == [r for r in goal2 if r["npi"] == npi]
+        and snap.metrics(None, ndc) == [r for r in goal2 if r["ndc"] == ndc]
+        and snap.per_ndc(snap.goal4, None)[10:30] == goal4[10:30]
+    )
+    print(f"{len(goal2):>9} goal 2 rows: publish {seconds / polls * 1e6:8.1f} us/poll, "
+          f"ndc query {query_seconds / polls * 1e6:8.1f} us, answers {'identical' if same else 'DIFFER'}")
+    return same
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser("bench-query")
+    parser.add_argument("--claims", type=int, nargs="+", default=[50_000, 200_000])
+    parser.add_argument("--polls", type=int, default=20)
+    parser.add_argument("--per-poll", type=int, default=500, help="Claims (and a quarter as many reverts) per poll")
+    args = parser.parse_args()
+
+    same = [run(n, args.polls, args.per_poll) for n in args.claims]
+    return 0 if all(same) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,76 @@
+"""
+Parity check of the columnar batch engine (--engine columnar, needs numpy)
+against EventProcessor with --money fixed: output files must be
+byte-identical and counters equal. Exits non-zero otherwise.
+
+    PYTHONPATH=src python benchmarks/columnar_parity.py \\
+        --pharmacies data_source/data/pharmacies \\
+        --claims data_source/data/claims \\
+        --reverts data_source/data/reverts
+"""
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from events_processor.columnar import ColumnarProcessor, columnar_available
+from events_processor.core.money import FIXED_MONEY
+from events_processor.core.processor import Counters, EventProcessor
+from events_processor.core.state import InMemoryState
+from events_processor.destination.incremental import IncrementalOutputs
+from events_processor.main import process_files, write_outputs, write_rows
+from events_processor.metrics import Metrics
+from events_processor.sources.discover import discover_files
+from events_processor.sources.pharmacies import load_pharmacies_csv
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser("columnar-parity")
+    parser.add_argument("--pharmacies", nargs="+", required=True)
+    parser.add_argument("--claims", nargs="+", required=True)
+    parser.add_argument("--reverts", nargs="+", required=True)
+    args = parser.parse_args()
+    if not columnar_available():
+        print("numpy is not installed")
+        return 2
+
+    pharmacies = load_pharmacies_csv(discover_files(args.pharmacies).csv_files)
+    claim_files = discover_files(args.claims).json_files
+    revert_files = discover_files(args.reverts).json_files
+
+    with tempfile.TemporaryDirectory() as tmp:
+        expected_dir, actual_dir = Path(tmp, "events"), Path(tmp, "columnar")
+        expected_dir.mkdir()
+        actual_dir.mkdir()
+
+        t0 = time.perf_counter()
+        state = InMemoryState.with_money(FIXED_MONEY)
+        state.pharmacy_chain_by_npi = pharmacies
+        processor = EventProcessor(state)
+        process_files(processor, claim_files, revert_files)
+        write_outputs(expected_dir, state, IncrementalOutputs())
+        t1 = time.perf_counter()
+        columnar = ColumnarProcessor(pharmacies)
+        columnar.process_files(claim_files, revert_files)
+        write_rows(actual_dir, columnar.goal2, columnar.goal3, columnar.goal4, Metrics())
+        t2 = time.perf_counter()
+        print(f"  events: {t1 - t0:.3f}s\ncolumnar: {t2 - t1:.3f}s")
+
+        mismatches = 0
+        for f in sorted(expected_dir.iterdir()):
+            if f.read_bytes() != (actual_dir / f.name).read_bytes():
+                print(f"{f.name}: differs")
+                mismatches += 1
+        for name in Counters.__slots__:
+            a, b = getattr(processor.counters, name), getattr(columnar.counters, name)
+            if a != b:
+                print(f"counter {name}: {a} != {b}")
+                mismatches += 1
+
+    print("parity: OK" if not mismatches else f"parity: {mismatches} mismatches")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,231 @@
+"""
+Seeded synthetic dataset: a pharmacy CSV plus claim and revert files in
+JSON lines and/or JSON array form. The same arguments always produce the
+same bytes.
+
+Records are generated in timestamp order and written as a stream split into
+`--files` claim files and as many revert files:
+- a `--dup-rate` share of claims (and reverts) is repeated a little later
+- a `--revert-rate` share of claims gets a revert
+- an `--out-of-order-rate` share of claims is written late (timestamps go
+  backwards), and the same share of reverts refers to a claim that is only
+  written later (revert before claim)
+- `--unknown-npi-rate` of the npis are missing from the pharmacy CSV
+- `--compress gz|bz2|xz` writes the claim and revert files compressed
+
+    python benchmarks/datagen.py /tmp/bench-data --claims 1000000 --format mixed
+"""
+import argparse
+import bz2
+import gzip
+import heapq
+import io
+import json
+import lzma
+import random
+from dataclasses import asdict, dataclass
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import List, TextIO
+
+BASE_TIME = datetime(2024, 1, 1)
+CHAINS = ["walgreens", "cvs", "health", "doctor", "saint", "rite", "kroger", "costco"]
+QUANTITIES = ["30", "60", "90", "30.0", "10.5", "1", "7", "14", "100", "28", "56"]
+
+# binary writers of compressed event files, by suffix (gzip without a
+# timestamp, so the same arguments give the same bytes)
+OPENERS = {
+    "gz": lambda path: gzip.GzipFile(path, "wb", compresslevel=6, mtime=0),
+    "bz2": lambda path: bz2.BZ2File(path, "wb"),
+    "xz": lambda path: lzma.LZMAFile(path, "wb"),
+}
+
+# how far (in records) duplicates, late claims and early reverts are moved
+MAX_DELAY = 1000
+
+
+@dataclass
+class DataSpec:
+    claims: int = 100_000
+    seed: int = 1
+    files: int = 8
+    format: str = "jsonl"  # jsonl | array | mixed
+    dup_rate: float = 0.05
+    revert_rate: float = 0.25
+    out_of_order_rate: float = 0.05
+    npis: int = 5000
+    ndcs: int = 2000
+    unknown_npi_rate: float = 0.05
+    compress: str = "none"  # none | gz | bz2 | xz
+
+
+def claim_id(seed: int, i: int) -> str:
+    # deterministic from the index, so a revert can name a claim not written yet
+    return f"{i:08x}-{seed & 0xffff:04x}-4000-8000-{(i * 2654435761 + seed) & 0xFFFFFFFFFFFF:012x}"
+
+
+class _JsonWriter:
+    """Writes one file of objects as JSON lines or a JSON array."""
+
+    def __init__(self, path: Path, array: bool, compress: str = "none") -> None:
+        if compress == "none":
+            self.f: TextIO = path.open("w", encoding="utf-8")
+        else:
+            self.f = io.TextIOWrapper(OPENERS[compress](path), encoding="utf-8")
+        self.array = array
+        self.count = 0
+        if array:
+            self.f.write("[\n")
+
+    def write(self, line: str) -> None:
+        if self.array:
+            self.f.write(line if self.count == 0 else ",\n" + line)
+        else:
+            self.f.write(line + "\n")
+        self.count += 1
+
+    def close(self) -> None:
+        if self.array:
+            self.f.write("\n]\n")
+        self.f.close()
+
+
+def generate(out_dir: Path, spec: DataSpec) -> dict:
+    """Writes pharmacies/, claims/ and reverts/ under `out_dir`; returns a summary."""
+    rnd = random.Random(spec.seed)
+    for d in ("pharmacies", "claims", "reverts"):
+        (out_dir / d).mkdir(parents=True, exist_ok=True)
+
+    npis = [str(1000000000 + i) for i in range(spec.npis)]
+    known = int(spec.npis * (1 - spec.unknown_npi_rate))
+    with (out_dir / "pharmacies" / "pharmacies.csv").open("w", encoding="utf-8") as f:
+        f.write("chain,npi\n")
+        for npi in npis[:known]:
+            f.write(f"{rnd.choice(CHAINS)},{npi}\n")
+    rnd.shuffle(npis)
+
+    ndcs = sorted({
+        f"{rnd.randrange(100000):05d}-{rnd.randrange(1000):03d}-{rnd.randrange(100):02d}"
+        for _ in range(spec.ndcs)
+    })
+
+    n = spec.claims
+    per_file = -(-n // spec.files)
+    seed = spec.seed
+    written = {"claims": 0, "reverts": 0, "duplicate_claims": 0, "duplicate_reverts": 0}
+
+    recent: List[str] = []  # ring of recent claim lines for duplicates
+    late: List[tuple] = []  # (release index, line)
+    revert_seq = 0
+    claims_out = reverts_out = None
+
+    def open_files(k: int) -> None:
+        nonlocal claims_out, reverts_out
+        array = spec.format == "array" or (spec.format == "mixed" and k % 2 == 1)
+        suffix = f"{k:05d}.json" + ("" if spec.compress == "none" else f".{spec.compress}")
+        claims_out = _JsonWriter(out_dir / "claims" / f"claims_{suffix}", array, spec.compress)
+        reverts_out = _JsonWriter(out_dir / "reverts" / f"reverts_{suffix}", array, spec.compress)
+
+    def revert_line(cid: str, ts: datetime) -> str:
+        nonlocal revert_seq
+        revert_seq += 1
+        rid = f"r{revert_seq:09x}-{seed & 0xffff:04x}-4000-9000-000000000000"
+        return f'{{"id": "{rid}", "claim_id": "{cid}", "timestamp": "{ts.isoformat()}"}}'
+
+    recent_reverts: List[str] = []
+    for i in range(n):
+        if i % per_file == 0:
+            if claims_out is not None:
+                claims_out.close()
+                reverts_out.close()
+            open_files(i // per_file)
+
+        ts = BASE_TIME + timedelta(seconds=i * 3)
+        line = (
+            f'{{"id": "{claim_id(seed, i)}", "npi": "{rnd.choice(npis)}", "ndc": "{rnd.choice(ndcs)}", '
+            f'"price": {round(rnd.uniform(0.5, 5000), 2)}, "quantity": {rnd.choice(QUANTITIES)}, '
+            f'"timestamp": "{ts.isoformat()}"}}'
+        )
+
+        if rnd.random() < spec.out_of_order_rate:
+            heapq.heappush(late, (i + rnd.randint(1, MAX_DELAY), line))
+        else:
+            claims_out.write(line)
+            written["claims"] += 1
+        while late and late[0][0] <= i:
+            claims_out.write(heapq.heappop(late)[1])
+            written["claims"] += 1
+
+        if len(recent) < MAX_DELAY:
+            recent.append(line)
+        else:
+            recent[rnd.randrange(MAX_DELAY)] = line
+        if rnd.random() < spec.dup_rate:
+            claims_out.write(rnd.choice(recent))
+            written["duplicate_claims"] += 1
+
+        if rnd.random() < spec.revert_rate:
+            target = i
+            if rnd.random() < spec.out_of_order_rate:
+                target = min(n - 1, i + rnd.randint(1, MAX_DELAY))  # claim comes later
+            rline = revert_line(claim_id(seed, target), ts + timedelta(seconds=1))
+            reverts_out.write(rline)
+            written["reverts"] += 1
+            recent_reverts.append(rline)
+            if len(recent_reverts) > MAX_DELAY:
+                recent_reverts.pop(rnd.randrange(MAX_DELAY))
+            if rnd.random() < spec.dup_rate:
+                reverts_out.write(rnd.choice(recent_reverts))
+                written["duplicate_reverts"] += 1
+
+    if claims_out is not None:
+        for _, line in sorted(late):
+            claims_out.write(line)
+            written["claims"] += 1
+        claims_out.close()
+        reverts_out.close()
+
+    return {"spec": asdict(spec), **written}
+
+
+def add_spec_arguments(parser: argparse.ArgumentParser) -> None:
+    defaults = DataSpec()
+    parser.add_argument("--claims", type=int, default=defaults.claims, help="Distinct claims")
+    parser.add_argument("--seed", type=int, default=defaults.seed)
+    parser.add_argument("--files", type=int, default=defaults.files, help="Claim (and revert) files")
+    parser.add_argument("--format", choices=["jsonl", "array", "mixed"], default=defaults.format)
+    parser.add_argument("--dup-rate", type=float, default=defaults.dup_rate)
+    parser.add_argument("--revert-rate", type=float, default=defaults.revert_rate)
+    parser.add_argument("--out-of-order-rate", type=float, default=defaults.out_of_order_rate)
+    parser.add_argument("--npis", type=int, default=defaults.npis, help="npi cardinality")
+    parser.add_argument("--ndcs", type=int, default=defaults.ndcs, help="ndc cardinality")
+    parser.add_argument("--unknown-npi-rate", type=float, default=defaults.unknown_npi_rate)
+    parser.add_argument("--compress", choices=["none", *OPENERS], default=defaults.compress)
+
+
+def spec_from_args(args: argparse.Namespace) -> DataSpec:
+    return DataSpec(
+        claims=args.claims,
+        seed=args.seed,
+        files=args.files,
+        format=args.format,
+        dup_rate=args.dup_rate,
+        revert_rate=args.revert_rate,
+        out_of_order_rate=args.out_of_order_rate,
+        npis=args.npis,
+        ndcs=args.ndcs,
+        unknown_npi_rate=args.unknown_npi_rate,
+        compress=args.compress,
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("out", help="Output directory")
+    add_spec_arguments(parser)
+    args = parser.parse_args()
+    print(json.dumps(generate(Path(args.out), spec_from_args(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+"""
+Parity check of the fast decode path (ClaimDecoder / iter_claim_records,
+iter_revert_items + EventProcessor.apply_*) against the reference parsers
+(_parse_claim / _parse_revert + EventProcessor.handle):
+
+1. record by record on hand-written edge cases, for both money engines
+2. the window, bloom and SQLite dedups against the exact one on
+   hand-written ids (including lone surrogates, which json.loads accepts),
+   and claim records with such ids through the SQLite claim store
+3. end to end on a dataset: counters and all output rows
+
+Exits non-zero on any difference.
+
+    PYTHONPATH=src python benchmarks/decode_parity.py \\
+        --pharmacies data_source/data/pharmacies \\
+        --claims data_source/data/claims \\
+        --reverts data_source/data/reverts
+"""
+import argparse
+import json
+import sys
+import tempfile
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from events_processor.core.dedup import ExactDedup, new_dedup
+from events_processor.core.models import ClaimRecord, normalize_decimal_key
+from events_processor.core.money import FIXED_MONEY, MONEY_ENGINES
+from events_processor.core.processor import EventProcessor
+from events_processor.core.sqlite_state import SqliteClaimStore, SqliteDatabase, SqliteDedup
+from events_processor.core.state import InMemoryState
+from events_processor.destination.builders import (
+    build_goal2_metrics,
+    build_goal3_top2_chains,
+    build_goal4_top_quantities,
+)
+from events_processor.sources.discover import discover_files
+from events_processor.sources.events_json import (
+    ClaimDecoder,
+    _decode_revert,
+    _parse_claim,
+    _parse_revert,
+    iter_claim_events,
+    iter_claim_records,
+    iter_revert_events,
+    iter_revert_items,
+)
+from events_processor.sources.pharmacies import load_pharmacies_csv
+
+BASE = {"id": "c1", "npi": "1000000001", "ndc": "00002-1433-80", "price": 12.5, "quantity": 30,
+        "timestamp": "2024-03-14T12:00:00"}
+
+EDGE_VALUES = {
+    "id": ["c1", " c1 ", "", "  ", "\ud800x", None, 123, 0, 1.5, True, [1], {"a": 1}],
+    "npi": ["1000000001", " 1000000001\t", "", None, 1000000001, False],
+    "ndc": ["00002-1433-80", "", None, 7, "x y"],
+    "price": [12.5, 0, -0.0, -1, "12.50", " 3.1 ", "1e3", "abc", "", " ", ".", "-", "+", None, True, 10**30, 1e-12,
+              0.1 + 0.2, "NaN", float("nan"), "Infinity", [], "12.3456789012"],
+    "quantity": [30, 30.0, "30", "30.000", 10.5, 0, -5, 0.0, "abc", None, True, "NaN", float("nan"),
+                 "Infinity", float("inf"), [30], "1E+2", 1e-7, "0.5"],
+    "timestamp": ["2024-03-14T12:00:00", "2024-03-14", "2024-03-14T12:00:00+02:00", "bad", "", None,
+                  1700000000, "2024-13-01T00:00:00"],
+}
+
+
+def claim_cases():
+    yield dict(BASE)
+    for field, values in EDGE_VALUES.items():
+        for v in values:
+            obj = dict(BASE)
+            obj[field] = v
+            yield obj
+        obj = dict(BASE)
+        del obj[field]
+        yield obj
+
+
+def revert_cases():
+    base = {"id": "r1", "claim_id": "c1", "timestamp": "2024-03-14T12:00:00"}
+    yield dict(base)
+    for field, values in (("id", EDGE_VALUES["id"]), ("claim_id", EDGE_VALUES["id"]),
+                          ("timestamp", EDGE_VALUES["timestamp"])):
+        for v in values:
+            obj = dict(base)
+            obj[field] = v
+            yield obj
+
+
+# a duplicate of each id follows later in the stream
+DEDUP_IDS = ["c1", "c2", " c1", "\ud800x", "x\udfff", "\udc80", "\u00e9", "e\u0301", "\U0001f600", ""]
+
+
+def _show(x) -> str:
+    # repr keeps Decimal exponents, so "30" and "30.0" differ
+    return repr(x)
+
+
+def check_records() -> int:
+    mismatches = 0
+    for name, money in MONEY_ENGINES.items():
+        decoder = ClaimDecoder(money)
+        for _ in range(2):  # second pass hits the quantity cache
+            for obj in claim_cases():
+                ev = _parse_claim(obj, money)
+                expected = None if ev is None else (
+                    ev.id, ev.npi, ev.ndc, _show(ev.price), normalize_decimal_key(ev.quantity),
+                    _show(ev.unit_price), ev.timestamp,
+                )
+                item = decoder.decode(obj)
+                actual = None if item is None else (
+                    item[0].claim_id, item[0].npi, item[0].ndc, _show(item[0].price), item[0].quantity_key,
+                    _show(item[0].unit_price), item[1],
+                )
+                if expected != actual:
+                    mismatches += 1
+                    print(f"claim [{name}] {obj!r}: {expected} != {actual}")
+
+    for obj in revert_cases():
+        ev = _parse_revert(obj)
+        expected = None if ev is None else (ev.id, ev.claim_id, ev.timestamp)
+        if expected != _decode_revert(obj):
+            mismatches += 1
+            print(f"revert {obj!r}: {expected} != {_decode_revert(obj)}")
+    return mismatches
+
+
+def dedup_cases():
+    ids = DEDUP_IDS + DEDUP_IDS[::-1] + DEDUP_IDS
+    start = datetime(2024, 3, 14)
+    return [(key, start + timedelta(minutes=i)) for i, key in enumerate(ids)]
+
+
+def check_dedup() -> int:
+    mismatches = 0
+    cases = dedup_cases()
+    exact = ExactDedup()
+    expected = [exact.add(key, ts) for key, ts in cases]
+    with tempfile.TemporaryDirectory() as tmp:
+        # a small batch so that most lookups go to the database
+        db = SqliteDatabase(Path(tmp) / "state.sqlite3", batch=3)
+        dedups = {
+            "window": new_dedup("window"),
+            "bloom": new_dedup("bloom", capacity=1000),
+            "sqlite": SqliteDedup(db, "ids"),
+        }
+        for kind, dedup in dedups.items():
+            actual = [dedup.add(key, ts) for key, ts in cases]
+            for (key, _), e, a in zip(cases, expected, actual):
+                if e != a:
+                    mismatches += 1
+                    print(f"dedup [{kind}] {key!r}: {e} != {a}")
+
+        store = SqliteClaimStore(db, FIXED_MONEY, cache_size=0)
+        records = [
+            ClaimRecord(key, f"npi{key}", f"{key}ndc", "chain", 1000, "30", 33)
+            for key in DEDUP_IDS if key
+        ]
+        for cr in records:
+            store.add(cr)
+        db.flush()
+        for cr in records:
+            if store.get(cr.claim_id) != cr:
+                mismatches += 1
+                print(f"sqlite claim store {cr!r}: {store.get(cr.claim_id)!r}")
+        if sorted(store) != sorted(cr.claim_id for cr in records):
+            mismatches += 1
+            print(f"sqlite claim store ids: {sorted(store)!r}")
+        db.close()
+    return mismatches
+
+
+def run(args, fast: bool, money_name: str):
+    money = MONEY_ENGINES[money_name]
+    state = InMemoryState.with_money(money)
+    state.pharmacy_chain_by_npi = load_pharmacies_csv(discover_files(args.pharmacies).csv_files)
+    processor = EventProcessor(state)
+    claim_files = discover_files(args.claims).json_files
+    revert_files = discover_files(args.reverts).json_files
+    if fast:
+        for cr, ts in iter_claim_records(claim_files, money):
+            processor.apply_claim(cr, ts)
+        for item in iter_revert_items(revert_files):
+            processor.apply_revert(*item)
+    else:
+        for ev in iter_claim_events(claim_files, money):
+            processor.handle(ev)
+        for ev in iter_revert_events(revert_files):
+            processor.handle(ev)
+    return {
+        "counters": repr(processor.counters),
+        "goal2": build_goal2_metrics(state),
+        "goal3": build_goal3_top2_chains(state),
+        "goal4": build_goal4_top_quantities(state),
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser("decode-parity")
+    parser.add_argument("--pharmacies", nargs="+")
+    parser.add_argument("--claims", nargs="+")
+    parser.add_argument("--reverts", nargs="+")
+    args = parser.parse_args()
+
+    mismatches = check_records()
+    print(f"record parity: {'OK' if not mismatches else f'{mismatches} mismatches'}")
+    dedup_mismatches = check_dedup()
+    print(f"dedup parity: {'OK' if not dedup_mismatches else f'{dedup_mismatches} mismatches'}")
+    mismatches += dedup_mismatches
+
+    if args.claims:
+        for money_name in MONEY_ENGINES:
+            expected = run(args, False, money_name)
+            actual = run(args, True, money_name)
+            same = json.dumps(expected, sort_keys=True) == json.dumps(actual, sort_keys=True)
+            print(f"dataset parity [{money_name}]: {'OK' if same else 'DIFFERENT'}")
+            mismatches += not same
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
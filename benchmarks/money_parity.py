@@ -0,0 +1,113 @@
+"""
+Parity check and timing of the numeric engines (--money decimal|fixed):
+price parsing on hand-written (also malformed) prices, then all output
+rows on a real dataset. Exits non-zero on any difference.
+
+    PYTHONPATH=src python benchmarks/money_parity.py \\
+        --pharmacies data_source/data/pharmacies \\
+        --claims data_source/data/claims \\
+        --reverts data_source/data/reverts
+"""
+import argparse
+import sys
+import time
+from decimal import ROUND_HALF_EVEN
+
+from events_processor.core.money import DECIMAL_MONEY, FIXED_MONEY, MONEY_ENGINES
+from events_processor.core.processor import EventProcessor
+from events_processor.core.state import InMemoryState
+from events_processor.destination.builders import (
+    build_goal2_metrics,
+    build_goal3_top2_chains,
+    build_goal4_top_quantities,
+)
+from events_processor.sources.discover import discover_files
+from events_processor.sources.events_json import iter_claim_events, iter_revert_events
+from events_processor.sources.pharmacies import load_pharmacies_csv
+
+OUTPUTS = {
+    "metrics_by_npi_ndc": build_goal2_metrics,
+    "top2_chain_per_ndc": build_goal3_top2_chains,
+    "most_common_qty_per_ndc": build_goal4_top_quantities,
+}
+
+PRICES = [12.5, 0, -1, 10**30, 1e-12, 0.1 + 0.2, 1e300, True, None, [], "12.50", " 3.1 ", "-.5", "+.5", "5.",
+          "-0", "1e3", "1_0", "12.3456789012", "0.0000000005", "0.0000000015", "NaN", "Infinity", "abc",
+          "", " ", ".", "-", "+", "-.", "+.", "--1", "+-1", "1.-5", "1. 5", "- 5", "1.2.3", "\u0661\u0662"]
+
+
+def check_parse() -> int:
+    mismatches = 0
+    for x in PRICES:
+        d = DECIMAL_MONEY.parse(x)
+        # the Decimal engine's price in nano-units; the processor drops non-finite prices
+        expected = None if d is None or not d.is_finite() else int(
+            d.scaleb(FIXED_MONEY.DIGITS).to_integral_value(rounding=ROUND_HALF_EVEN)
+        )
+        actual = FIXED_MONEY.parse(x)
+        if expected != actual:
+            mismatches += 1
+            print(f"parse {x!r}: {expected} != {actual}")
+    return mismatches
+
+
+def run(engine: str, args) -> dict:
+    money = MONEY_ENGINES[engine]
+    state = InMemoryState.with_money(money)
+    state.pharmacy_chain_by_npi = load_pharmacies_csv(discover_files(args.pharmacies).csv_files)
+    processor = EventProcessor(state)
+
+    # parse up front so parse and apply are timed separately
+    t0 = time.perf_counter()
+    claims = list(iter_claim_events(discover_files(args.claims).json_files, money))
+    reverts = list(iter_revert_events(discover_files(args.reverts).json_files))
+    t1 = time.perf_counter()
+    for ev in claims:
+        processor.handle(ev)
+    for ev in reverts:
+        processor.handle(ev)
+    t2 = time.perf_counter()
+    outputs = {name: build(state) for name, build in OUTPUTS.items()}
+    t3 = time.perf_counter()
+
+    print(
+        f"{engine:>8}: parse {t1 - t0:.3f}s  apply {t2 - t1:.3f}s  build {t3 - t2:.3f}s"
+        f"  ({len(claims)} claims, {len(reverts)} reverts)"
+    )
+    return outputs
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser("money-parity")
+    parser.add_argument("--pharmacies", nargs="+")
+    parser.add_argument("--claims", nargs="+")
+    parser.add_argument("--reverts", nargs="+")
+    args = parser.parse_args()
+
+    mismatches = check_parse()
+    print(f"parse parity: {'OK' if not mismatches else f'{mismatches} mismatches'}")
+    if not args.claims:
+        return 1 if mismatches else 0
+
+    expected = run("decimal", args)
+    actual = run("fixed", args)
+
+    rows_mismatches = 0
+    for name, rows in expected.items():
+        other = actual[name]
+        if len(rows) != len(other):
+            print(f"{name}: {len(rows)} rows vs {len(other)} rows")
+            rows_mismatches += 1
+            continue
+        for a, b in zip(rows, other):
+            if a != b:
+                rows_mismatches += 1
+                if rows_mismatches <= 10:
+                    print(f"{name}: {a} != {b}")
+
+    print("parity: OK" if not rows_mismatches else f"parity: {rows_mismatches} mismatching rows")
+    return 1 if mismatches or rows_mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,309 @@
+from array import array
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # optional dependency: without it batch mode uses EventProcessor
+    np = None
+
+from events_processor.core.goals.goal2 import MetricsAgg
+from events_processor.core.goals.goal4 import quantity_value
+from events_processor.core.money import FIXED_MONEY, average
+from events_processor.core.processor import Counters
+from events_processor.destination.builders import TOP_QUANTITIES, goal2_row, goal3_row, goal4_row
+from events_processor.metrics import Metrics
+from events_processor.sources.events_json import ClaimDecoder, JsonInput, iter_claim_records, iter_revert_items
+
+# ids are collected as Python bytes and packed into a numpy array every this many
+ID_CHUNK = 1 << 20
+
+_LOW_BITS = 0xFFFFFFFF
+
+
+def columnar_available() -> bool:
+    return np is not None
+
+
+class ColumnarTooLarge(Exception):
+    """A price does not fit the engine's int64 columns."""
+
+
+class ColumnarProcessor:
+    """
+    Batch-only engine for full backfills (--engine columnar, needs NumPy).
+
+    Claims and reverts are decoded with the same decoders as EventProcessor
+    (fixed-point prices) into columns: claim/revert ids as fixed-width bytes,
+    npi/ndc/quantity/chain as integer codes, prices as int64 nano-units,
+    unit prices as Python ints (they exceed int64 at the fixed engine's unit
+    price scale).
+    Events are then resolved as whole arrays instead of one at a time:
+
+    - dedup: the first occurrence of each id (np.unique), in file order;
+    - reverts: unique revert ids matched to stored claims by binary search
+      over the sorted claim ids; the first revert of a claim reverts it, the
+      others count as already_reverted, reverts of claims never stored stay
+      pending;
+    - goals: grouped counts and exact integer sums per (npi, ndc),
+      (ndc, chain) and (ndc, quantity), over the active claims.
+
+    Only the per-group results are turned into rows, with the builders'
+    row functions, so the output equals that of EventProcessor with
+    --money fixed (and with --money decimal, as long as no price has more
+    than 9 decimals). Covers exact dedup with unbounded pending reverts.
+    """
+
+    def __init__(self, pharmacies: Dict[str, str], top_quantities: int = TOP_QUANTITIES) -> None:
+        if np is None:
+            raise RuntimeError("the columnar engine needs numpy")
+        self.pharmacies = pharmacies
+        self.top_quantities = top_quantities
+        self.counters = Counters()
+        self.goal2: List[dict] = []
+        self.goal3: List[dict] = []
+        self.goal4: List[dict] = []
+        self._sizes: Dict[str, int] = {"pharmacies": len(pharmacies)}
+
+    def process_files(
+        self,
+        claim_files: List[JsonInput],
+        revert_files: List[JsonInput],
+        metrics: Optional[Metrics] = None,
+    ) -> None:
+        """
+        Decodes all files ("parse"), resolves dedup and reverts ("apply") and
+        computes the output rows ("build_goal2/3/4"). Raises ColumnarTooLarge
+        if a price exceeds the int64 columns (about 9.2 billion).
+        """
+        if metrics is None:
+            metrics = Metrics()
+        with metrics.timed("parse"):
+            claims = _ClaimColumns.decode(claim_files)
+            revert_ids, revert_claim_ids = _revert_columns(revert_files)
+        metrics.add_events("claim", claims.size)
+        metrics.add_events("revert", len(revert_ids))
+
+        with metrics.timed("apply"):
+            chain_codes = self._chain_codes(claims)
+            stored, reverted = self._resolve(claims, chain_codes[0], revert_ids, revert_claim_ids)
+            active = stored[~reverted]
+        with metrics.timed("build_goal2"):
+            self.goal2 = _goal2_rows(claims, stored, reverted)
+        with metrics.timed("build_goal3"):
+            self.goal3 = _goal3_rows(claims, active, chain_codes)
+        with metrics.timed("build_goal4"):
+            self.goal4 = _goal4_rows(claims, active, self.top_quantities)
+
+    def _chain_codes(self, claims: "_ClaimColumns") -> Tuple["np.ndarray", List[str]]:
+        """Chain code per npi code (-1: unknown pharmacy) and the chain names."""
+        chains: Dict[str, int] = {}
+        codes = []
+        for npi in claims.npis:
+            chain = self.pharmacies.get(npi)
+            codes.append(-1 if chain is None else chains.setdefault(chain, len(chains)))
+        return np.array(codes, dtype=np.int64), list(chains)
+
+    def _resolve(
+        self,
+        claims: "_ClaimColumns",
+        chain_of_npi: "np.ndarray",
+        revert_ids: "np.ndarray",
+        revert_claim_ids: "np.ndarray",
+    ) -> Tuple["np.ndarray", "np.ndarray"]:
+        """Rows of stored claims (first copies from known pharmacies) and, per stored row, whether it is reverted."""
+        counters = self.counters
+        # first occurrence of every claim id, by sorted id
+        claim_ids, first = np.unique(claims.ids, return_index=True)
+        counters.duplicate_claims = claims.size - len(claim_ids)
+        known = chain_of_npi[claims.npi[first]] >= 0
+        counters.unknown_pharmacy_claims = int(np.count_nonzero(~known))
+
+        unique_reverts, revert_first = np.unique(revert_ids, return_index=True)
+        counters.duplicate_reverts = len(revert_ids) - len(unique_reverts)
+        targets = revert_claim_ids[revert_first]
+        if len(claim_ids):
+            pos = np.minimum(np.searchsorted(claim_ids, targets), len(claim_ids) - 1)
+            hit = (claim_ids[pos] == targets) & known[pos]
+        else:
+            pos = np.zeros(len(targets), dtype=np.int64)
+            hit = np.zeros(len(targets), dtype=bool)
+        reverts_per_claim = np.bincount(pos[hit], minlength=len(claim_ids))
+        reverted_ids = reverts_per_claim > 0
+        counters.already_reverted = int(reverts_per_claim.sum() - np.count_nonzero(reverted_ids))
+
+        self._sizes.update(
+            claims=int(np.count_nonzero(known)),
+            seen_claim_ids=len(claim_ids),
+            seen_revert_ids=len(unique_reverts),
+            pending_reverts=len(np.unique(targets[~hit])),
+            unknown_claims=0,
+        )
+        # stored rows in file order
+        stored = first[known]
+        order = np.argsort(stored, kind="stable")
+        return stored[order], reverted_ids[known][order]
+
+    def state_sizes(self) -> Dict[str, int]:
+        return dict(self._sizes)
+
+
+class _ClaimColumns:
+    """Decoded claims, one array per field; npi/ndc/quantity as codes into the vocabularies."""
+
+    def __init__(self) -> None:
+        self.ids = np.zeros(0, dtype="S1")
+        self.npis: List[str] = []
+        self.ndcs: List[str] = []
+        self.quantities: List[str] = []
+        self.npi = self.ndc = self.quantity = self.price = np.zeros(0, dtype=np.int64)
+        self.unit_price = np.zeros(0, dtype=object)
+
+    @property
+    def size(self) -> int:
+        return len(self.ids)
+
+    @classmethod
+    def decode(cls, claim_files: List[JsonInput]) -> "_ClaimColumns":
+        ids: List[bytes] = []
+        chunks = []
+        npi_codes: Dict[str, int] = {}
+        ndc_codes: Dict[str, int] = {}
+        quantity_codes: Dict[str, int] = {}
+        npi, ndc, quantity = array("q"), array("q"), array("q")
+        price = array("q")
+        unit_price: List[int] = []
+
+        try:
+            for cr, _ in iter_claim_records(claim_files, decoder=ClaimDecoder(FIXED_MONEY)):
+                ids.append(cr.claim_id.encode("utf-8", "surrogatepass"))
+                if len(ids) == ID_CHUNK:
+                    chunks.append(np.array(ids, dtype=np.bytes_))
+                    ids = []
+                code = npi_codes.get(cr.npi)
+                if code is None:
+                    code = npi_codes[cr.npi] = len(npi_codes)
+                npi.append(code)
+                code = ndc_codes.get(cr.ndc)
+                if code is None:
+                    code = ndc_codes[cr.ndc] = len(ndc_codes)
+                ndc.append(code)
+                code = quantity_codes.get(cr.quantity_key)
+                if code is None:
+                    code = quantity_codes[cr.quantity_key] = len(quantity_codes)
+                quantity.append(code)
+                price.append(cr.price)
+                unit_price.append(cr.unit_price)
+        except OverflowError:
+            raise ColumnarTooLarge("a claim price does not fit in int64 nano-units") from None
+
+        if ids:
+            chunks.append(np.array(ids, dtype=np.bytes_))
+        columns = cls()
+        if chunks:
+            columns.ids = np.concatenate(chunks)
+        columns.npis, columns.ndcs, columns.quantities = list(npi_codes), list(ndc_codes), list(quantity_codes)
+        columns.npi = np.frombuffer(npi, dtype=np.int64)
+        columns.ndc = np.frombuffer(ndc, dtype=np.int64)
+        columns.quantity = np.frombuffer(quantity, dtype=np.int64)
+        columns.price = np.frombuffer(price, dtype=np.int64)
+        columns.unit_price = np.array(unit_price, dtype=object)
+        return columns
+
+
+def _revert_columns(revert_files: List[JsonInput]) -> Tuple["np.ndarray", "np.ndarray"]:
+    revert_ids: List[bytes] = []
+    claim_ids: List[bytes] = []
+    for revert_id, claim_id, _ in iter_revert_items(revert_files):
+        revert_ids.append(revert_id.encode("utf-8", "surrogatepass"))
+        claim_ids.append(claim_id.encode("utf-8", "surrogatepass"))
+    if not revert_ids:
+        return np.zeros(0, dtype="S1"), np.zeros(0, dtype="S1")
+    return np.array(revert_ids, dtype=np.bytes_), np.array(claim_ids, dtype=np.bytes_)
+
+
+def _groups(keys: "np.ndarray") -> Tuple["np.ndarray", "np.ndarray"]:
+    """Distinct keys (sorted) and the group index of every row."""
+    return np.unique(keys, return_inverse=True)
+
+
+def _group_sums(groups: "np.ndarray", values: "np.ndarray", size: int) -> List[int]:
+    """
+    Exact sum of non-negative int64 `values` (or Python int objects) per
+    group, as Python ints. High and low 32 bits of int64 values are summed
+    separately so no int64 sum can overflow.
+    """
+    sums = [0] * size
+    if not len(groups):
+        return sums
+    order = np.argsort(groups, kind="stable")
+    groups, values = groups[order], values[order]
+    starts = np.flatnonzero(np.concatenate(([True], groups[1:] != groups[:-1])))
+    if values.dtype == object:
+        for g, total in zip(groups[starts].tolist(), np.add.reduceat(values, starts).tolist()):
+            sums[g] = total
+        return sums
+    high = np.add.reduceat(values >> 32, starts)
+    low = np.add.reduceat(values & _LOW_BITS, starts)
+    for g, h, lo in zip(groups[starts].tolist(), high.tolist(), low.tolist()):
+        sums[g] = (h << 32) + lo
+    return sums
+
+
+def _goal2_rows(claims: _ClaimColumns, stored: "np.ndarray", reverted: "np.ndarray") -> List[dict]:
+    n_ndc = max(len(claims.ndcs), 1)
+    keys, group = _groups(claims.npi[stored] * n_ndc + claims.ndc[stored])
+    size = len(keys)
+    fills = np.bincount(group, minlength=size)
+    reverts = np.bincount(group[reverted], minlength=size)
+    active = ~reverted
+    active_group = group[active]
+    active_cnt = np.bincount(active_group, minlength=size)
+    unit_sums = _group_sums(active_group, claims.unit_price[stored][active], size)
+    total_sums = _group_sums(active_group, claims.price[stored][active], size)
+
+    rows = []
+    for g, key in enumerate(keys.tolist()):
+        agg = MetricsAgg(int(fills[g]), int(reverts[g]), int(active_cnt[g]), unit_sums[g], total_sums[g])
+        rows.append(goal2_row(claims.npis[key // n_ndc], claims.ndcs[key % n_ndc], agg, FIXED_MONEY))
+    rows.sort(key=lambda r: (r["npi"], r["ndc"]))
+    return rows
+
+
+def _goal3_rows(
+    claims: _ClaimColumns,
+    active: "np.ndarray",
+    chain_codes: Tuple["np.ndarray", List[str]],
+) -> List[dict]:
+    chain_of_npi, chains = chain_codes
+    n_chain = max(len(chains), 1)
+    keys, group = _groups(claims.ndc[active] * n_chain + chain_of_npi[claims.npi[active]])
+    counts = np.bincount(group, minlength=len(keys))
+    unit_sums = _group_sums(group, claims.unit_price[active], len(keys))
+
+    by_ndc: Dict[str, List[Tuple]] = {}
+    for g, key in enumerate(keys.tolist()):
+        avg = average(FIXED_MONEY.unit_to_decimal(unit_sums[g]), int(counts[g]))
+        by_ndc.setdefault(claims.ndcs[key // n_chain], []).append((avg, chains[key % n_chain]))
+
+    rows = []
+    for ndc in sorted(by_ndc):
+        top2 = sorted(by_ndc[ndc])[:2]
+        rows.append(goal3_row(ndc, [(chain, avg) for avg, chain in top2]))
+    return rows
+
+
+def _goal4_rows(claims: _ClaimColumns, active: "np.ndarray", k: int) -> List[dict]:
+    n_quantity = max(len(claims.quantities), 1)
+    keys, group = _groups(claims.ndc[active] * n_quantity + claims.quantity[active])
+    counts = np.bincount(group, minlength=len(keys))
+
+    members = [(quantity_value(q), q) for q in claims.quantities]
+    by_ndc: Dict[str, List[Tuple]] = {}
+    for g, key in enumerate(keys.tolist()):
+        by_ndc.setdefault(claims.ndcs[key // n_quantity], []).append((-int(counts[g]), members[key % n_quantity]))
+
+    rows = []
+    for ndc in sorted(by_ndc):
+        top = [member for _, member in sorted(by_ndc[ndc])[:k]]
+        rows.append(goal4_row(ndc, top))
+    return rows
@@ -0,0 +1,143 @@
+from array import array
+from decimal import Decimal
+from typing import Dict, Iterator, List, Optional, Union
+
+from .models import ClaimRecord
+from .money import DECIMAL_MONEY, FixedPointMoney, MoneyEngine
+
+
+class DictClaimStore(dict):
+    """
+    Default claim store: claim_id -> ClaimRecord.
+    Fast, but every claim keeps its own record object and field strings.
+    """
+
+    def add(self, cr: ClaimRecord) -> None:
+        self[cr.claim_id] = cr
+
+    def mark_reverted(self, claim_id: str) -> None:
+        self[claim_id].is_reverted = True
+
+
+class CompactClaimStore:
+    """
+    Columnar claim store for very large claim histories.
+
+    npi/ndc/chain/quantity strings are interned into small integer ids and
+    per-claim fields live in array-backed columns, addressed through a
+    claim_id -> row index. Records are materialized on lookup, so callers
+    must persist changes through `mark_reverted` rather than mutating them.
+
+    With the fixed-point money engine prices are stored in an int64 column
+    and unit prices are not stored but derived from price and quantity on
+    lookup; with Decimals both stay Python objects (the dominant remaining
+    cost).
+    """
+
+    def __init__(self, money: MoneyEngine = DECIMAL_MONEY) -> None:
+        self._money = money
+        self._row: Dict[str, int] = {}
+
+        # interned strings shared by all string columns
+        self._strings: List[str] = []
+        self._string_ids: Dict[str, int] = {}
+
+        self._npi = array("I")
+        self._ndc = array("I")
+        self._chain = array("I")
+        self._quantity = array("I")
+
+        fixed = isinstance(money, FixedPointMoney)
+        self._price: Union[array, list] = array("q") if fixed else []
+        self._unit_price: Optional[list] = None if fixed else []
+        # quantity string id -> Decimal, for unit prices derived on lookup
+        self._quantities: Dict[int, Decimal] = {}
+        self._reverted = bytearray()
+
+    def _intern(self, s: str) -> int:
+        i = self._string_ids.get(s)
+        if i is None:
+            i = len(self._strings)
+            self._strings.append(s)
+            self._string_ids[s] = i
+        return i
+
+    def add(self, cr: ClaimRecord) -> None:
+        if cr.claim_id in self._row:
+            self.pop(cr.claim_id)
+
+        self._row[cr.claim_id] = len(self._reverted)
+        self._npi.append(self._intern(cr.npi))
+        self._ndc.append(self._intern(cr.ndc))
+        self._chain.append(self._intern(cr.chain))
+        self._quantity.append(self._intern(cr.quantity_key))
+        self._price = _append(self._price, cr.price)
+        if self._unit_price is not None:
+            self._unit_price.append(cr.unit_price)
+        self._reverted.append(1 if cr.is_reverted else 0)
+
+    def get(self, claim_id: str) -> Optional[ClaimRecord]:
+        row = self._row.get(claim_id)
+        if row is None:
+            return None
+        s = self._strings
+        price = self._price[row]
+        quantity = self._quantity[row]
+        if self._unit_price is not None:
+            unit_price = self._unit_price[row]
+        else:
+            q = self._quantities.get(quantity)
+            if q is None:
+                q = self._quantities[quantity] = Decimal(s[quantity])
+            unit_price = self._money.unit_price(price, q)
+        return ClaimRecord(
+            claim_id=claim_id,
+            npi=s[self._npi[row]],
+            ndc=s[self._ndc[row]],
+            chain=s[self._chain[row]],
+            price=price,
+            quantity_key=s[quantity],
+            unit_price=unit_price,
+            is_reverted=bool(self._reverted[row]),
+        )
+
+    def mark_reverted(self, claim_id: str) -> None:
+        self._reverted[self._row[claim_id]] = 1
+
+    def pop(self, claim_id: str, default: Optional[ClaimRecord] = None) -> Optional[ClaimRecord]:
+        # the row itself stays behind as garbage; removals are rare (merge of partials)
+        cr = self.get(claim_id)
+        if cr is None:
+            return default
+        del self._row[claim_id]
+        return cr
+
+    def update(self, other) -> None:
+        for claim_id in other:
+            self.add(other.get(claim_id))
+
+    def values(self) -> Iterator[ClaimRecord]:
+        for claim_id in self._row:
+            yield self.get(claim_id)
+
+    def __contains__(self, claim_id: object) -> bool:
+        return claim_id in self._row
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._row)
+
+    def __len__(self) -> int:
+        return len(self._row)
+
+
+def _append(column: Union[array, list], value) -> Union[array, list]:
+    try:
+        column.append(value)
+    except OverflowError:
+        # a price beyond int64 nano-units: fall back to a plain list column
+        column = list(column)
+        column.append(value)
+    return column
+
+
+ClaimStore = Union[DictClaimStore, CompactClaimStore]
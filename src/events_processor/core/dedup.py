@@ -0,0 +1,230 @@
+import heapq
+import math
+from datetime import datetime
+from hashlib import blake2b
+from typing import Dict, List, Optional, Union
+
+# defaults for the --dedup options
+DEFAULT_WINDOW_SECONDS = 7 * 24 * 3600
+DEFAULT_CAPACITY = 10_000_000
+DEFAULT_FP_RATE = 0.001
+
+# eviction granularity of the time window
+WINDOW_BUCKETS = 64
+
+
+class ExactDedup:
+    """Every id ever seen, in a set (memory grows with the stream)."""
+    __slots__ = ("_ids", "evictions")
+
+    name = "exact"
+
+    def __init__(self) -> None:
+        self._ids: set = set()
+        self.evictions = 0
+
+    def add(self, key: str, ts: Optional[datetime] = None) -> bool:
+        """Records `key`; False if it was already seen."""
+        ids = self._ids
+        if key in ids:
+            return False
+        ids.add(key)
+        return True
+
+    def partial(self) -> "ExactDedup":
+        """Empty dedup for a worker's chunk, mergeable into this one."""
+        return ExactDedup()
+
+    def merge(self, other: "ExactDedup") -> List[str]:
+        """Absorbs a worker's chunk; returns its ids that were already seen here."""
+        dups = list(other._ids & self._ids)
+        self._ids |= other._ids
+        return dups
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._ids
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+
+class WindowedDedup:
+    """
+    Ids seen within `window` seconds of event time before the newest event
+    (the watermark). Older ids are evicted, so a duplicate arriving more than
+    `window` seconds (event time) after the original is not detected.
+    window=None keeps everything (used for workers' chunks).
+    """
+    __slots__ = ("window", "_width", "_ids", "_buckets", "_heap", "_max_ts", "_evict_below", "evictions")
+
+    name = "window"
+
+    def __init__(self, window: Optional[float] = DEFAULT_WINDOW_SECONDS) -> None:
+        self.window = window
+        self._width = window / WINDOW_BUCKETS if window else 1.0
+        # id -> event time (epoch seconds)
+        self._ids: Dict[str, float] = {}
+        # bucket index -> ids; ids are evicted a whole bucket at a time
+        self._buckets: Dict[int, List[str]] = {}
+        self._heap: List[int] = []
+        self._max_ts = -math.inf
+        self._evict_below = -math.inf
+        self.evictions = 0
+
+    @property
+    def watermark(self) -> float:
+        if self.window is None:
+            return -math.inf
+        return self._max_ts - self.window
+
+    def add(self, key: str, ts: Optional[datetime] = None) -> bool:
+        """Records `key` seen at event time `ts`; False if it is a duplicate within the window."""
+        if key in self._ids:
+            return False
+        self._add(key, ts.timestamp() if ts is not None else max(self._max_ts, 0.0))
+        return True
+
+    def _add(self, key: str, t: float) -> None:
+        self._ids[key] = t
+        b = int(t // self._width)
+        bucket = self._buckets.get(b)
+        if bucket is None:
+            bucket = self._buckets[b] = []
+            heapq.heappush(self._heap, b)
+        bucket.append(key)
+
+        if t > self._max_ts:
+            self._max_ts = t
+            if self.window is not None:
+                below = int((t - self.window) // self._width)
+                if below > self._evict_below:
+                    self._evict_below = below
+                    self._evict()
+        # a late id behind the watermark stays until the next eviction
+
+    def _evict(self) -> None:
+        heap = self._heap
+        ids = self._ids
+        while heap and heap[0] < self._evict_below:
+            for key in self._buckets.pop(heapq.heappop(heap)):
+                del ids[key]
+                self.evictions += 1
+
+    def partial(self) -> "WindowedDedup":
+        return WindowedDedup(None)
+
+    def merge(self, other: "WindowedDedup") -> List[str]:
+        dups = []
+        for key, t in other._ids.items():
+            if key in self._ids:
+                dups.append(key)
+            else:
+                self._add(key, t)
+        return dups
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._ids
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+
+class BloomDedup:
+    """
+    Probabilistic dedup in fixed memory: two generations of Bloom filters of
+    `capacity` ids each. When the current one is full the older one is dropped,
+    so between `capacity` and 2 * `capacity` of the latest ids are remembered.
+    A new id is wrongly reported as a duplicate (and its event dropped) with
+    probability at most about `fp_rate`.
+    """
+    __slots__ = ("capacity", "fp_rate", "_bits", "_hashes", "_current", "_previous", "_count", "_previous_count", "evictions")
+
+    name = "bloom"
+
+    def __init__(self, capacity: int = DEFAULT_CAPACITY, fp_rate: float = DEFAULT_FP_RATE) -> None:
+        if capacity <= 0 or not 0 < fp_rate < 1:
+            raise ValueError("capacity must be positive and fp_rate in (0, 1)")
+        self.capacity = capacity
+        self.fp_rate = fp_rate
+        # an id is checked against both generations: p per filter gives ~2p overall
+        p = fp_rate / 2
+        self._bits = max(8, math.ceil(-capacity * math.log(p) / math.log(2) ** 2))
+        self._hashes = max(1, round(self._bits / capacity * math.log(2)))
+        self._current = bytearray((self._bits + 7) // 8)
+        self._previous: Optional[bytearray] = None
+        self._count = 0
+        self._previous_count = 0
+        self.evictions = 0
+
+    def _positions(self, key: str) -> List[int]:
+        # double hashing over one deterministic 128-bit digest (stable across
+        # processes, unlike hash()); surrogatepass since json.loads lets lone
+        # surrogates through in ids
+        digest = blake2b(key.encode("utf-8", "surrogatepass"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        m = self._bits
+        return [(h1 + i * h2) % m for i in range(self._hashes)]
+
+    @staticmethod
+    def _has(bits: bytearray, positions: List[int]) -> bool:
+        for p in positions:
+            if not bits[p >> 3] & (1 << (p & 7)):
+                return False
+        return True
+
+    def add(self, key: str, ts: Optional[datetime] = None) -> bool:
+        positions = self._positions(key)
+        if self._has(self._current, positions):
+            return False
+        if self._previous is not None and self._has(self._previous, positions):
+            return False
+
+        bits = self._current
+        for p in positions:
+            bits[p >> 3] |= 1 << (p & 7)
+        self._count += 1
+        if self._count >= self.capacity:
+            self.evictions += self._previous_count
+            self._previous = self._current
+            self._previous_count = self._count
+            self._current = bytearray(len(bits))
+            self._count = 0
+        return True
+
+    def partial(self) -> WindowedDedup:
+        # a worker's chunk is small; keep its ids exactly and in order
+        return WindowedDedup(None)
+
+    def merge(self, other: WindowedDedup) -> List[str]:
+        return [key for key in other._ids if not self.add(key)]
+
+    def __contains__(self, key: str) -> bool:
+        positions = self._positions(key)
+        return self._has(self._current, positions) or (
+            self._previous is not None and self._has(self._previous, positions)
+        )
+
+    def __len__(self) -> int:
+        # ids remembered (approximately: false positives are never added)
+        return self._count + self._previous_count
+
+
+IdDedup = Union[ExactDedup, WindowedDedup, BloomDedup]
+
+DEDUP_KINDS = ("exact", "window", "bloom")
+
+
+def new_dedup(
+    kind: str = "exact",
+    window: float = DEFAULT_WINDOW_SECONDS,
+    capacity: int = DEFAULT_CAPACITY,
+    fp_rate: float = DEFAULT_FP_RATE,
+) -> IdDedup:
+    if kind == "exact":
+        return ExactDedup()
+    if kind == "window":
+        return WindowedDedup(window)
+    if kind == "bloom":
+        return BloomDedup(capacity, fp_rate)
+    raise ValueError(f"unknown dedup kind: {kind}")
@@ -2,15 +2,17 @@ from dataclasses import dataclass
 from datetime import datetime
 from decimal import Decimal
 
+from .money import Money
+
 
 @dataclass(frozen=True, slots=True)
 class ClaimEvent:
     id: str
     npi: str
     ndc: str
-    price: Decimal
+    price: Money
     quantity: Decimal
-    unit_price: Decimal
+    unit_price: Money
     timestamp: datetime
 
 
@@ -1,8 +1,9 @@
 from dataclasses import dataclass
 from decimal import Decimal
-from typing import Dict, Tuple
+from typing import Dict, Set, Tuple
 
 from ..models import ClaimRecord
+from ..money import DECIMAL_MONEY, Money, MoneyEngine
 
 
 @dataclass(slots=True)
@@ -10,38 +11,93 @@ class MetricsAgg:
     fills: int = 0
     reverted: int = 0
     active_cnt: int = 0
-    active_unit_price_sum: Decimal = Decimal("0")
-    active_total_price_sum: Decimal = Decimal("0")
+    active_unit_price_sum: Money = Decimal("0")
+    active_total_price_sum: Money = Decimal("0")
 
 
 class Goal2Metrics:
-    def __init__(self) -> None:
+    def __init__(self, money: MoneyEngine = DECIMAL_MONEY) -> None:
+        self.money = money
+        self._add = money.add
+        self._sub = money.subtract
         self._by_npi_ndc: Dict[Tuple[str, str], MetricsAgg] = {}
+        # keys changed since the last take_dirty() (incremental outputs)
+        self._dirty: Set[Tuple[str, str]] = set()
+
+    def _new_agg(self) -> MetricsAgg:
+        return MetricsAgg(
+            active_unit_price_sum=self.money.zero,
+            active_total_price_sum=self.money.zero,
+        )
 
     def on_claim(self, cr: ClaimRecord) -> None:
         key = (cr.npi, cr.ndc)
         agg = self._by_npi_ndc.get(key)
         if agg is None:
-            agg = MetricsAgg()
+            agg = self._new_agg()
             self._by_npi_ndc[key] = agg
+        self._dirty.add(key)
 
         agg.fills += 1
         agg.active_cnt += 1
-        agg.active_unit_price_sum += cr.unit_price
-        agg.active_total_price_sum += cr.price
+        agg.active_unit_price_sum = self._add(agg.active_unit_price_sum, cr.unit_price)
+        agg.active_total_price_sum = self._add(agg.active_total_price_sum, cr.price)
 
     def on_revert(self, cr: ClaimRecord) -> None:
         key = (cr.npi, cr.ndc)
         agg = self._by_npi_ndc.get(key)
         if agg is None:
-            agg = MetricsAgg()
+            agg = self._new_agg()
             self._by_npi_ndc[key] = agg
+        self._dirty.add(key)
 
         agg.reverted += 1
         # subtract active contributions
         agg.active_cnt -= 1
-        agg.active_unit_price_sum -= cr.unit_price
-        agg.active_total_price_sum -= cr.price
+        agg.active_unit_price_sum = self._sub(agg.active_unit_price_sum, cr.unit_price)
+        agg.active_total_price_sum = self._sub(agg.active_total_price_sum, cr.price)
+
+    def discard(self, cr: ClaimRecord) -> None:
+        """Removes a claim as if it had never been applied (not counted as a revert)."""
+        key = (cr.npi, cr.ndc)
+        agg = self._by_npi_ndc.get(key)
+        if agg is None:
+            return
+        self._dirty.add(key)
+
+        agg.fills -= 1
+        agg.active_cnt -= 1
+        agg.active_unit_price_sum = self._sub(agg.active_unit_price_sum, cr.unit_price)
+        agg.active_total_price_sum = self._sub(agg.active_total_price_sum, cr.price)
+        if agg.fills <= 0 and agg.reverted <= 0:
+            del self._by_npi_ndc[key]
+
+    def merge(self, other: "Goal2Metrics") -> None:
+        """Adds aggregates of a partial built from another slice of the stream."""
+        self.apply_delta(other._by_npi_ndc)
+
+    def apply_delta(self, deltas: Dict[Tuple[str, str], MetricsAgg]) -> None:
+        """
+        Adds per-(npi, ndc) changes; fields may be negative as long as every
+        total stays a valid aggregate. Delta objects may be taken over.
+        """
+        self._dirty.update(deltas)
+        for key, src in deltas.items():
+            agg = self._by_npi_ndc.get(key)
+            if agg is None:
+                self._by_npi_ndc[key] = src
+                continue
+
+            agg.fills += src.fills
+            agg.reverted += src.reverted
+            agg.active_cnt += src.active_cnt
+            agg.active_unit_price_sum = self._add(agg.active_unit_price_sum, src.active_unit_price_sum)
+            agg.active_total_price_sum = self._add(agg.active_total_price_sum, src.active_total_price_sum)
+
+    def take_dirty(self) -> Set[Tuple[str, str]]:
+        """Returns keys changed (or removed) since the previous call and resets tracking."""
+        dirty, self._dirty = self._dirty, set()
+        return dirty
 
     def snapshot(self) -> Dict[Tuple[str, str], MetricsAgg]:
         return self._by_npi_ndc
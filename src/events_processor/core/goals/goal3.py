@@ -1,57 +1,120 @@
-from collections import defaultdict
-from decimal import Decimal, ROUND_HALF_UP
-from typing import Dict, List, Tuple
+from decimal import Decimal
+from typing import Any, Dict, List, Set, Tuple
 
-Q2 = Decimal("0.01")
+from ..models import ClaimRecord
+from ..money import DECIMAL_MONEY, Money, MoneyEngine, average
 
-def _d2(x: Decimal) -> float:
-    return float(x.quantize(Q2, rounding=ROUND_HALF_UP))
 
+class ChainAgg:
+    __slots__ = ("cnt", "unit_price_sum")
 
-def build_goal3_from_goal2(
-    goal2_snapshot: Dict[Tuple[str, str], any],
-    pharmacy_chain_by_npi: Dict[str, str],
-) -> List[dict]:
+    def __init__(self, zero) -> None:
+        self.cnt = 0
+        self.unit_price_sum = zero
+
+
+class Goal3Chains:
     """
-    Build Goal 3 (top 2 cheapest chains per drug)
-    from Goal 2 aggregates.
+    Goal 3 aggregate: active claim count and unit price sum per (ndc, chain).
+    The per-ndc list of (avg_unit_price, chain) in ascending order is built
+    when the cheapest chains of the ndc are read, and kept until the ndc
+    changes again: an event only updates one sum, and each read sorts only
+    the ndcs changed since the previous one (O(chains log chains) each).
     """
 
-    # (ndc, chain) -> [cnt, sum_unit_price]
-    by_ndc_chain = defaultdict(lambda: [0, Decimal("0")])
-
-    for (npi, ndc), agg in goal2_snapshot.items():
-        if agg.active_cnt <= 0:
-            continue
-
-        chain = pharmacy_chain_by_npi.get(npi)
-        if not chain:
-            continue
-
-        bucket = by_ndc_chain[(ndc, chain)]
-        bucket[0] += agg.active_cnt
-        bucket[1] += agg.active_unit_price_sum
-
-    # ndc -> list of (chain, avg)
-    by_ndc = defaultdict(list)
-    for (ndc, chain), (cnt, s) in by_ndc_chain.items():
-        avg = s / Decimal(cnt)
-        by_ndc[ndc].append((chain, avg))
-
-    result = []
-    for ndc, items in by_ndc.items():
-        items.sort(key=lambda x: (x[1], x[0]))  # cheapest first
-        top2 = items[:2]
-
-        result.append(
-            {
-                "ndc": ndc,
-                "chain": [
-                    {"name": chain, "avg_price": _d2(avg)}
-                    for chain, avg in top2
-                ],
-            }
-        )
-
-    result.sort(key=lambda r: r["ndc"])
-    return result
\ No newline at end of file
+    def __init__(self, money: MoneyEngine = DECIMAL_MONEY) -> None:
+        self.money = money
+        self._chains: Dict[str, Dict[str, ChainAgg]] = {}
+        # sorted (avg, chain) lists of ndcs read and unchanged since
+        self._order: Dict[str, List[Tuple[Decimal, str]]] = {}
+        # ndcs changed since the last take_dirty() (incremental outputs)
+        self._dirty: Set[str] = set()
+
+    def on_claim(self, cr: ClaimRecord) -> None:
+        self._apply(cr.ndc, cr.chain, 1, cr.unit_price)
+
+    def on_revert(self, cr: ClaimRecord) -> None:
+        self._apply(cr.ndc, cr.chain, -1, cr.unit_price, subtract=True)
+
+    def _apply(self, ndc: str, chain: str, cnt: int, unit_price_sum, subtract: bool = False) -> None:
+        money = self.money
+        by_chain = self._chains.get(ndc)
+        if by_chain is None:
+            by_chain = self._chains[ndc] = {}
+        agg = by_chain.get(chain)
+        if agg is None:
+            agg = by_chain[chain] = ChainAgg(money.zero)
+
+        agg.cnt += cnt
+        if subtract:
+            agg.unit_price_sum = money.subtract(agg.unit_price_sum, unit_price_sum)
+        else:
+            agg.unit_price_sum = money.add(agg.unit_price_sum, unit_price_sum)
+
+        if agg.cnt <= 0:
+            del by_chain[chain]
+            if not by_chain:
+                del self._chains[ndc]
+        self._order.pop(ndc, None)
+        self._dirty.add(ndc)
+
+    def merge(self, other: "Goal3Chains") -> None:
+        """Adds aggregates of a partial built from another slice of the stream."""
+        for ndc, by_chain in other._chains.items():
+            for chain, agg in by_chain.items():
+                self._apply(ndc, chain, agg.cnt, agg.unit_price_sum)
+
+    def apply_delta(self, deltas: Dict[str, Dict[str, Tuple[int, Money]]]) -> None:
+        """
+        Adds per-(ndc, chain) changes of (count, unit price sum); counts may be
+        negative as long as every total stays a valid aggregate.
+        """
+        for ndc, by_chain in deltas.items():
+            for chain, (cnt, unit_price_sum) in by_chain.items():
+                if cnt or unit_price_sum:
+                    self._apply(ndc, chain, cnt, unit_price_sum)
+
+    def move(self, ndc: str, old_chain: str, new_chain: str, cnt: int, unit_price_sum: Money) -> None:
+        """Moves `cnt` active claims with the given unit price sum of an ndc to another chain."""
+        if old_chain != new_chain and cnt:
+            self._apply(ndc, old_chain, -cnt, unit_price_sum, subtract=True)
+            self._apply(ndc, new_chain, cnt, unit_price_sum)
+
+    def rebuild(
+        self, goal2_snapshot: Dict[Tuple[str, str], Any], chain_by_npi: Dict[str, str], retired: Dict[str, str]
+    ) -> None:
+        """
+        Replaces the aggregates by the Goal 2 aggregates (npi, ndc) grouped by
+        the chain of each npi (`chain_by_npi`, else its last chain in `retired`).
+        """
+        self._dirty.update(self._chains)
+        self._chains = {}
+        self._order = {}
+        for (npi, ndc), agg in goal2_snapshot.items():
+            chain = chain_by_npi.get(npi) or retired.get(npi)
+            if agg.active_cnt > 0 and chain:
+                self._apply(ndc, chain, agg.active_cnt, agg.active_unit_price_sum)
+
+    def top(self, ndc: str, k: int = 2) -> List[Tuple[str, Decimal]]:
+        """Cheapest `k` chains of an ndc as (chain, avg_unit_price): avg asc, chain name asc."""
+        order = self._order.get(ndc)
+        if order is None:
+            by_chain = self._chains.get(ndc)
+            if not by_chain:
+                return []
+            to_decimal = self.money.unit_to_decimal
+            order = self._order[ndc] = sorted(
+                (average(to_decimal(agg.unit_price_sum), agg.cnt), chain) for chain, agg in by_chain.items()
+            )
+        return [(chain, avg) for avg, chain in order[:k]]
+
+    def ndcs(self):
+        return self._chains.keys()
+
+    def take_dirty(self) -> Set[str]:
+        """Returns ndcs changed (or removed) since the previous call and resets tracking."""
+        dirty, self._dirty = self._dirty, set()
+        return dirty
+
+    def snapshot(self) -> Dict[str, Dict[str, ChainAgg]]:
+        return self._chains
@@ -1,25 +1,162 @@
+from bisect import bisect_left, insort
 from collections import defaultdict
-from typing import Dict, DefaultDict
+from decimal import Decimal
+from typing import Callable, Dict, DefaultDict, List, Set, Tuple
 
 from ..models import ClaimRecord
 
 
+def _new_quantity_counts() -> DefaultDict[str, int]:
+    # module-level factory (not a lambda) so the aggregate stays picklable
+    return defaultdict(int)
+
+
+def quantity_value(quantity_key: str) -> Decimal:
+    try:
+        return Decimal(quantity_key)
+    except Exception:
+        return Decimal("0")
+
+
+class _NdcQuantities:
+    """
+    Count-bucketed ordering of one ndc's quantities: count -> members sorted by
+    numeric quantity, plus the sorted list of non-empty counts.
+    """
+    __slots__ = ("buckets", "levels")
+
+    def __init__(self) -> None:
+        self.buckets: Dict[int, List[Tuple[Decimal, str]]] = {}
+        self.levels: List[int] = []
+
+    @classmethod
+    def from_counts(
+        cls, counts: Dict[str, int], member: Callable[[str], Tuple[Decimal, str]]
+    ) -> "_NdcQuantities":
+        order = cls()
+        buckets = order.buckets
+        for quantity_key, count in counts.items():
+            bucket = buckets.get(count)
+            if bucket is None:
+                buckets[count] = [member(quantity_key)]
+            else:
+                bucket.append(member(quantity_key))
+        for bucket in buckets.values():
+            bucket.sort()
+        order.levels = sorted(buckets)
+        return order
+
+    def insert(self, count: int, member: Tuple[Decimal, str]) -> None:
+        bucket = self.buckets.get(count)
+        if bucket is None:
+            self.buckets[count] = [member]
+            insort(self.levels, count)
+        else:
+            insort(bucket, member)
+
+    def remove(self, count: int, member: Tuple[Decimal, str]) -> None:
+        bucket = self.buckets[count]
+        del bucket[bisect_left(bucket, member)]
+        if not bucket:
+            del self.buckets[count]
+            del self.levels[bisect_left(self.levels, count)]
+
+    def top(self, k: int) -> List[Tuple[Decimal, str]]:
+        out: List[Tuple[Decimal, str]] = []
+        for count in reversed(self.levels):
+            out.extend(self.buckets[count][: k - len(out)])
+            if len(out) >= k:
+                break
+        return out
+
+
 class Goal4Quantity:
+    """
+    Goal 4 aggregate: active claim count per (ndc, quantity).
+
+    Besides the counts, an ndc whose top quantities were read keeps its
+    quantities in frequency buckets (members ordered by quantity), so they are
+    read again directly; a claim or revert then moves one quantity between
+    adjacent buckets. The buckets of an ndc are built on its first top()
+    call: a batch run only counts, and sorts each ndc once for the output.
+    """
+
     def __init__(self) -> None:
-        self._counts: DefaultDict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        self._counts: DefaultDict[str, Dict[str, int]] = defaultdict(_new_quantity_counts)
+        # ndc -> buckets, for ndcs read by top() (kept up to date from then on)
+        self._order: Dict[str, _NdcQuantities] = {}
+        # quantity_key -> (numeric value, key); few distinct quantities in practice
+        self._members: Dict[str, Tuple[Decimal, str]] = {}
+        # ndcs changed since the last take_dirty() (incremental outputs)
+        self._dirty: Set[str] = set()
 
     def on_claim(self, cr: ClaimRecord) -> None:
-        self._counts[cr.ndc][cr.quantity_key] += 1
+        self._add(cr.ndc, cr.quantity_key, 1)
 
     def on_revert(self, cr: ClaimRecord) -> None:
         m = self._counts.get(cr.ndc)
-        if not m:
+        if not m or cr.quantity_key not in m:
             return
-        m[cr.quantity_key] -= 1
-        if m[cr.quantity_key] <= 0:
-            del m[cr.quantity_key]
-        if not m:
-            del self._counts[cr.ndc]
+        self._add(cr.ndc, cr.quantity_key, -1)
+
+    def _member(self, quantity_key: str) -> Tuple[Decimal, str]:
+        member = self._members.get(quantity_key)
+        if member is None:
+            member = self._members[quantity_key] = (quantity_value(quantity_key), quantity_key)
+        return member
+
+    def _add(self, ndc: str, quantity_key: str, delta: int) -> None:
+        m = self._counts[ndc]
+        old = m.get(quantity_key, 0)
+        new = old + delta
+        if new > 0:
+            m[quantity_key] = new
+        else:
+            m.pop(quantity_key, None)
+            if not m:
+                del self._counts[ndc]
+        order = self._order.get(ndc)
+        if order is not None:
+            if not m:
+                del self._order[ndc]
+            else:
+                member = self._member(quantity_key)
+                if old > 0:
+                    order.remove(old, member)
+                if new > 0:
+                    order.insert(new, member)
+        self._dirty.add(ndc)
+
+    def merge(self, other: "Goal4Quantity") -> None:
+        """Adds counts of a partial aggregate built from another slice of the stream."""
+        for ndc, qmap in other._counts.items():
+            for q, c in qmap.items():
+                self._add(ndc, q, c)
+
+    def apply_delta(self, deltas: Dict[str, Dict[str, int]]) -> None:
+        """Adds per-(ndc, quantity) count changes (may be negative)."""
+        for ndc, qmap in deltas.items():
+            for q, delta in qmap.items():
+                if delta:
+                    self._add(ndc, q, delta)
+
+    def top(self, ndc: str, k: int) -> List[Tuple[Decimal, str]]:
+        """`k` most common quantities of an ndc as (value, key): count desc, quantity asc."""
+        order = self._order.get(ndc)
+        if order is None:
+            counts = self._counts.get(ndc)
+            if not counts:
+                return []
+            order = self._order[ndc] = _NdcQuantities.from_counts(counts, self._member)
+        return order.top(k)
+
+    def ndcs(self):
+        return self._counts.keys()
+
+    def take_dirty(self) -> Set[str]:
+        """Returns ndcs changed (or removed) since the previous call and resets tracking."""
+        dirty, self._dirty = self._dirty, set()
+        return dirty
 
     def snapshot(self) -> Dict[str, Dict[str, int]]:
         return self._counts
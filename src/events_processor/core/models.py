@@ -1,6 +1,8 @@
 from dataclasses import dataclass
 from decimal import Decimal
 
+from .money import Money
+
 
 @dataclass(slots=True)
 class ClaimRecord:
@@ -8,7 +10,15 @@ class ClaimRecord:
     npi: str
     ndc: str
     chain: str
-    price: Decimal
+    price: Money
     quantity_key: str  # normalized string for quantity (stable dict keys)
-    unit_price: Decimal
+    unit_price: Money
     is_reverted: bool = False
+
+
+def normalize_decimal_key(x: Decimal) -> str:
+    """Quantity as a plain string without trailing zeros ("30.0" -> "30")."""
+    s = format(x, "f")
+    if "." in s:
+        s = s.rstrip("0").rstrip(".")
+    return s
@@ -0,0 +1,149 @@
+import operator
+from decimal import Context, Decimal, InvalidOperation, MAX_EMAX, MAX_PREC, MIN_EMIN, ROUND_HALF_EVEN
+from typing import Any, Callable, Dict, Optional, Tuple, Union
+
+# price / unit price as held in events, claim records and aggregates:
+# Decimal with DecimalMoney, scaled int with FixedPointMoney
+Money = Union[Decimal, int]
+
+# Sums are kept exact, so aggregates do not depend on the order in which
+# claims, reverts and merged partials are applied (28-digit rounding would).
+_EXACT = Context(prec=MAX_PREC, Emax=MAX_EMAX, Emin=MIN_EMIN)
+
+# significant digits of the default Decimal context (unit prices, averages)
+_PREC = 28
+_POW10 = [10 ** i for i in range(128)]
+
+# floats below this are scaled directly instead of via their decimal text
+FLOAT_FAST_LIMIT = 1e6
+RATIO_CACHE_SIZE = 4096
+
+
+class DecimalMoney:
+    """
+    Default numeric engine: prices are Decimals parsed from their JSON text,
+    unit prices are `price / quantity` in the default 28-digit context.
+    """
+    name = "decimal"
+    zero: Money = Decimal("0")
+
+    add: Callable[[Any, Any], Any] = staticmethod(_EXACT.add)
+    subtract: Callable[[Any, Any], Any] = staticmethod(_EXACT.subtract)
+
+    def parse(self, x: Any) -> Optional[Decimal]:
+        if x is None:
+            return None
+        try:
+            return Decimal(str(x))
+        except (InvalidOperation, ValueError):
+            return None
+
+    def unit_price(self, price: Decimal, quantity: Decimal) -> Decimal:
+        return price / quantity
+
+    def to_decimal(self, v: Money) -> Decimal:
+        return v
+
+    def unit_to_decimal(self, v: Money) -> Decimal:
+        return v
+
+
+class FixedPointMoney:
+    """
+    Fixed-point engine: prices are ints in nano-units (1 == 0.000000001);
+    prices with more than 9 decimals are rounded half-even to a nano-unit.
+    Unit prices are ints in units of 10**-UNIT_DIGITS holding exactly the
+    28-digit quotient the Decimal engine computes (for unit prices from a
+    nano-unit up), so unit price sums, averages and the rounded output match
+    the Decimal engine. Integer sums are exact and much cheaper than Decimal.
+    """
+    name = "fixed"
+    DIGITS = 9
+    SCALE = 10 ** DIGITS
+    UNIT_DIGITS = 36
+    zero: Money = 0
+
+    add: Callable[[Any, Any], Any] = staticmethod(operator.add)
+    subtract: Callable[[Any, Any], Any] = staticmethod(operator.sub)
+
+    def parse(self, x: Any) -> Optional[int]:
+        if x is None or isinstance(x, bool):
+            return None
+        if isinstance(x, int):
+            return x * self.SCALE
+        if isinstance(x, float) and -FLOAT_FAST_LIMIT < x < FLOAT_FAST_LIMIT:
+            # exact for prices with up to 9 decimals in this range
+            return round(x * self.SCALE)
+
+        s = str(x).strip()
+        whole, _, frac = s.partition(".")
+        # at least one digit: int() would take "", ".", "-" and "+" as 0
+        if (len(frac) <= self.DIGITS and (frac or whole.lstrip("+-"))
+                and "e" not in s and "E" not in s and "_" not in s):
+            try:
+                # "-12.5" -> int("-12" + "500000000")
+                return int(whole + frac.ljust(self.DIGITS, "0"))
+            except ValueError:
+                pass
+
+        try:
+            d = Decimal(s).scaleb(self.DIGITS)
+            return int(d.to_integral_value(rounding=ROUND_HALF_EVEN))
+        except (InvalidOperation, ValueError, OverflowError):
+            return None
+
+    def __init__(self) -> None:
+        # quantity -> (numerator, denominator scaled from nano-units to unit price units);
+        # few distinct quantities in practice
+        self._ratios: Dict[Decimal, Tuple[int, int]] = {}
+
+    def unit_price(self, price: int, quantity: Decimal) -> int:
+        """
+        price / quantity rounded half-even to 28 significant digits, like the
+        Decimal engine; a unit price below a nano-unit is rounded half-even to
+        10**-UNIT_DIGITS instead.
+        """
+        ratio = self._ratios.get(quantity)
+        if ratio is None:
+            num, den = quantity.as_integer_ratio()
+            ratio = num, den * _POW10[self.UNIT_DIGITS - self.DIGITS]
+            if len(self._ratios) < RATIO_CACHE_SIZE:
+                self._ratios[quantity] = ratio
+        num, factor = ratio
+        q, r = divmod(price * factor, num)
+        step = 1
+        if q >= _POW10[_PREC]:
+            # more digits than the Decimal context keeps: round off the extra ones
+            digits = ((q.bit_length() - 1) * 1233 >> 12) + 1
+            while q >= _POW10[digits]:
+                digits += 1
+            step = _POW10[digits - _PREC]
+            q, rest = divmod(q, step)
+            r += rest * num
+            num *= step
+        twice = 2 * r
+        if twice > num or (twice == num and q & 1):
+            q += 1
+        return q * step
+
+    def to_decimal(self, v: Money) -> Decimal:
+        return Decimal(v).scaleb(-self.DIGITS)
+
+    def unit_to_decimal(self, v: Money) -> Decimal:
+        return _EXACT.scaleb(Decimal(v), -self.UNIT_DIGITS)
+
+
+def average(unit_sum: Decimal, cnt: int) -> Decimal:
+    """
+    unit_sum / cnt in the default context, with the exact sum first rounded
+    to the context's 28 digits like a running Decimal sum is.
+    """
+    return +unit_sum / Decimal(cnt)
+
+
+DECIMAL_MONEY = DecimalMoney()
+FIXED_MONEY = FixedPointMoney()
+
+MONEY_ENGINES = {m.name: m for m in (DECIMAL_MONEY, FIXED_MONEY)}
+
+MoneyEngine = Union[DecimalMoney, FixedPointMoney]
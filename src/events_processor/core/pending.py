@@ -0,0 +1,68 @@
+from collections import OrderedDict
+from datetime import datetime
+from typing import List, Optional
+
+
+class PendingReverts:
+    """
+    Reverts that arrived before their claim: claim_id -> revert count, with the
+    event time of the latest of those reverts.
+
+    The buffer is bounded by `max_size` claim ids (least recently touched ids
+    are evicted first) and by `max_age` seconds of event time behind the newest
+    pending revert; None disables a bound. Reverts of claims that never arrive
+    (e.g. claims from unknown pharmacies, which are not stored) are eventually
+    evicted instead of being kept forever.
+    """
+    __slots__ = ("max_size", "max_age", "_entries", "_newest")
+
+    def __init__(self, max_size: Optional[int] = None, max_age: Optional[float] = None) -> None:
+        self.max_size = max_size
+        self.max_age = max_age
+        # claim_id -> [count, event time], least recently touched first
+        self._entries: "OrderedDict[str, List]" = OrderedDict()
+        self._newest = float("-inf")
+
+    def add(self, claim_id: str, ts: datetime) -> int:
+        """Buffers a revert; returns the number of reverts evicted to stay within bounds."""
+        t = ts.timestamp()
+        entry = self._entries.get(claim_id)
+        if entry is None:
+            self._entries[claim_id] = [1, t]
+        else:
+            entry[0] += 1
+            if t > entry[1]:
+                entry[1] = t
+            self._entries.move_to_end(claim_id)
+        if t > self._newest:
+            self._newest = t
+        return self._evict()
+
+    def pop(self, claim_id: str) -> int:
+        """Removes and returns the number of reverts buffered for `claim_id` (0 if none)."""
+        entry = self._entries.pop(claim_id, None)
+        return 0 if entry is None else entry[0]
+
+    def _evict(self) -> int:
+        entries = self._entries
+        evicted = 0
+        if self.max_size is not None:
+            while len(entries) > self.max_size:
+                evicted += entries.popitem(last=False)[1][0]
+        if self.max_age is not None:
+            # entries are ordered by last touch, which follows event time closely
+            oldest = self._newest - self.max_age
+            while entries:
+                claim_id = next(iter(entries))
+                count, t = entries[claim_id]
+                if t >= oldest:
+                    break
+                del entries[claim_id]
+                evicted += count
+        return evicted
+
+    def __contains__(self, claim_id: str) -> bool:
+        return claim_id in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
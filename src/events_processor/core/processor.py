@@ -1,8 +1,9 @@
-from dataclasses import dataclass
-from decimal import Decimal
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, Iterable, List, Sequence, Tuple, Union
 
 from .events import ClaimEvent, RevertEvent
-from .models import ClaimRecord
+from .models import ClaimRecord, normalize_decimal_key
 from .state import InMemoryState
 
 
@@ -19,6 +20,65 @@ class Counters:
     unknown_pharmacy_claims: int = 0
     orphan_reverts: int = 0
     already_reverted: int = 0
+    # ids dropped by a bounded dedup (window or bloom); later copies are not detected
+    evicted_claim_ids: int = 0
+    evicted_revert_ids: int = 0
+    # unknown-pharmacy claims admitted after a reload added their pharmacy
+    # (no longer in unknown_pharmacy_claims), or dropped from the buffer
+    late_pharmacy_claims: int = 0
+    evicted_unknown_claims: int = 0
+
+
+@dataclass(slots=True)
+class PharmacyChanges:
+    """Difference between two pharmacy snapshots (npi -> chain)."""
+    added: Dict[str, str] = field(default_factory=dict)
+    removed: Dict[str, str] = field(default_factory=dict)
+    # npi -> (old chain, new chain)
+    changed: Dict[str, Tuple[str, str]] = field(default_factory=dict)
+
+    def __bool__(self) -> bool:
+        return bool(self.added or self.removed or self.changed)
+
+
+def diff_pharmacies(old: Dict[str, str], new: Dict[str, str]) -> PharmacyChanges:
+    changes = PharmacyChanges()
+    for npi, chain in new.items():
+        old_chain = old.get(npi)
+        if old_chain is None:
+            changes.added[npi] = chain
+        elif old_chain != chain:
+            changes.changed[npi] = (old_chain, chain)
+    for npi, chain in old.items():
+        if npi not in new:
+            changes.removed[npi] = chain
+    return changes
+
+
+def switch_pharmacies(state: InMemoryState, pharmacies: Dict[str, str], reattribute: bool = True) -> PharmacyChanges:
+    """
+    Installs a new pharmacy snapshot in `state` and, with `reattribute`, moves
+    the Goal 3 aggregates of npis whose chain changed (including removed npis
+    that come back) to the new chain. Only those npis are touched: their
+    active claim counts and unit price sums per ndc come from Goal 2.
+    """
+    changes = diff_pharmacies(state.pharmacy_chain_by_npi, pharmacies)
+    retired = state.retired_chain_by_npi
+    moves = dict(changes.changed)
+    for npi, chain in changes.added.items():
+        old_chain = retired.pop(npi, None)
+        if old_chain is not None:
+            moves[npi] = (old_chain, chain)
+    retired.update(changes.removed)
+
+    if reattribute and moves:
+        goal3 = state.goal3
+        for (npi, ndc), agg in state.goal2.snapshot().items():
+            move = moves.get(npi)
+            if move is not None:
+                goal3.move(ndc, move[0], move[1], agg.active_cnt, agg.active_unit_price_sum)
+    state.pharmacy_chain_by_npi = pharmacies
+    return changes
 
 
 class EventProcessor:
@@ -28,11 +88,16 @@ class EventProcessor:
     The processor is idempotent and order-agnostic:
     - duplicate events are ignored
     - reverts arriving before claims are handled correctly
-    - only claims from known pharmacies are processed
+    - only claims from known pharmacies are processed (claims from unknown
+      ones can be buffered and admitted when the pharmacy appears)
+
+    With `track_goal3=False` (batch runs) Goal 3 is not updated per event:
+    rebuild_goal3() derives it from Goal 2 once, before the outputs are built.
     """
-    def __init__(self, state: InMemoryState) -> None:
+    def __init__(self, state: InMemoryState, track_goal3: bool = True) -> None:
         self.state = state
         self.counters = Counters()
+        self.track_goal3 = track_goal3
 
     def handle(self, event) -> None:
         if isinstance(event, ClaimEvent):
@@ -40,56 +105,215 @@ class EventProcessor:
         elif isinstance(event, RevertEvent):
             self._on_revert(event)
 
+    def handle_batch(self, events: Iterable[Union[ClaimEvent, RevertEvent]]) -> None:
+        """
+        Handles events in order, with the same result as handle() on each;
+        consecutive claims and consecutive reverts are applied as batches
+        (apply_claims / apply_reverts).
+        """
+        claims: List[Tuple[ClaimRecord, datetime]] = []
+        reverts: List[Tuple[str, str, datetime]] = []
+        for e in events:
+            if isinstance(e, ClaimEvent):
+                if reverts:
+                    self.apply_reverts(reverts)
+                    reverts = []
+                claims.append((_record(e), e.timestamp))
+            elif isinstance(e, RevertEvent):
+                if claims:
+                    self.apply_claims(claims)
+                    claims = []
+                reverts.append((e.id, e.claim_id, e.timestamp))
+        if claims:
+            self.apply_claims(claims)
+        if reverts:
+            self.apply_reverts(reverts)
+
     def _on_claim(self, e: ClaimEvent) -> None:
-        if e.id in self.state.seen_claim_ids:
+        self.apply_claim(_record(e), e.timestamp)
+
+    def apply_claim(self, cr: ClaimRecord, ts: datetime) -> None:
+        """
+        Handles a claim already decoded into the record to store (see
+        sources.events_json.ClaimDecoder); its chain is filled in here.
+        """
+        seen = self.state.seen_claim_ids
+        if not seen.add(cr.claim_id, ts):
             self.counters.duplicate_claims += 1
             return
-        self.state.seen_claim_ids.add(e.id)
+        self.counters.evicted_claim_ids = seen.evictions
 
-        chain = self.state.pharmacy_chain_by_npi.get(e.npi)
+        chain = self.state.pharmacy_chain_by_npi.get(cr.npi)
         if chain is None:
             self.counters.unknown_pharmacy_claims += 1
+            self.counters.evicted_unknown_claims += self.state.unknown_claims.add(cr)
             return
+        self._admit(cr, chain)
 
-        quantity_key = self._normalize_decimal_key(e.quantity)
-
-        cr = ClaimRecord(
-            claim_id=e.id,
-            npi=e.npi,
-            ndc=e.ndc,
-            chain=chain,
-            price=e.price,
-            quantity_key=quantity_key,
-            unit_price=e.unit_price,
-            is_reverted=False,
-        )
-        self.state.claims[e.id] = cr
+    def apply_claims(self, items: Sequence[Tuple[ClaimRecord, datetime]]) -> None:
+        """
+        Batch form of apply_claim, with the same result as applying `items`
+        one by one; the state lookups and goal methods are bound once per
+        batch instead of once per claim.
+        """
+        state = self.state
+        counters = self.counters
+        seen = state.seen_claim_ids
+        seen_add = seen.add
+        chains = state.pharmacy_chain_by_npi
+        store_add = state.claims.add
+        goal2_on_claim = state.goal2.on_claim
+        goal3_on_claim = state.goal3.on_claim if self.track_goal3 else None
+        goal4_on_claim = state.goal4.on_claim
+        pending = state.pending_reverts
+        for cr, ts in items:
+            if not seen_add(cr.claim_id, ts):
+                counters.duplicate_claims += 1
+                continue
+            chain = chains.get(cr.npi)
+            if chain is None:
+                counters.unknown_pharmacy_claims += 1
+                counters.evicted_unknown_claims += state.unknown_claims.add(cr)
+                continue
+            cr.chain = chain
+            store_add(cr)
+            goal2_on_claim(cr)
+            if goal3_on_claim is not None:
+                goal3_on_claim(cr)
+            goal4_on_claim(cr)
+            if pending:
+                self._apply_pending_reverts(cr.claim_id)
+        counters.evicted_claim_ids = seen.evictions
+
+    def _admit(self, cr: ClaimRecord, chain: str) -> None:
+        cr.chain = chain
+        self.state.claims.add(cr)
 
         # apply as active claim
         self.state.goal2.on_claim(cr)
-        #self.state.goal3.on_claim(cr)
+        if self.track_goal3:
+            self.state.goal3.on_claim(cr)
         self.state.goal4.on_claim(cr)
 
         # if revert came before claim
-        pending = self.state.pending_reverts.pop(e.id, 0)
+        self._apply_pending_reverts(cr.claim_id)
+
+    def _apply_pending_reverts(self, claim_id: str) -> None:
+        pending = self.state.pending_reverts.pop(claim_id)
         if pending > 0:
-            self._revert_claim_if_active(e.id)
+            self._revert_claim_if_active(claim_id)
             if pending > 1:
                 # extra reverts for same claim_id that arrived before claim
                 self.counters.already_reverted += (pending - 1)
 
+    def update_pharmacies(self, pharmacies: Dict[str, str], reattribute: bool = True) -> PharmacyChanges:
+        """
+        Switches to a new pharmacy snapshot (hot reload):
+        - npis whose chain changed: their active claims move to the new chain
+        - added npis: their buffered unknown-pharmacy claims are admitted
+        - removed npis: claims already admitted stay under the last chain,
+          new claims are handled as unknown
+
+        `reattribute=False` leaves Goal 3 as is, for a caller that moves
+        the aggregates elsewhere (ShardedProcessor).
+        """
+        state = self.state
+        changes = switch_pharmacies(state, pharmacies, reattribute)
+        for npi, chain in changes.added.items():
+            for cr in state.unknown_claims.pop_npi(npi):
+                self.counters.unknown_pharmacy_claims -= 1
+                self.counters.late_pharmacy_claims += 1
+                self._admit(cr, chain)
+        return changes
+
+    def merge_partial(self, partial: InMemoryState, counters: Counters) -> None:
+        """
+        Merges claims-only state built independently (e.g. in a worker process)
+        from a slice of the claim stream that comes after everything applied so far.
+
+        The result is the same as handling the slice's claims here one by one:
+        ids already seen are turned back into duplicates and pending reverts
+        are applied to newly stored claims.
+        """
+        state = self.state
+        self.counters.duplicate_claims += counters.duplicate_claims
+        self.counters.unknown_pharmacy_claims += counters.unknown_pharmacy_claims
+
+        for claim_id in state.seen_claim_ids.merge(partial.seen_claim_ids):
+            self.counters.duplicate_claims += 1
+            cr = partial.claims.pop(claim_id, None)
+            if cr is None:
+                # the partial saw it first as a claim from an unknown pharmacy
+                self.counters.unknown_pharmacy_claims -= 1
+                partial.unknown_claims.discard(claim_id)
+                continue
+            partial.goal2.discard(cr)
+            if self.track_goal3:
+                partial.goal3.on_revert(cr)
+            partial.goal4.on_revert(cr)
+
+        self.counters.evicted_claim_ids = state.seen_claim_ids.evictions
+        state.claims.update(partial.claims)
+        state.goal2.merge(partial.goal2)
+        if self.track_goal3:
+            state.goal3.merge(partial.goal3)
+        state.goal4.merge(partial.goal4)
+        self.counters.evicted_unknown_claims += state.unknown_claims.merge(partial.unknown_claims)
+
+        if state.pending_reverts:
+            for claim_id in partial.claims:
+                if claim_id in state.pending_reverts:
+                    self._apply_pending_reverts(claim_id)
+
     def _on_revert(self, e: RevertEvent) -> None:
-        if e.id in self.state.seen_revert_ids:
+        self.apply_revert(e.id, e.claim_id, e.timestamp)
+
+    def apply_revert(self, revert_id: str, claim_id: str, ts: datetime) -> None:
+        """Handles a revert decoded into its fields (see sources.events_json.iter_revert_items)."""
+        seen = self.state.seen_revert_ids
+        if not seen.add(revert_id, ts):
             self.counters.duplicate_reverts += 1
             return
-        self.state.seen_revert_ids.add(e.id)
+        self.counters.evicted_revert_ids = seen.evictions
 
-        if e.claim_id in self.state.claims:
-            ok = self._revert_claim_if_active(e.claim_id)
+        if claim_id in self.state.claims:
+            ok = self._revert_claim_if_active(claim_id)
             if not ok:
                 self.counters.already_reverted += 1
         else:
-            self.state.pending_reverts[e.claim_id] += 1
+            # reverts evicted from the bounded buffer will never find their claim
+            self.counters.orphan_reverts += self.state.pending_reverts.add(claim_id, ts)
+
+    def apply_reverts(self, items: Sequence[Tuple[str, str, datetime]]) -> None:
+        """
+        Batch form of apply_revert, with the same result as applying `items`
+        one by one (lookups bound once per batch, as in apply_claims).
+        """
+        state = self.state
+        counters = self.counters
+        seen = state.seen_revert_ids
+        seen_add = seen.add
+        get = state.claims.get
+        pending = state.pending_reverts
+        goal2_on_revert = state.goal2.on_revert
+        goal3_on_revert = state.goal3.on_revert if self.track_goal3 else None
+        goal4_on_revert = state.goal4.on_revert
+        for revert_id, claim_id, ts in items:
+            if not seen_add(revert_id, ts):
+                counters.duplicate_reverts += 1
+                continue
+            cr = get(claim_id)
+            if cr is None:
+                counters.orphan_reverts += pending.add(claim_id, ts)
+            elif cr.is_reverted:
+                counters.already_reverted += 1
+            else:
+                self._mark_reverted(cr)
+                goal2_on_revert(cr)
+                if goal3_on_revert is not None:
+                    goal3_on_revert(cr)
+                goal4_on_revert(cr)
+        counters.evicted_revert_ids = seen.evictions
 
     def _revert_claim_if_active(self, claim_id: str) -> bool:
         cr = self.state.claims.get(claim_id)
@@ -99,15 +323,38 @@ class EventProcessor:
         if cr.is_reverted:
             return False
 
-        cr.is_reverted = True
+        self._mark_reverted(cr)
         self.state.goal2.on_revert(cr)
-        #self.state.goal3.on_revert(cr)
+        if self.track_goal3:
+            self.state.goal3.on_revert(cr)
         self.state.goal4.on_revert(cr)
         return True
 
-    @staticmethod
-    def _normalize_decimal_key(x: Decimal) -> str:
-        s = format(x, "f")
-        if "." in s:
-            s = s.rstrip("0").rstrip(".")
-        return s
+    def rebuild_goal3(self) -> None:
+        """Recomputes Goal 3 from Goal 2 (with track_goal3=False, once all events are applied)."""
+        state = self.state
+        state.goal3.rebuild(state.goal2.snapshot(), state.pharmacy_chain_by_npi, state.retired_chain_by_npi)
+
+    def _mark_reverted(self, cr: ClaimRecord) -> ClaimRecord:
+        self.state.claims.mark_reverted(cr.claim_id)
+        # the stored chain is the one at admission; a reload may have moved the npi since
+        cr.chain = (
+            self.state.pharmacy_chain_by_npi.get(cr.npi)
+            or self.state.retired_chain_by_npi.get(cr.npi)
+            or cr.chain
+        )
+        return cr
+
+
+def _record(e: ClaimEvent) -> ClaimRecord:
+    """The record stored for a parsed claim event (chain filled in when admitted)."""
+    return ClaimRecord(
+        claim_id=e.id,
+        npi=e.npi,
+        ndc=e.ndc,
+        chain="",
+        price=e.price,
+        quantity_key=normalize_decimal_key(e.quantity),
+        unit_price=e.unit_price,
+        is_reverted=False,
+    )
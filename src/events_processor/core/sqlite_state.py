@@ -0,0 +1,262 @@
+import sqlite3
+from collections import OrderedDict
+from decimal import Decimal
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Set, Union
+
+from .dedup import ExactDedup
+from .models import ClaimRecord
+from .money import DECIMAL_MONEY, FixedPointMoney, MoneyEngine
+
+# claims kept in memory in front of the database (least recently used evicted)
+DEFAULT_CACHE_SIZE = 100_000
+# buffered writes per transaction
+DEFAULT_BATCH = 10_000
+
+_INT64_MAX = 2 ** 63 - 1
+
+
+class SqliteDatabase:
+    """
+    On-disk part of the state (--state-backend sqlite): one SQLite file in
+    WAL mode shared by the claim store and the id dedup sets, whose tables
+    it holds. The stores buffer their writes and report them here; every
+    `batch` writes all buffers are written in one transaction. Statements
+    are reused from the connection's prepared statement cache.
+
+    The file is recreated when opened: it holds the state of one run only.
+    """
+
+    def __init__(self, path: Union[str, Path], batch: int = DEFAULT_BATCH) -> None:
+        self.path = Path(path)
+        for suffix in ("", "-wal", "-shm"):
+            Path(f"{self.path}{suffix}").unlink(missing_ok=True)
+        # autocommit mode: transactions are opened explicitly in flush();
+        # the metrics thread only reads Python-side counters
+        self.conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA temp_store=MEMORY")
+        self.conn.execute("PRAGMA cache_size=-65536")  # 64 MiB of pages
+        self.batch = batch
+        # stores with a flush_into(conn) method
+        self._stores: list = []
+        self._writes = 0
+
+    def register(self, store) -> None:
+        self._stores.append(store)
+
+    def wrote(self) -> None:
+        self._writes += 1
+        if self._writes >= self.batch:
+            self.flush()
+
+    def flush(self) -> None:
+        """Writes the buffered changes of all stores in one transaction."""
+        if not self._writes:
+            return
+        conn = self.conn
+        conn.execute("BEGIN")
+        try:
+            for store in self._stores:
+                store.flush_into(conn)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        self._writes = 0
+
+    def close(self) -> None:
+        self.flush()
+        self.conn.close()
+
+
+class SqliteClaimStore:
+    """
+    Claim store on disk (same interface as DictClaimStore), with an LRU
+    cache of `cache_size` hot claims in front of it. New claims and revert
+    marks are buffered until the database flushes them; lookups check the
+    buffers and the cache before reading a row. Records returned by `get`
+    are shared with the cache, as DictClaimStore shares its records.
+    """
+
+    def __init__(
+        self,
+        db: SqliteDatabase,
+        money: MoneyEngine = DECIMAL_MONEY,
+        cache_size: int = DEFAULT_CACHE_SIZE,
+    ) -> None:
+        self.db = db
+        self.cache_size = cache_size
+        self._load: Callable[[object], object] = int if isinstance(money, FixedPointMoney) else Decimal
+        db.conn.execute(
+            "CREATE TABLE IF NOT EXISTS claims (claim_id BLOB PRIMARY KEY, npi BLOB, ndc BLOB, chain TEXT,"
+            " price, quantity_key TEXT, unit_price, reverted INTEGER) WITHOUT ROWID"
+        )
+        db.register(self)
+        self._cache: "OrderedDict[str, ClaimRecord]" = OrderedDict()
+        # not yet written: new claims, and revert marks of claims already written
+        self._added: Dict[str, ClaimRecord] = {}
+        self._reverted: Set[str] = set()
+        self._count = 0
+
+    def add(self, cr: ClaimRecord) -> None:
+        self._added[cr.claim_id] = cr
+        self._cache.pop(cr.claim_id, None)
+        self._reverted.discard(cr.claim_id)
+        self.db.wrote()
+
+    def get(self, claim_id: str) -> Optional[ClaimRecord]:
+        cr = self._added.get(claim_id)
+        if cr is not None:
+            return cr
+        cache = self._cache
+        cr = cache.get(claim_id)
+        if cr is not None:
+            cache.move_to_end(claim_id)
+            return cr
+
+        row = self.db.conn.execute(
+            "SELECT npi, ndc, chain, price, quantity_key, unit_price, reverted FROM claims WHERE claim_id = ?",
+            (_blob(claim_id),),
+        ).fetchone()
+        if row is None:
+            return None
+        npi, ndc, chain, price, quantity_key, unit_price, reverted = row
+        cr = ClaimRecord(
+            claim_id, _text(npi), _text(ndc), chain, self._load(price), quantity_key, self._load(unit_price),
+            bool(reverted) or claim_id in self._reverted,
+        )
+        cache[claim_id] = cr
+        if len(cache) > self.cache_size:
+            cache.popitem(last=False)
+        return cr
+
+    def mark_reverted(self, claim_id: str) -> None:
+        self.get(claim_id).is_reverted = True
+        if claim_id not in self._added:
+            self._reverted.add(claim_id)
+            self.db.wrote()
+
+    def pop(self, claim_id: str, default: Optional[ClaimRecord] = None) -> Optional[ClaimRecord]:
+        # removals are rare (merge of partials): written through right away
+        cr = self.get(claim_id)
+        if cr is None:
+            return default
+        self.db.flush()
+        self._cache.pop(claim_id, None)
+        self._count -= self.db.conn.execute("DELETE FROM claims WHERE claim_id = ?", (_blob(claim_id),)).rowcount
+        return cr
+
+    def update(self, other) -> None:
+        for claim_id in other:
+            self.add(other.get(claim_id))
+
+    def values(self) -> Iterator[ClaimRecord]:
+        for claim_id in self:
+            yield self.get(claim_id)
+
+    def flush_into(self, conn: sqlite3.Connection) -> None:
+        if self._added:
+            rows = [
+                (_blob(cr.claim_id), _blob(cr.npi), _blob(cr.ndc), cr.chain, _dump(cr.price), cr.quantity_key,
+                 _dump(cr.unit_price), int(cr.is_reverted))
+                for cr in self._added.values()
+            ]
+            inserted = conn.executemany(
+                "INSERT OR IGNORE INTO claims VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows
+            ).rowcount
+            if inserted < len(rows):
+                # some ids were stored before (re-added after a bounded dedup forgot them)
+                conn.executemany("INSERT OR REPLACE INTO claims VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            self._count += inserted
+            # written records stay hot
+            for claim_id, cr in self._added.items():
+                self._cache[claim_id] = cr
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+            self._added = {}
+        if self._reverted:
+            conn.executemany(
+                "UPDATE claims SET reverted = 1 WHERE claim_id = ?",
+                [(_blob(claim_id),) for claim_id in self._reverted],
+            )
+            self._reverted = set()
+
+    def __contains__(self, claim_id: object) -> bool:
+        # loads the record into the cache: a revert looks it up right after
+        return self.get(claim_id) is not None
+
+    def __iter__(self) -> Iterator[str]:
+        self.db.flush()
+        for (claim_id,) in self.db.conn.execute("SELECT claim_id FROM claims").fetchall():
+            yield _text(claim_id)
+
+    def __len__(self) -> int:
+        # re-added ids count twice until written
+        return self._count + len(self._added)
+
+
+class SqliteDedup:
+    """
+    Exact id dedup on disk (same interface as ExactDedup): every id ever
+    seen, in a table of the database. Ids added since the last flush are
+    checked in memory first.
+    """
+
+    name = "exact"
+
+    def __init__(self, db: SqliteDatabase, table: str) -> None:
+        self.db = db
+        self.table = table
+        self.evictions = 0
+        db.conn.execute(f"CREATE TABLE IF NOT EXISTS {table} (id BLOB PRIMARY KEY) WITHOUT ROWID")
+        db.register(self)
+        self._select = f"SELECT 1 FROM {table} WHERE id = ?"
+        self._insert = f"INSERT OR IGNORE INTO {table} VALUES (?)"
+        self._new: Set[str] = set()
+        self._count = 0
+
+    def add(self, key: str, ts=None) -> bool:
+        """Records `key`; False if it was already seen."""
+        if key in self._new or self.db.conn.execute(self._select, (_blob(key),)).fetchone() is not None:
+            return False
+        self._new.add(key)
+        self.db.wrote()
+        return True
+
+    def partial(self) -> ExactDedup:
+        """Empty in-memory dedup for a worker's chunk, mergeable into this one."""
+        return ExactDedup()
+
+    def merge(self, other: ExactDedup) -> List[str]:
+        """Absorbs a worker's chunk; returns its ids that were already seen here."""
+        return [key for key in other._ids if not self.add(key)]
+
+    def flush_into(self, conn: sqlite3.Connection) -> None:
+        if self._new:
+            self._count += conn.executemany(self._insert, [(_blob(key),) for key in self._new]).rowcount
+            self._new = set()
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._new or self.db.conn.execute(self._select, (_blob(key),)).fetchone() is not None
+
+    def __len__(self) -> int:
+        return self._count + len(self._new)
+
+
+def _blob(s: str) -> bytes:
+    # ids and codes are stored as UTF-8 BLOBs: json.loads lets lone surrogates
+    # through, which sqlite3 cannot bind as TEXT
+    return s.encode("utf-8", "surrogatepass")
+
+
+def _text(b: bytes) -> str:
+    return b.decode("utf-8", "surrogatepass")
+
+
+def _dump(v):
+    # Decimals as their exact text; nano-unit ints as INTEGER while they fit in one
+    if isinstance(v, int) and -_INT64_MAX <= v <= _INT64_MAX:
+        return v
+    return str(v)
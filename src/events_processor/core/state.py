@@ -1,9 +1,13 @@
 from dataclasses import dataclass, field
-from collections import defaultdict
-from typing import Dict, Set, DefaultDict
+from typing import Callable, Dict, Optional
 
-from .models import ClaimRecord
+from .claim_store import ClaimStore, DictClaimStore
+from .dedup import ExactDedup, IdDedup
+from .money import DECIMAL_MONEY, MoneyEngine
+from .pending import PendingReverts
+from .unknown import UnknownPharmacyClaims
 from .goals.goal2 import Goal2Metrics
+from .goals.goal3 import Goal3Chains
 from .goals.goal4 import Goal4Quantity
 
 
@@ -12,16 +16,44 @@ class InMemoryState:
     # pharmacy snapshot: npi -> chain
     pharmacy_chain_by_npi: Dict[str, str] = field(default_factory=dict)
 
+    # npi -> last chain of pharmacies removed by a reload; their admitted claims stay there
+    retired_chain_by_npi: Dict[str, str] = field(default_factory=dict)
+
     # claim store (only for known pharmacies)
-    claims: Dict[str, ClaimRecord] = field(default_factory=dict)
+    claims: ClaimStore = field(default_factory=DictClaimStore)
+
+    # claims from unknown pharmacies, admitted if the pharmacy is added (off by default)
+    unknown_claims: UnknownPharmacyClaims = field(default_factory=UnknownPharmacyClaims)
 
-    # dedup sets
-    seen_claim_ids: Set[str] = field(default_factory=set)
-    seen_revert_ids: Set[str] = field(default_factory=set)
+    # dedup of event ids (exact by default, see core.dedup)
+    seen_claim_ids: IdDedup = field(default_factory=ExactDedup)
+    seen_revert_ids: IdDedup = field(default_factory=ExactDedup)
 
-    # revert-before-claim: claim_id -> count
-    pending_reverts: DefaultDict[str, int] = field(default_factory=lambda: defaultdict(int))
+    # revert-before-claim: claim_id -> count (bounded, see core.pending)
+    pending_reverts: PendingReverts = field(default_factory=PendingReverts)
 
     # goals
     goal2: Goal2Metrics = field(default_factory=Goal2Metrics)
+    goal3: Goal3Chains = field(default_factory=Goal3Chains)
     goal4: Goal4Quantity = field(default_factory=Goal4Quantity)
+
+    @classmethod
+    def with_money(
+        cls,
+        money: MoneyEngine = DECIMAL_MONEY,
+        claims: Optional[ClaimStore] = None,
+        dedup: Callable[[], IdDedup] = ExactDedup,
+    ) -> "InMemoryState":
+        """Empty state whose price aggregates use the given numeric engine."""
+        return cls(
+            claims=DictClaimStore() if claims is None else claims,
+            seen_claim_ids=dedup(),
+            seen_revert_ids=dedup(),
+            goal2=Goal2Metrics(money),
+            goal3=Goal3Chains(money),
+        )
+
+    @property
+    def money(self) -> MoneyEngine:
+        # numeric engine of price aggregates (fixed by the Goal 2 aggregate)
+        return self.goal2.money
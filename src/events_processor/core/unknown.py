@@ -0,0 +1,84 @@
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from .models import ClaimRecord
+
+# npi, ndc, price, quantity_key, unit_price
+_Fields = Tuple[str, str, object, str, object]
+
+
+class UnknownPharmacyClaims:
+    """
+    Claims from npis missing in the pharmacy snapshot, kept so that they can be
+    admitted if the pharmacy is added later (hot reload in --streaming mode).
+
+    Only the fields needed to store the claim are kept, as a tuple per claim
+    id, plus a per-npi list of ids. Bounded by `max_size` claims, oldest
+    evicted first; None means unbounded and 0 keeps nothing (claims from
+    unknown pharmacies are dropped, as in batch mode).
+    """
+    __slots__ = ("max_size", "_claims", "_by_npi", "_listed")
+
+    def __init__(self, max_size: Optional[int] = 0) -> None:
+        self.max_size = max_size
+        # claim_id -> fields, oldest first
+        self._claims: "OrderedDict[str, _Fields]" = OrderedDict()
+        # npi -> claim ids; may still list ids evicted or discarded since
+        self._by_npi: Dict[str, List[str]] = {}
+        self._listed = 0
+
+    def add(self, cr: ClaimRecord) -> int:
+        """Buffers a claim; returns the number of claims evicted to stay within bounds."""
+        if self.max_size == 0:
+            return 0
+        if cr.claim_id not in self._claims:
+            self._by_npi.setdefault(cr.npi, []).append(cr.claim_id)
+            self._listed += 1
+        self._claims[cr.claim_id] = (cr.npi, cr.ndc, cr.price, cr.quantity_key, cr.unit_price)
+
+        evicted = 0
+        if self.max_size is not None:
+            while len(self._claims) > self.max_size:
+                self._claims.popitem(last=False)
+                evicted += 1
+        if self._listed > 2 * len(self._claims) + 1024:
+            self._reindex()
+        return evicted
+
+    def pop_npi(self, npi: str) -> List[ClaimRecord]:
+        """Removes and returns the buffered claims of `npi`, in arrival order (chain left empty)."""
+        out: List[ClaimRecord] = []
+        ids = self._by_npi.pop(npi, ())
+        self._listed -= len(ids)
+        for claim_id in ids:
+            fields = self._claims.get(claim_id)
+            if fields is None or fields[0] != npi:
+                continue
+            del self._claims[claim_id]
+            _, ndc, price, quantity_key, unit_price = fields
+            out.append(ClaimRecord(claim_id, npi, ndc, "", price, quantity_key, unit_price, False))
+        return out
+
+    def discard(self, claim_id: str) -> None:
+        self._claims.pop(claim_id, None)
+
+    def merge(self, other: "UnknownPharmacyClaims") -> int:
+        """Adds the claims of a partial buffer (newer than this one's); returns evictions."""
+        evicted = 0
+        for claim_id, (npi, ndc, price, quantity_key, unit_price) in other._claims.items():
+            evicted += self.add(ClaimRecord(claim_id, npi, ndc, "", price, quantity_key, unit_price, False))
+        return evicted
+
+    def partial(self) -> "UnknownPharmacyClaims":
+        """Empty unbounded buffer for a partial state (merged back with `merge`), or a disabled one."""
+        return UnknownPharmacyClaims(0 if self.max_size == 0 else None)
+
+    def _reindex(self) -> None:
+        by_npi: Dict[str, List[str]] = {}
+        for claim_id, fields in self._claims.items():
+            by_npi.setdefault(fields[0], []).append(claim_id)
+        self._by_npi = by_npi
+        self._listed = len(self._claims)
+
+    def __len__(self) -> int:
+        return len(self._claims)
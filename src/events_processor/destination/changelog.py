@@ -0,0 +1,134 @@
+import json
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence
+
+from .incremental import RowChanges
+from .writer import write_json_atomic, write_jsonl_atomic
+
+# Goal 2, 3 and 4 outputs in the changelog, with the row fields that form their key
+OUTPUTS = (
+    ("metrics_by_npi_ndc", ("npi", "ndc")),
+    ("top2_chain_per_ndc", ("ndc",)),
+    ("most_common_qty_per_ndc", ("ndc",)),
+)
+
+# deltas between two snapshots
+DEFAULT_SNAPSHOT_EVERY = 100
+
+MANIFEST = "manifest.json"
+FORMAT = 1
+
+
+class DeltaLog:
+    """
+    Output of --output-mode delta: instead of rewriting the output files
+    on every emit, an emit writes one sequenced changelog file with the rows
+    that changed or were removed since the previous emit, so its cost
+    follows the changes, not the total state.
+
+    Files in `directory` (compact JSON lines):
+    - delta-<seq>.jsonl: the changes of emit <seq>, one line per row:
+      {"goal": output, "op": "put", "row": row} for a new or replaced row,
+      {"goal": output, "op": "delete", "key": {field: value}} for a removed one
+    - snapshot-<seq>.jsonl: every row as of emit <seq>, as "put" lines
+    - manifest.json: the last seq, the key fields of each output, the
+      latest snapshot and the deltas still on disk, in seq order; replaced
+      atomically after the files it lists are complete
+
+    A consumer at seq n applies the listed deltas after n if delta n + 1
+    is listed, and otherwise loads the snapshot and the deltas after it.
+    The first emit writes a snapshot (its seq continues the sequence of an
+    earlier run in the same directory), and so does every `snapshot_every`-th
+    emit after it (compaction). The files of a snapshot and its deltas are
+    deleted at the second compaction after it, so a consumer has at least
+    `snapshot_every` emits to catch up. Emits without changes write nothing.
+    """
+
+    def __init__(self, directory: Path, snapshot_every: int = DEFAULT_SNAPSHOT_EVERY) -> None:
+        self.directory = directory
+        self.snapshot_every = snapshot_every
+        directory.mkdir(parents=True, exist_ok=True)
+        self.seq = 0
+        # {"seq", "file"} of the latest snapshot; None until the first emit
+        self.snapshot: Optional[Dict[str, Any]] = None
+        # manifest entries of the deltas on disk
+        self.deltas: List[Dict[str, Any]] = []
+        # files since the latest snapshot, and of the generation before it
+        # (at start: files of an earlier run, deleted with the first snapshot)
+        self._current: List[str] = []
+        self._previous: List[str] = sorted(
+            p.name for pattern in ("delta-*.jsonl", "snapshot-*.jsonl") for p in directory.glob(pattern)
+        )
+
+        manifest = _read_manifest(directory / MANIFEST)
+        if manifest is not None:
+            self.seq = manifest["seq"]
+
+    def emit(self, rows: Sequence[Iterable[dict]], changes: Sequence[RowChanges]) -> Optional[int]:
+        """
+        Writes the Goal 2, 3 and 4 changes of one emit, and a snapshot of
+        `rows` (the current rows of each output) when one is due; returns the
+        seq of the emit, None if nothing changed.
+        """
+        if self.snapshot is not None and not any(changes):
+            return None
+        self.seq += 1
+
+        if self.snapshot is not None:
+            name = f"delta-{self.seq:09d}.jsonl"
+            size = write_jsonl_atomic(self.directory / name, _delta_lines(changes))
+            self.deltas.append({
+                "seq": self.seq,
+                "file": name,
+                "rows": sum(len(c.rows) for c in changes),
+                "removed": sum(len(c.removed) for c in changes),
+                "bytes": size,
+            })
+            self._current.append(name)
+
+        if self.snapshot is None or self.seq - self.snapshot["seq"] >= self.snapshot_every:
+            name = f"snapshot-{self.seq:09d}.jsonl"
+            write_jsonl_atomic(self.directory / name, _snapshot_lines(rows))
+            self.snapshot = {"seq": self.seq, "file": name}
+            expired, self._previous, self._current = self._previous, self._current, [name]
+            gone = set(expired)
+            self.deltas = [d for d in self.deltas if d["file"] not in gone]
+            self._write_manifest()
+            for file in expired:
+                (self.directory / file).unlink(missing_ok=True)
+        else:
+            self._write_manifest()
+        return self.seq
+
+    def _write_manifest(self) -> None:
+        write_json_atomic(self.directory / MANIFEST, {
+            "format": FORMAT,
+            "seq": self.seq,
+            "keys": {name: list(fields) for name, fields in OUTPUTS},
+            "snapshot": self.snapshot,
+            "deltas": self.deltas,
+        })
+
+
+def _delta_lines(changes: Sequence[RowChanges]) -> Iterator[Dict[str, Any]]:
+    for (name, fields), c in zip(OUTPUTS, changes):
+        for key in sorted(c.removed):
+            values = key if isinstance(key, tuple) else (key,)
+            yield {"goal": name, "op": "delete", "key": dict(zip(fields, values))}
+        for key in sorted(c.rows):
+            yield {"goal": name, "op": "put", "row": c.rows[key]}
+
+
+def _snapshot_lines(rows: Sequence[Iterable[dict]]) -> Iterator[Dict[str, Any]]:
+    for (name, _), goal_rows in zip(OUTPUTS, rows):
+        for row in goal_rows:
+            yield {"goal": name, "op": "put", "row": row}
+
+
+def _read_manifest(path: Path) -> Optional[Dict[str, Any]]:
+    try:
+        with path.open("r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return manifest if isinstance(manifest, dict) and isinstance(manifest.get("seq"), int) else None
@@ -0,0 +1,312 @@
+import itertools
+from bisect import bisect_left, bisect_right
+from typing import Any, Callable, Dict, Hashable, Iterator, List, Optional, Sequence, Set, Tuple
+
+from .builders import TOP_QUANTITIES, goal2_row, goal3_row, goal4_row
+
+# rows per block of the maintained outputs (a changed block is copied once per view)
+BLOCK_ROWS = 64
+
+
+class _SortedRows:
+    """
+    Formatted rows kept in key order, in blocks of parallel key/row lists
+    (up to 2 * BLOCK_ROWS rows, found by their first keys). Rows are
+    replaced, never modified.
+
+    view() shares the blocks with the returned view, and a block is copied
+    on its first change after that (copy-on-write): a view costs O(blocks)
+    and the next build O(changed blocks), not O(rows).
+    """
+
+    def __init__(self) -> None:
+        self._firsts: List[Hashable] = []
+        self._keys: List[List[Hashable]] = []
+        self._rows: List[List[dict]] = []
+        # False for a block shared with a view: copied before it changes
+        self._owned: List[bool] = []
+        self._size = 0
+
+    def _find(self, key: Hashable) -> Tuple[int, int]:
+        """(block, position in it) where `key` is or would be inserted; block -1 if there are none."""
+        b = max(bisect_right(self._firsts, key) - 1, 0) if self._keys else -1
+        return b, (bisect_left(self._keys[b], key) if b >= 0 else 0)
+
+    def _own(self, b: int) -> None:
+        if not self._owned[b]:
+            self._keys[b] = list(self._keys[b])
+            self._rows[b] = list(self._rows[b])
+            self._owned[b] = True
+
+    def put(self, key: Hashable, row: dict, new: List[Tuple[Hashable, dict]]) -> bool:
+        """Sets the row of `key`; False if it already had an equal row."""
+        b, i = self._find(key)
+        if b >= 0 and i < len(self._keys[b]) and self._keys[b][i] == key:
+            if self._rows[b][i] == row:
+                return False
+            self._own(b)
+            self._rows[b][i] = row
+        else:
+            new.append((key, row))
+        return True
+
+    def remove(self, key: Hashable) -> bool:
+        """Drops the row of `key`; False if there was none."""
+        b, i = self._find(key)
+        if b < 0 or i >= len(self._keys[b]) or self._keys[b][i] != key:
+            return False
+        self._own(b)
+        keys = self._keys[b]
+        del keys[i]
+        del self._rows[b][i]
+        self._size -= 1
+        if not keys:
+            del self._firsts[b], self._keys[b], self._rows[b], self._owned[b]
+        elif i == 0:
+            self._firsts[b] = keys[0]
+        return True
+
+    def add_new(self, new: List[Tuple[Hashable, dict]]) -> None:
+        # re-block everything when many keys arrive at once
+        if len(new) * 8 > self._size:
+            pairs = [(k, r) for keys, rows in zip(self._keys, self._rows) for k, r in zip(keys, rows)]
+            pairs.extend(new)
+            pairs.sort(key=lambda kv: kv[0])
+            blocks = [pairs[i:i + BLOCK_ROWS] for i in range(0, len(pairs), BLOCK_ROWS)]
+            self._keys = [[k for k, _ in block] for block in blocks]
+            self._rows = [[r for _, r in block] for block in blocks]
+            self._firsts = [keys[0] for keys in self._keys]
+            self._owned = [True] * len(blocks)
+            self._size = len(pairs)
+            return
+
+        for key, row in new:
+            b, i = self._find(key)
+            self._own(b)
+            keys, rows = self._keys[b], self._rows[b]
+            keys.insert(i, key)
+            rows.insert(i, row)
+            if i == 0:
+                self._firsts[b] = key
+            if len(keys) > 2 * BLOCK_ROWS:
+                self._keys[b + 1:b + 1] = [keys[BLOCK_ROWS:]]
+                self._rows[b + 1:b + 1] = [rows[BLOCK_ROWS:]]
+                self._firsts.insert(b + 1, keys[BLOCK_ROWS])
+                self._owned.insert(b + 1, True)
+                del keys[BLOCK_ROWS:], rows[BLOCK_ROWS:]
+        self._size += len(new)
+
+    def view(self) -> "RowsView":
+        """Point-in-time view (rows are shared, they are never modified)."""
+        self._owned = [False] * len(self._keys)
+        return RowsView(list(self._firsts), list(self._keys), list(self._rows))
+
+
+class RowsView:
+    """
+    Immutable view of one output as of one build: rows in key order, by
+    position, by key or by key range.
+    """
+    __slots__ = ("_firsts", "_keys", "_rows", "_starts", "_size")
+
+    def __init__(
+        self,
+        firsts: Sequence[Hashable] = (),
+        keys: Sequence[List[Hashable]] = (),
+        rows: Sequence[List[dict]] = (),
+    ) -> None:
+        self._firsts = firsts
+        self._keys = keys
+        self._rows = rows
+        # position of the first row of each block, and the row count last
+        self._starts = list(itertools.accumulate(map(len, rows), initial=0))
+        self._size = self._starts[-1]
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __iter__(self) -> Iterator[dict]:
+        return itertools.chain.from_iterable(self._rows)
+
+    def __getitem__(self, positions: slice) -> List[dict]:
+        """Rows in a range of positions (view[start:stop])."""
+        start, stop, _ = positions.indices(self._size)
+        out: List[dict] = []
+        b = bisect_right(self._starts, start) - 1
+        while start < stop and b < len(self._rows):
+            offset = self._starts[b]
+            out.extend(self._rows[b][start - offset:stop - offset])
+            start = offset + len(self._rows[b])
+            b += 1
+        return out
+
+    def items(self) -> Iterator[Tuple[Hashable, dict]]:
+        for keys, rows in zip(self._keys, self._rows):
+            yield from zip(keys, rows)
+
+    def get(self, key: Hashable) -> Optional[dict]:
+        b = bisect_right(self._firsts, key) - 1
+        if b < 0:
+            return None
+        keys = self._keys[b]
+        i = bisect_left(keys, key)
+        return self._rows[b][i] if i < len(keys) and keys[i] == key else None
+
+    def range(self, low: Hashable, high: Hashable) -> List[dict]:
+        """Rows with low <= key < high, in key order."""
+        out: List[dict] = []
+        b = max(bisect_right(self._firsts, low) - 1, 0)
+        while b < len(self._keys):
+            keys = self._keys[b]
+            i = bisect_left(keys, low)
+            j = bisect_left(keys, high, i)
+            out.extend(self._rows[b][i:j])
+            if j < len(keys):
+                break
+            b += 1
+        return out
+
+
+class RowChanges:
+    """
+    Net changes of one output: the current row of each key whose row is new
+    or different, and the keys whose row was removed (a key is in one or
+    the other, whichever happened last).
+    """
+    __slots__ = ("rows", "removed")
+
+    def __init__(self) -> None:
+        self.rows: Dict[Hashable, dict] = {}
+        self.removed: Set[Hashable] = set()
+
+    def put(self, key: Hashable, row: dict) -> None:
+        self.removed.discard(key)
+        self.rows[key] = row
+
+    def remove(self, key: Hashable) -> None:
+        self.rows.pop(key, None)
+        self.removed.add(key)
+
+    def __len__(self) -> int:
+        return len(self.rows) + len(self.removed)
+
+
+class IncrementalOutputs:
+    """
+    Output rows maintained across emits.
+
+    Goal aggregates track which keys changed since the last emit
+    (`take_dirty`); only those rows are recomputed and formatted, untouched
+    rows are reused as is. The first build (or a build after a restore)
+    covers everything. Produces the same rows as the full builders.
+
+    Rows are returned as RowsViews that later builds do not change.
+    With `track_changes`, rows that changed or were removed are collected
+    per goal until take_changes() (a row recomputed equal is not a change).
+    With `ndc_index`, Goal 2 rows are also kept in (ndc, npi) order, for
+    queries by ndc (goal2_by_ndc_view).
+    """
+
+    def __init__(
+        self, top_quantities: int = TOP_QUANTITIES, track_changes: bool = False, ndc_index: bool = False
+    ) -> None:
+        self.top_quantities = top_quantities
+        self._goal2 = _SortedRows()
+        self._goal3 = _SortedRows()
+        self._goal4 = _SortedRows()
+        # Goal 2 rows by (ndc, npi), sharing the row dicts of _goal2
+        self._goal2_by_ndc = _SortedRows() if ndc_index else None
+        # goals whose rows were built in full at least once
+        self._primed: Set[str] = set()
+        self._changes: Optional[Tuple[RowChanges, RowChanges, RowChanges]] = (
+            (RowChanges(), RowChanges(), RowChanges()) if track_changes else None
+        )
+
+    def build(self, state) -> Tuple[RowsView, RowsView, RowsView]:
+        return self.goal2_rows(state), self.goal3_rows(state), self.goal4_rows(state)
+
+    def views(self) -> Tuple[RowsView, RowsView, RowsView]:
+        """Rows as of the last build, safe to read from other threads."""
+        return self._goal2.view(), self._goal3.view(), self._goal4.view()
+
+    def goal2_by_ndc_view(self) -> RowsView:
+        """Goal 2 rows as of the last build, keyed and ordered by (ndc, npi) (needs `ndc_index`)."""
+        if self._goal2_by_ndc is None:
+            raise ValueError("IncrementalOutputs was created without ndc_index")
+        return self._goal2_by_ndc.view()
+
+    def take_changes(self) -> Tuple[RowChanges, RowChanges, RowChanges]:
+        """Goal 2, 3 and 4 row changes since the previous call (needs `track_changes`)."""
+        changes = self._changes
+        self._changes = (RowChanges(), RowChanges(), RowChanges())
+        return changes
+
+    def goal2_rows(self, state) -> RowsView:
+        self._update_goal2(state, self._dirty(state.goal2, "goal2", lambda: set(state.goal2.snapshot())))
+        return self._goal2.view()
+
+    def goal3_rows(self, state) -> RowsView:
+        self._update_goal3(state, self._dirty(state.goal3, "goal3", lambda: set(state.goal3.ndcs())))
+        return self._goal3.view()
+
+    def goal4_rows(self, state) -> RowsView:
+        self._update_goal4(state, self._dirty(state.goal4, "goal4", lambda: set(state.goal4.ndcs())))
+        return self._goal4.view()
+
+    def _dirty(self, goal, name: str, all_keys: Callable[[], Set]) -> Set:
+        dirty = goal.take_dirty()
+        if name in self._primed:
+            return dirty
+        self._primed.add(name)
+        return all_keys()
+
+    def _update_goal2(self, state, dirty: Set[Tuple[str, str]]) -> None:
+        money = state.money
+        snap = state.goal2.snapshot()
+
+        changes = self._changes[0] if self._changes is not None else None
+        by_ndc = self._goal2_by_ndc
+        new: List[Tuple[Any, dict]] = []
+        new_by_ndc: List[Tuple[Any, dict]] = []
+        for key in dirty:
+            agg = snap.get(key)
+            if agg is None:
+                if self._goal2.remove(key):
+                    if changes is not None:
+                        changes.remove(key)
+                    if by_ndc is not None:
+                        by_ndc.remove((key[1], key[0]))
+            else:
+                row = goal2_row(key[0], key[1], agg, money)
+                if self._goal2.put(key, row, new):
+                    if changes is not None:
+                        changes.put(key, row)
+                    if by_ndc is not None:
+                        by_ndc.put((key[1], key[0]), row, new_by_ndc)
+        self._goal2.add_new(new)
+        if by_ndc is not None:
+            by_ndc.add_new(new_by_ndc)
+
+    def _update_goal3(self, state, dirty: Set[str]) -> None:
+        changes = self._changes[1] if self._changes is not None else None
+        new: List[Tuple[Any, dict]] = []
+        for ndc in dirty:
+            row = goal3_row(ndc, state.goal3.top(ndc, 2))
+            if row is None:
+                if self._goal3.remove(ndc) and changes is not None:
+                    changes.remove(ndc)
+            elif self._goal3.put(ndc, row, new) and changes is not None:
+                changes.put(ndc, row)
+        self._goal3.add_new(new)
+
+    def _update_goal4(self, state, dirty: Set[str]) -> None:
+        changes = self._changes[2] if self._changes is not None else None
+        new: List[Tuple[Any, dict]] = []
+        for ndc in dirty:
+            row = goal4_row(ndc, state.goal4.top(ndc, self.top_quantities))
+            if row is None:
+                if self._goal4.remove(ndc) and changes is not None:
+                    changes.remove(ndc)
+            elif self._goal4.put(ndc, row, new) and changes is not None:
+                changes.put(ndc, row)
+        self._goal4.add_new(new)
@@ -1,6 +1,8 @@
 import json
 from pathlib import Path
-from typing import Any
+from typing import Any, Iterable
+
+_COMPACT = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"))
 
 
 def write_json_atomic(path: Path, data: Any) -> None:
@@ -10,3 +12,16 @@ def write_json_atomic(path: Path, data: Any) -> None:
         json.dump(data, f, ensure_ascii=False, indent=2)
 
     tmp.replace(path)
+
+
+def write_jsonl_atomic(path: Path, records: Iterable[Any]) -> int:
+    """Writes one compact JSON value per line; returns the bytes written."""
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    encode = _COMPACT.encode
+
+    with tmp.open("w", encoding="utf-8") as f:
+        f.writelines(encode(r) + "\n" for r in records)
+        size = f.tell()
+
+    tmp.replace(path)
+    return size
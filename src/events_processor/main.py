@@ -1,35 +1,196 @@
 import argparse
+import functools
+import itertools
+import signal
 import time
+from contextlib import contextmanager
 from pathlib import Path
+from typing import Iterator, Optional, Union
 
 from events_processor.core.state import InMemoryState
 from events_processor.core.processor import EventProcessor
+from events_processor.core.money import MONEY_ENGINES
+from events_processor.core.pending import PendingReverts
+from events_processor.core.unknown import UnknownPharmacyClaims
+from events_processor.core.claim_store import CompactClaimStore, DictClaimStore
+from events_processor.core.sqlite_state import DEFAULT_CACHE_SIZE, SqliteClaimStore, SqliteDatabase, SqliteDedup
+from events_processor.core.dedup import (
+    DEDUP_KINDS,
+    DEFAULT_CAPACITY,
+    DEFAULT_FP_RATE,
+    DEFAULT_WINDOW_SECONDS,
+    new_dedup,
+)
 
-from events_processor.sources.discover import discover_files
-from events_processor.sources.pharmacies import load_pharmacies_csv
-from events_processor.sources.events_json import iter_claim_events, iter_revert_events
+from events_processor.sources.discover import DEFAULT_EXCLUDE, FileFilter, ScanStats, discover_files
+from events_processor.sources.pharmacies import PharmacySnapshotWatcher, load_pharmacies_csv
+from events_processor.sources.events_json import JsonInput, iter_claim_records, iter_revert_items
 from events_processor.sources.streaming import FileStreamWatcher
+from events_processor.sources.inotify import DirectoryNotifier
+from events_processor.parallel import process_files_parallel
+from events_processor.pipeline import EVENT_BATCH, process_files_pipelined
+from events_processor.sharded import ShardedProcessor
+from events_processor.columnar import ColumnarProcessor, ColumnarTooLarge, columnar_available
+from events_processor.checkpoint import load_checkpoint, save_checkpoint
+from events_processor.metrics import Metrics, start_metrics_server
+from events_processor.query import QueryStore, start_query_server
 
 from events_processor.destination.builders import (
     build_goal2_metrics,
     build_goal3_top2_chains,
     build_goal4_top_quantities,
+    TOP_QUANTITIES,
 )
+from events_processor.destination.changelog import DEFAULT_SNAPSHOT_EVERY, DeltaLog
+from events_processor.destination.incremental import IncrementalOutputs
 from events_processor.destination.writer import write_json_atomic
 
 
-def process_files(processor: EventProcessor, claim_files: list[Path], revert_files: list[Path]) -> None:
-    for ev in iter_claim_events(claim_files):
-        processor.handle(ev)
+def process_files(
+    processor: Union[EventProcessor, ShardedProcessor],
+    claim_files: list[JsonInput],
+    revert_files: list[JsonInput],
+    workers: int = 1,
+    metrics: Optional[Metrics] = None,
+    readers: int = 0,
+) -> None:
+    if metrics is None:
+        metrics = Metrics()
+    metrics.add_files("claim", claim_files)
+    metrics.add_files("revert", revert_files)
+
+    if isinstance(processor, ShardedProcessor):
+        processor.process_files(claim_files, revert_files, metrics)
+        return
+    if workers > 1:
+        process_files_parallel(processor, claim_files, revert_files, workers, metrics)
+        return
+    if readers > 0:
+        process_files_pipelined(processor, claim_files, revert_files, readers, metrics)
+        return
+
+    money = processor.state.money
+    _apply_items(processor.apply_claims, iter_claim_records(claim_files, money), "claim", metrics)
+    _apply_items(processor.apply_reverts, iter_revert_items(revert_files), "revert", metrics)
+
+
+def _apply_items(apply, items, kind: str, metrics: Metrics) -> None:
+    # parsed and applied a batch at a time (parse and apply timed per batch)
+    while True:
+        with metrics.timed("parse"):
+            batch = list(itertools.islice(items, EVENT_BATCH))
+        if not batch:
+            return
+        with metrics.timed("apply"):
+            apply(batch)
+        metrics.add_events(kind, len(batch))
 
-    for ev in iter_revert_events(revert_files):
-        processor.handle(ev)
 
+def write_outputs(
+    out_dir: Path,
+    state: InMemoryState,
+    outputs: Optional[IncrementalOutputs] = None,
+    metrics: Optional[Metrics] = None,
+    changelog: Optional[DeltaLog] = None,
+) -> None:
+    """
+    Writes the three output files, or with a `changelog` (outputs tracking
+    changes) only the rows that changed since the previous call.
+    """
+    if metrics is None:
+        metrics = Metrics()
 
-def write_outputs(out_dir: Path, state: InMemoryState) -> None:
-    write_json_atomic(out_dir / "metrics_by_npi_ndc.json", build_goal2_metrics(state))
-    write_json_atomic(out_dir / "top2_chain_per_ndc.json", build_goal3_top2_chains(state))
-    write_json_atomic(out_dir / "most_common_qty_per_ndc.json", build_goal4_top_quantities(state))
+    with metrics.timed("build_goal2"):
+        goal2 = build_goal2_metrics(state) if outputs is None else outputs.goal2_rows(state)
+    with metrics.timed("build_goal3"):
+        goal3 = build_goal3_top2_chains(state) if outputs is None else outputs.goal3_rows(state)
+    with metrics.timed("build_goal4"):
+        goal4 = build_goal4_top_quantities(state) if outputs is None else outputs.goal4_rows(state)
+    if changelog is not None:
+        with metrics.timed("write"):
+            changelog.emit((goal2, goal3, goal4), outputs.take_changes())
+        return
+    write_rows(out_dir, list(goal2), list(goal3), list(goal4), metrics)
+
+
+def write_rows(out_dir: Path, goal2: list[dict], goal3: list[dict], goal4: list[dict], metrics: Metrics) -> None:
+    with metrics.timed("write"):
+        write_json_atomic(out_dir / "metrics_by_npi_ndc.json", goal2)
+        write_json_atomic(out_dir / "top2_chain_per_ndc.json", goal3)
+        write_json_atomic(out_dir / "most_common_qty_per_ndc.json", goal4)
+
+
+def columnar_unsupported(args: argparse.Namespace) -> Optional[str]:
+    """Why --engine columnar cannot run with these options, or None."""
+    if not columnar_available():
+        return "numpy is not installed"
+    if args.dedup != "exact":
+        return f"--dedup {args.dedup}"
+    if args.pending_max_size is not None or args.pending_max_age is not None:
+        return "bounded pending reverts"
+    if args.workers > 1 or args.readers > 0 or args.shards > 1:
+        return "--workers/--readers/--shards"
+    return None
+
+
+def run_columnar(
+    args: argparse.Namespace,
+    out_dir: Path,
+    pharmacies: dict[str, str],
+    claim_files: list[JsonInput],
+    revert_files: list[JsonInput],
+    metrics: Metrics,
+) -> Optional[ColumnarProcessor]:
+    """Batch run with the columnar engine; None if the data does not fit it (nothing written)."""
+    processor = ColumnarProcessor(pharmacies, args.top_quantities)
+    metrics.bind(processor)
+    try:
+        processor.process_files(claim_files, revert_files, metrics)
+    except ColumnarTooLarge as exc:
+        print(f"Columnar engine stopped ({exc}), processing with the event engine")
+        return None
+    metrics.add_files("claim", claim_files)
+    metrics.add_files("revert", revert_files)
+    write_rows(out_dir, processor.goal2, processor.goal3, processor.goal4, metrics)
+    return processor
+
+
+def report_pharmacy_changes(processor: Union[EventProcessor, ShardedProcessor], pharmacies: dict[str, str]) -> bool:
+    """Applies a reloaded pharmacy snapshot and prints what changed; False if nothing did."""
+    admitted = processor.counters.late_pharmacy_claims
+    changes = processor.update_pharmacies(pharmacies)
+    if changes:
+        print(
+            f"Pharmacies reloaded: added={len(changes.added)}, removed={len(changes.removed)}, "
+            f"chain changed={len(changes.changed)}, "
+            f"admitted claims={processor.counters.late_pharmacy_claims - admitted}"
+        )
+    return bool(changes)
+
+
+@contextmanager
+def deferred_interrupt() -> Iterator[None]:
+    """
+    Holds back Ctrl+C (SIGINT) until the block ends and raises
+    KeyboardInterrupt then, so a streaming poll is applied completely before
+    the final checkpoint; a second Ctrl+C raises it at once.
+    """
+    received = False
+
+    def handler(signum, frame) -> None:
+        nonlocal received
+        if received:
+            raise KeyboardInterrupt
+        received = True
+        print("Stopping after the current poll (Ctrl+C again to stop now)")
+
+    previous = signal.signal(signal.SIGINT, handler)
+    try:
+        yield
+    finally:
+        signal.signal(signal.SIGINT, previous)
+    if received:
+        raise KeyboardInterrupt
 
 
 def main() -> None:
@@ -39,52 +200,414 @@ def main() -> None:
     parser.add_argument("--reverts", nargs="+", required=True, help="Dirs with reverts JSON files")
     parser.add_argument("--out", required=True, help="Output directory")
     parser.add_argument("--streaming", action="store_true", help="Watch directories for new files")
-    parser.add_argument("--poll-interval", type=int, default=120, help="Polling interval seconds for --streaming")
+    parser.add_argument(
+        "--include",
+        action="append",
+        default=[],
+        help="Only pick up input files whose name matches this pattern (e.g. 'claims_*'); repeatable",
+    )
+    parser.add_argument(
+        "--exclude",
+        action="append",
+        default=[],
+        help=(
+            "Skip files and directories whose name matches this pattern; repeatable "
+            f"(--streaming always skips {list(DEFAULT_EXCLUDE)})"
+        ),
+    )
+    parser.add_argument(
+        "--poll-interval",
+        type=int,
+        default=120,
+        help="Polling interval seconds for --streaming (max wait per cycle with inotify)",
+    )
+    parser.add_argument(
+        "--watch",
+        choices=["auto", "inotify", "poll"],
+        default="auto",
+        help="--streaming file detection: inotify events (Linux) or directory polling; auto prefers inotify",
+    )
+    parser.add_argument("--workers", type=int, default=1, help="Worker processes for parsing input files")
+    parser.add_argument(
+        "--readers",
+        type=int,
+        default=0,
+        help="Background threads reading and parsing files ahead of event application (0: inline)",
+    )
+    parser.add_argument(
+        "--shards",
+        type=int,
+        default=1,
+        help="Worker processes holding the state, split by claim id (outputs merged on each update)",
+    )
+    parser.add_argument(
+        "--money",
+        choices=sorted(MONEY_ENGINES),
+        default="decimal",
+        help="Numeric engine for prices: exact Decimals or fixed-point integer nano-units",
+    )
+    parser.add_argument(
+        "--engine",
+        choices=["events", "columnar"],
+        default="events",
+        help="Batch mode: apply events one at a time, or resolve them as NumPy columns "
+        "(requires --money fixed; falls back to events without numpy or with unsupported options)",
+    )
+    parser.add_argument(
+        "--claim-store",
+        choices=["dict", "compact"],
+        default="dict",
+        help="Claim history layout: one record per claim, or interned columnar arrays",
+    )
+    parser.add_argument(
+        "--state-backend",
+        choices=["memory", "sqlite"],
+        default="memory",
+        help="Where claims and exact dedup ids live: in memory, or in a SQLite file on local disk",
+    )
+    parser.add_argument(
+        "--state-db",
+        help="SQLite file for --state-backend sqlite, recreated at start (default: OUT/state.sqlite3)",
+    )
+    parser.add_argument(
+        "--state-cache",
+        type=int,
+        default=DEFAULT_CACHE_SIZE,
+        help="Recently used claims kept in memory in front of --state-backend sqlite",
+    )
+    parser.add_argument(
+        "--dedup",
+        choices=DEDUP_KINDS,
+        default="exact",
+        help="Claim/revert id dedup: every id, ids within an event-time window, or a Bloom filter",
+    )
+    parser.add_argument(
+        "--dedup-window",
+        type=float,
+        default=DEFAULT_WINDOW_SECONDS,
+        help="Event-time window in seconds for --dedup window",
+    )
+    parser.add_argument(
+        "--dedup-capacity",
+        type=int,
+        default=DEFAULT_CAPACITY,
+        help="Ids per Bloom filter generation for --dedup bloom",
+    )
+    parser.add_argument(
+        "--dedup-fp-rate",
+        type=float,
+        default=DEFAULT_FP_RATE,
+        help="False-positive rate for --dedup bloom",
+    )
+    parser.add_argument(
+        "--pending-max-size",
+        type=int,
+        help="Max claim ids with reverts waiting for their claim (least recently used evicted first)",
+    )
+    parser.add_argument(
+        "--pending-max-age",
+        type=float,
+        help="Evict reverts waiting for their claim this many seconds (event time) behind the newest one",
+    )
+    parser.add_argument(
+        "--unknown-max-size",
+        type=int,
+        default=1_000_000,
+        help="Claims from unknown pharmacies kept in --streaming mode, admitted if a pharmacy reload adds the npi",
+    )
+    parser.add_argument(
+        "--top-quantities",
+        type=int,
+        default=TOP_QUANTITIES,
+        help="Most common quantities listed per ndc",
+    )
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        help="Serve Prometheus metrics on http://127.0.0.1:PORT/metrics",
+    )
+    parser.add_argument(
+        "--query-port",
+        type=int,
+        help="In --streaming mode, serve the current output rows as JSON queries on http://127.0.0.1:PORT/v1/",
+    )
+    parser.add_argument(
+        "--log-interval",
+        type=float,
+        default=0,
+        help="Seconds between JSON metrics log lines in --streaming mode (0: off)",
+    )
+    parser.add_argument(
+        "--output-mode",
+        choices=["full", "delta"],
+        default="full",
+        help="--streaming outputs: rewrite the output files on each update, or append changed rows to OUT/changes",
+    )
+    parser.add_argument(
+        "--snapshot-every",
+        type=int,
+        default=DEFAULT_SNAPSHOT_EVERY,
+        help="With --output-mode delta, write a full snapshot every this many deltas",
+    )
+    parser.add_argument("--checkpoint", help="Checkpoint file for --streaming state")
+    parser.add_argument(
+        "--checkpoint-interval",
+        type=int,
+        default=300,
+        help="Minimum seconds between checkpoints written after a poll",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Start --streaming from --checkpoint (if it exists) and process only new files",
+    )
 
     args = parser.parse_args()
+    if (args.checkpoint or args.resume) and not args.streaming:
+        parser.error("--checkpoint/--resume are only supported with --streaming")
+    if args.query_port is not None and not args.streaming:
+        parser.error("--query-port is only supported with --streaming")
+    if args.output_mode == "delta" and not args.streaming:
+        parser.error("--output-mode delta is only supported with --streaming")
+    if args.snapshot_every <= 0:
+        parser.error("--snapshot-every must be positive")
+    if args.resume and not args.checkpoint:
+        parser.error("--resume requires --checkpoint")
+    if args.readers > 0 and args.workers > 1:
+        parser.error("--readers and --workers are alternatives")
+    if args.shards > 1 and (args.readers > 0 or args.workers > 1):
+        parser.error("--shards replaces --readers and --workers")
+    if args.shards > 1 and args.checkpoint:
+        parser.error("--checkpoint is not supported with --shards")
+    if args.dedup_window <= 0 or args.dedup_capacity <= 0 or not 0 < args.dedup_fp_rate < 1:
+        parser.error("--dedup-window and --dedup-capacity must be positive, --dedup-fp-rate in (0, 1)")
+    if (args.pending_max_size is not None and args.pending_max_size < 0) or (
+        args.pending_max_age is not None and args.pending_max_age < 0
+    ):
+        parser.error("--pending-max-size and --pending-max-age must not be negative")
+    if args.unknown_max_size < 0:
+        parser.error("--unknown-max-size must not be negative")
+    if args.state_backend == "sqlite" and (args.checkpoint or args.shards > 1):
+        parser.error("--state-backend sqlite does not support --checkpoint or --shards")
+    if args.state_cache <= 0:
+        parser.error("--state-cache must be positive")
+    if args.top_quantities < 1:
+        parser.error("--top-quantities must be positive")
+    if args.engine == "columnar" and args.streaming:
+        parser.error("--engine columnar is only supported in batch mode")
+    if args.engine == "columnar" and args.money != "fixed":
+        # the columns hold fixed-point prices; Decimal prices may have more digits
+        parser.error("--engine columnar requires --money fixed")
 
     out_dir = Path(args.out)
     out_dir.mkdir(parents=True, exist_ok=True)
 
-    # load pharmacy snapshot
-    pharm_files = discover_files(args.pharmacies).csv_files
-    state = InMemoryState()
-    state.pharmacy_chain_by_npi = load_pharmacies_csv(pharm_files)
+    filters = FileFilter(args.include, (DEFAULT_EXCLUDE if args.streaming else ()) + tuple(args.exclude))
+    # load pharmacy snapshot (reloaded when the files change in streaming mode)
+    pharmacy_watcher = PharmacySnapshotWatcher(args.pharmacies, filters)
+    money = MONEY_ENGINES[args.money]
+    state_db = None
+    if args.state_backend == "sqlite":
+        state_db = SqliteDatabase(args.state_db or out_dir / "state.sqlite3")
+        claims = SqliteClaimStore(state_db, money, args.state_cache)
+    else:
+        claims = CompactClaimStore(money) if args.claim_store == "compact" else DictClaimStore()
+    dedup = functools.partial(
+        new_dedup, args.dedup, args.dedup_window, args.dedup_capacity, args.dedup_fp_rate
+    )
+    state = InMemoryState.with_money(money, claims, dedup)
+    if state_db is not None and args.dedup == "exact":
+        # bounded dedups (window, bloom) stay in memory
+        state.seen_claim_ids = SqliteDedup(state_db, "claim_ids")
+        state.seen_revert_ids = SqliteDedup(state_db, "revert_ids")
+    state.pharmacy_chain_by_npi = load_pharmacies_csv(pharmacy_watcher.files)
+    state.pending_reverts = PendingReverts(args.pending_max_size, args.pending_max_age)
+    if args.streaming:
+        state.unknown_claims = UnknownPharmacyClaims(args.unknown_max_size)
 
-    processor = EventProcessor(state)
+    # a batch run derives Goal 3 from Goal 2 once, after all events
+    processor = EventProcessor(state, track_goal3=args.streaming)
+    if args.shards > 1:
+        processor = ShardedProcessor(state, args.shards)
+        # merged goal aggregates of all shards, for the outputs
+        state = processor.state
+    metrics = Metrics()
+    metrics.bind(processor)
+    metrics_server = None
+    if args.metrics_port is not None:
+        metrics_server = start_metrics_server(metrics, args.metrics_port)
+        print(f"Metrics on http://127.0.0.1:{metrics_server.server_address[1]}/metrics")
 
     # batch mode
     if not args.streaming:
-        claim_files = discover_files(args.claims).json_files
-        revert_files = discover_files(args.reverts).json_files
+        scan = ScanStats()
+        with metrics.timed("discover"):
+            claim_files = discover_files(args.claims, filters=filters, stats=scan).json_files
+            revert_files = discover_files(args.reverts, filters=filters, stats=scan).json_files
+        metrics.add_scan(scan)
+        print(
+            f"Discovered claim files={len(claim_files)}, revert files={len(revert_files)} "
+            f"in {scan.seconds:.3f}s (directories={scan.dirs}, entries scanned={scan.entries})"
+        )
 
-        process_files(processor, claim_files, revert_files)
-        write_outputs(out_dir, state)
+        columnar = None
+        if args.engine == "columnar":
+            reason = columnar_unsupported(args)
+            if reason is None:
+                columnar = run_columnar(args, out_dir, state.pharmacy_chain_by_npi, claim_files, revert_files, metrics)
+            else:
+                print(f"Columnar engine unavailable ({reason}), using the event engine")
+        if columnar is not None:
+            processor = columnar
+        else:
+            metrics.bind(processor)
+            process_files(processor, claim_files, revert_files, args.workers, metrics, args.readers)
+            if not isinstance(processor, ShardedProcessor):
+                with metrics.timed("apply"):
+                    processor.rebuild_goal3()
+            write_outputs(out_dir, state, IncrementalOutputs(args.top_quantities), metrics)
 
         print("Done.")
         print("Counters:", processor.counters)
+        if isinstance(processor, ShardedProcessor):
+            processor.close()
+        if metrics_server is not None:
+            metrics_server.shutdown()
+        if state_db is not None:
+            state_db.close()
         return
 
     # streaming mode
     watcher = FileStreamWatcher(
         claim_dirs=[Path(p) for p in args.claims],
         revert_dirs=[Path(p) for p in args.reverts],
+        filters=filters,
     )
 
+    checkpoint_path = Path(args.checkpoint) if args.checkpoint else None
+    if args.resume and checkpoint_path.exists():
+        # the checkpoint's money engine, claim store layout and dedup take precedence
+        state, counters, positions, seconds = load_checkpoint(checkpoint_path)
+        pharmacies = processor.state.pharmacy_chain_by_npi
+        processor = EventProcessor(state)
+        processor.counters = counters
+        metrics.bind(processor)
+        watcher.restore_positions(positions)
+        print(f"Resumed from checkpoint {checkpoint_path} in {seconds:.3f}s")
+        # pharmacy files changed while stopped
+        report_pharmacy_changes(processor, pharmacies)
+
+    def checkpoint() -> None:
+        with metrics.timed("checkpoint"):
+            seconds = save_checkpoint(checkpoint_path, processor, watcher)
+        size = checkpoint_path.stat().st_size
+        print(f"Checkpoint written in {seconds:.3f}s ({size} bytes)")
+
+    last_checkpoint = last_log = time.monotonic()
+    # rebuilds only rows whose aggregates changed since the previous poll
+    outputs = IncrementalOutputs(
+        args.top_quantities, track_changes=args.output_mode == "delta", ndc_index=args.query_port is not None
+    )
+    changelog = None
+    if args.output_mode == "delta":
+        changelog = DeltaLog(out_dir / "changes", args.snapshot_every)
+
+    query_store = query_server = None
+    if args.query_port is not None:
+        query_store = QueryStore()
+        # rows of a resumed state are queryable before the first new file
+        outputs.build(state)
+        query_store.publish(outputs)
+        query_server = start_query_server(query_store, args.query_port)
+        print(f"Queries on http://127.0.0.1:{query_server.server_address[1]}/v1/")
+
+    # set up before the first scan so files created in between are not missed
+    notifier = None
+    if args.watch != "poll":
+        try:
+            notifier = DirectoryNotifier(watcher.claim_dirs | watcher.revert_dirs | pharmacy_watcher.dirs())
+        except OSError as exc:
+            if args.watch == "inotify":
+                raise SystemExit(f"--watch inotify: {exc}")
+            print(f"inotify unavailable ({exc}), polling every {args.poll_interval}s")
+
     print("Running in --streaming mode (Ctrl+C to stop)")
+    # None: full directory scan; otherwise only the notified paths are checked
+    changed: Optional[list[Path]] = None
+    # False while a poll is under way: the watcher hands out file slices
+    # (moving its positions) before their events are applied, so a checkpoint
+    # is only consistent between polls
+    between_polls = True
+    pharmacy_error: Optional[str] = None
     try:
         while True:
-            new_claim_files, new_revert_files = watcher.discover_new_files()
+            with deferred_interrupt():
+                between_polls = False
+                with metrics.timed("discover"):
+                    if changed is None:
+                        # with a notifier, a rescan may follow lost notifications of appends
+                        new_claim_files, new_revert_files = watcher.discover_new_files(full=notifier is not None)
+                        metrics.add_scan(watcher.scan_stats())
+                    else:
+                        new_claim_files, new_revert_files = watcher.check_files(changed, notifier.closed)
+                    pharmacies = pharmacy_watcher.poll()
+                if pharmacy_watcher.error != pharmacy_error:
+                    pharmacy_error = pharmacy_watcher.error
+                    if pharmacy_error is not None:
+                        print(f"Pharmacy reload failed, keeping the current snapshot: {pharmacy_error}")
+
+                reloaded = False
+                if pharmacies is not None:
+                    with metrics.timed("apply"):
+                        reloaded = report_pharmacy_changes(processor, pharmacies)
+
+                if new_claim_files or new_revert_files:
+                    metrics.files_backlog = len(new_claim_files) + len(new_revert_files)
+                    process_files(processor, new_claim_files, new_revert_files, args.workers, metrics, args.readers)
+                    metrics.files_backlog = 0
+
+                if new_claim_files or new_revert_files or reloaded:
+                    write_outputs(out_dir, state, outputs, metrics, changelog)
+                    if query_store is not None:
+                        query_store.publish(outputs)
+                    msg = f"Processed new data: claim files={len(new_claim_files)}, revert files={len(new_revert_files)}"
+                    if notifier is not None and notifier.first_event_at is not None:
+                        metrics.last_latency = time.monotonic() - notifier.first_event_at
+                        msg += f", event-to-output latency={metrics.last_latency:.3f}s"
+                    print(msg)
+
+                    if checkpoint_path and time.monotonic() - last_checkpoint >= args.checkpoint_interval:
+                        checkpoint()
+                        last_checkpoint = time.monotonic()
+                between_polls = True
 
-            if new_claim_files or new_revert_files:
-                process_files(processor, new_claim_files, new_revert_files)
-                write_outputs(out_dir, state)
-                print(f"Processed new files: claims={len(new_claim_files)}, reverts={len(new_revert_files)}")
+            if args.log_interval > 0 and time.monotonic() - last_log >= args.log_interval:
+                print(metrics.log_line())
+                last_log = time.monotonic()
 
-            time.sleep(args.poll_interval)
+            if notifier is None:
+                time.sleep(args.poll_interval)
+            else:
+                # whole files waiting to settle are checked again sooner
+                changed = notifier.wait(watcher.settle if watcher.has_pending() else args.poll_interval)
 
     except KeyboardInterrupt:
+        if checkpoint_path and between_polls:
+            checkpoint()
+        elif checkpoint_path:
+            print(f"Stopped inside a poll: {checkpoint_path} keeps the state of the last checkpoint")
         print("Final counters:", processor.counters)
+    finally:
+        if notifier is not None:
+            notifier.close()
+        if isinstance(processor, ShardedProcessor):
+            processor.close()
+        if query_server is not None:
+            query_server.shutdown()
+        if metrics_server is not None:
+            metrics_server.shutdown()
+        if state_db is not None:
+            state_db.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,205 @@
+import json
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, Optional
+
+from events_processor.sources.discover import ScanStats
+from events_processor.sources.events_json import FileSlice, JsonInput
+
+# pipeline stages with timings; "parse" includes reading the files
+STAGES = (
+    "discover",
+    "parse",
+    "apply",
+    "merge",
+    "build_goal2",
+    "build_goal3",
+    "build_goal4",
+    "write",
+    "checkpoint",
+)
+
+PREFIX = "events_processor"
+
+
+class Metrics:
+    """
+    Runtime instrumentation: time and runs per stage, events and files
+    processed, the current file backlog and, through the bound processor,
+    state sizes and data quality counters.
+
+    Updated by the processing thread only; readers (the metrics endpoint)
+    take copies.
+    """
+
+    def __init__(self) -> None:
+        self.stage_seconds: Dict[str, float] = dict.fromkeys(STAGES, 0.0)
+        self.stage_runs: Dict[str, int] = dict.fromkeys(STAGES, 0)
+        self.events: Dict[str, int] = {"claim": 0, "revert": 0}
+        self.files: Dict[str, int] = {"claim": 0, "revert": 0}
+        self.bytes_read = 0
+        # directory scans: directories checked / listed, entries read (cumulative)
+        self.scan: Dict[str, int] = {"dirs": 0, "dirs_listed": 0, "entries": 0}
+        self.last_scan_seconds = 0.0
+        self.files_backlog = 0
+        self.last_latency: Optional[float] = None
+        self.processor = None
+        self._started = time.monotonic()
+        self._last_log = (self._started, 0)
+
+    def bind(self, processor) -> None:
+        """Processor whose state sizes and counters are reported."""
+        self.processor = processor
+
+    @contextmanager
+    def timed(self, stage: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stage_seconds[stage] += time.perf_counter() - start
+            self.stage_runs[stage] += 1
+
+    def add_files(self, kind: str, files: Iterable[JsonInput]) -> None:
+        for item in files:
+            self.files[kind] += 1
+            self.bytes_read += _input_size(item)
+
+    def add_scan(self, stats: ScanStats) -> None:
+        self.scan["dirs"] += stats.dirs
+        self.scan["dirs_listed"] += stats.dirs_listed
+        self.scan["entries"] += stats.entries
+        self.last_scan_seconds = stats.seconds
+
+    def add_events(self, kind: str, n: int) -> None:
+        self.events[kind] += n
+
+    def state_sizes(self) -> Dict[str, int]:
+        if self.processor is None:
+            return {}
+        if hasattr(self.processor, "state_sizes"):
+            # ShardedProcessor: the state lives in the shard processes
+            return self.processor.state_sizes()
+        state = self.processor.state
+        return {
+            "claims": len(state.claims),
+            "seen_claim_ids": len(state.seen_claim_ids),
+            "seen_revert_ids": len(state.seen_revert_ids),
+            "pending_reverts": len(state.pending_reverts),
+            "unknown_claims": len(state.unknown_claims),
+            "pharmacies": len(state.pharmacy_chain_by_npi),
+        }
+
+    def counters(self) -> Dict[str, int]:
+        if self.processor is None:
+            return {}
+        c = self.processor.counters
+        return {name: getattr(c, name) for name in c.__slots__}
+
+    def log_line(self) -> str:
+        """One JSON line; events/sec is over the time since the previous log line."""
+        now = time.monotonic()
+        total = sum(self.events.values())
+        since, events_then = self._last_log
+        self._last_log = (now, total)
+        return json.dumps(
+            {
+                "ts": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "uptime_s": round(now - self._started, 3),
+                "events": dict(self.events),
+                "events_per_sec": round((total - events_then) / (now - since), 1) if now > since else 0.0,
+                "files": dict(self.files),
+                "bytes_read": self.bytes_read,
+                "scan": dict(self.scan),
+                "last_scan_s": round(self.last_scan_seconds, 6),
+                "files_backlog": self.files_backlog,
+                "latency_s": None if self.last_latency is None else round(self.last_latency, 3),
+                "stage_seconds": {k: round(v, 3) for k, v in self.stage_seconds.items()},
+                "state": self.state_sizes(),
+                "counters": self.counters(),
+            },
+            separators=(",", ":"),
+        )
+
+    def render_prometheus(self) -> str:
+        """Prometheus text exposition format."""
+        lines = []
+
+        def metric(name: str, kind: str, help_text: str, samples: Dict[str, float], label: str = "") -> None:
+            full = f"{PREFIX}_{name}"
+            lines.append(f"# HELP {full} {help_text}")
+            lines.append(f"# TYPE {full} {kind}")
+            for key, value in samples.items():
+                labels = f'{{{label}="{key}"}}' if label else ""
+                lines.append(f"{full}{labels} {value}")
+
+        seconds = dict(self.stage_seconds)
+        runs = dict(self.stage_runs)
+        metric("stage_seconds_total", "counter", "Time spent per pipeline stage.", seconds, "stage")
+        metric("stage_runs_total", "counter", "Runs per pipeline stage.", runs, "stage")
+        metric("events_total", "counter", "Events read.", dict(self.events), "kind")
+        metric("files_total", "counter", "Files (or appended file ranges) read.", dict(self.files), "kind")
+        metric("bytes_read_total", "counter", "Input bytes read.", {"": self.bytes_read})
+        metric(
+            "scan_total",
+            "counter",
+            "Directory scans: directories checked, directories listed, entries read.",
+            dict(self.scan),
+            "item",
+        )
+        metric("last_scan_seconds", "gauge", "Duration of the last directory scan.", {"": self.last_scan_seconds})
+        metric("files_backlog", "gauge", "Files discovered but not processed yet.", {"": self.files_backlog})
+        if self.last_latency is not None:
+            metric(
+                "event_to_output_latency_seconds",
+                "gauge",
+                "Time from the first file event to written outputs, last update.",
+                {"": self.last_latency},
+            )
+        metric(
+            "uptime_seconds", "gauge", "Seconds since start.", {"": round(time.monotonic() - self._started, 3)}
+        )
+        sizes = self.state_sizes()
+        if sizes:
+            metric("state_size", "gauge", "Entries per state structure.", sizes, "structure")
+        for name, value in self.counters().items():
+            metric(f"{name}_total", "counter", f"Counter {name}.", {"": value})
+
+        return "\n".join(lines) + "\n"
+
+
+def _input_size(item: JsonInput) -> int:
+    if isinstance(item, FileSlice) and item.end is not None:
+        return item.end - item.start
+    path: Path = item.path if isinstance(item, FileSlice) else item
+    try:
+        return path.stat().st_size
+    except OSError:
+        return 0
+
+
+def start_metrics_server(metrics: Metrics, port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """Serves GET /metrics from a daemon thread; returns the server (call shutdown() to stop)."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self) -> None:
+            if self.path.split("?", 1)[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = metrics.render_prometheus().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format: str, *args) -> None:
+            pass  # no access log on stdout
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
@@ -0,0 +1,136 @@
+import itertools
+import signal
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from events_processor.core.dedup import ExactDedup, IdDedup
+from events_processor.core.money import DECIMAL_MONEY, MoneyEngine
+from events_processor.core.processor import Counters, EventProcessor
+from events_processor.core.state import InMemoryState
+from events_processor.core.unknown import UnknownPharmacyClaims
+from events_processor.metrics import Metrics
+from events_processor.pipeline import EVENT_BATCH
+from events_processor.sources.events_json import JsonInput, RevertItem, iter_claim_records, iter_revert_items
+
+# chunks per worker: small enough to balance uneven file sizes,
+# large enough to keep the number of partial states to merge low
+CHUNKS_PER_WORKER = 4
+
+_worker_pharmacies: Optional[Dict[str, str]] = None
+_worker_money: MoneyEngine = DECIMAL_MONEY
+_worker_dedup: IdDedup = ExactDedup()
+_worker_unknown = UnknownPharmacyClaims()
+_worker_track_goal3 = True
+
+
+def process_files_parallel(
+    processor: EventProcessor,
+    claim_files: List[JsonInput],
+    revert_files: List[JsonInput],
+    workers: int,
+    metrics: Optional[Metrics] = None,
+) -> None:
+    """
+    Parses files in a process pool and merges the results into `processor`.
+
+    Claim files are split into contiguous chunks; each worker builds a partial
+    claims-only state for its chunk. Partials are merged in file order, so dedup
+    ("first claim wins") and counters match a serial run. Revert files are only
+    parsed in the pool and then applied here in file order, because matching a
+    revert needs the complete claim store.
+    Time waiting for workers is recorded as "parse", merging as "apply".
+    """
+    if metrics is None:
+        metrics = Metrics()
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_init_worker,
+        initargs=(
+            processor.state.pharmacy_chain_by_npi,
+            processor.state.money,
+            processor.state.seen_claim_ids.partial(),
+            processor.state.unknown_claims.partial(),
+            processor.track_goal3,
+        ),
+    ) as pool:
+        claim_futures = [
+            pool.submit(_build_claims_partial, chunk)
+            for chunk in _split(claim_files, workers * CHUNKS_PER_WORKER)
+        ]
+        revert_futures = [
+            pool.submit(_parse_reverts, chunk)
+            for chunk in _split(revert_files, workers * CHUNKS_PER_WORKER)
+        ]
+
+        try:
+            for fut in claim_futures:
+                with metrics.timed("parse"):
+                    partial, counters = fut.result()
+                with metrics.timed("apply"):
+                    processor.merge_partial(partial, counters)
+                # claims read by the worker, duplicates and unknown pharmacies included
+                metrics.add_events("claim", counters.duplicate_claims + len(partial.seen_claim_ids))
+
+            for fut in revert_futures:
+                with metrics.timed("parse"):
+                    events = fut.result()
+                with metrics.timed("apply"):
+                    processor.apply_reverts(events)
+                metrics.add_events("revert", len(events))
+        except BaseException:
+            # e.g. KeyboardInterrupt: only the chunks already running are finished
+            pool.shutdown(wait=False, cancel_futures=True)
+            raise
+
+
+def _split(files: List[JsonInput], n: int) -> List[List[JsonInput]]:
+    if not files:
+        return []
+    n = max(1, min(n, len(files)))
+    size, extra = divmod(len(files), n)
+    chunks = []
+    start = 0
+    for i in range(n):
+        end = start + size + (1 if i < extra else 0)
+        chunks.append(files[start:end])
+        start = end
+    return chunks
+
+
+def _init_worker(
+    pharmacy_chain_by_npi: Dict[str, str],
+    money: MoneyEngine,
+    dedup: IdDedup,
+    unknown: UnknownPharmacyClaims,
+    track_goal3: bool,
+) -> None:
+    global _worker_pharmacies, _worker_money, _worker_dedup, _worker_unknown, _worker_track_goal3
+    # Ctrl+C reaches the whole process group; the parent decides when to stop
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    _worker_pharmacies = pharmacy_chain_by_npi
+    _worker_money = money
+    # an empty dedup the parent can merge (chunks are deduplicated exactly)
+    _worker_dedup = dedup
+    _worker_unknown = unknown
+    _worker_track_goal3 = track_goal3
+
+
+def _build_claims_partial(files: List[JsonInput]) -> Tuple[InMemoryState, Counters]:
+    state = InMemoryState.with_money(_worker_money, dedup=_worker_dedup.partial)
+    state.pharmacy_chain_by_npi = _worker_pharmacies or {}
+    state.unknown_claims = _worker_unknown.partial()
+    processor = EventProcessor(state, _worker_track_goal3)
+    records = iter_claim_records(files, _worker_money)
+    while batch := list(itertools.islice(records, EVENT_BATCH)):
+        processor.apply_claims(batch)
+
+    # the parent has its own pharmacy snapshot and tracks changes on merge
+    state.pharmacy_chain_by_npi = {}
+    state.goal2.take_dirty()
+    state.goal3.take_dirty()
+    state.goal4.take_dirty()
+    return state, processor.counters
+
+
+def _parse_reverts(files: List[JsonInput]) -> List[RevertItem]:
+    return list(iter_revert_items(files))
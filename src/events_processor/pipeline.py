@@ -0,0 +1,116 @@
+import itertools
+import queue
+import threading
+from typing import Iterator, List, Optional, Union
+
+from events_processor.core.processor import EventProcessor
+from events_processor.metrics import Metrics
+from events_processor.sources.events_json import ClaimDecoder, JsonInput, iter_claim_records, iter_revert_items
+
+# events handed from a parser to the applier at a time
+EVENT_BATCH = 1024
+# parsed batches buffered per file before its parser blocks
+QUEUE_BATCHES = 8
+
+_DONE = object()
+# how often blocked threads check for shutdown
+_POLL = 0.1
+
+
+def process_files_pipelined(
+    processor: EventProcessor,
+    claim_files: List[JsonInput],
+    revert_files: List[JsonInput],
+    readers: int,
+    metrics: Optional[Metrics] = None,
+    queue_batches: int = QUEUE_BATCHES,
+) -> None:
+    """
+    Reads and parses files in `readers` background threads while the calling
+    thread applies the parsed events; only the calling thread touches the state.
+
+    Every file has its own bounded queue of event batches, and the applier
+    drains them in file order (claim files, then revert files), so events are
+    applied in exactly the serial order. A parser blocks when its file's queue
+    is full, and at most 2 * `readers` files are read ahead of the one being
+    applied, which bounds memory. On an error or KeyboardInterrupt in the
+    applier the parsers are stopped before the exception propagates.
+
+    The "parse" stage records the time the applier waited for parsed events.
+    """
+    if metrics is None:
+        metrics = Metrics()
+    # shared by the parser threads, so npi/ndc strings are interned across files
+    decoder = ClaimDecoder(processor.state.money)
+    jobs = [(fp, "claim") for fp in claim_files] + [(fp, "revert") for fp in revert_files]
+    if not jobs:
+        return
+
+    queues: List[Optional[queue.Queue]] = [queue.Queue(maxsize=queue_batches) for _ in jobs]
+    stop = threading.Event()
+    ahead = threading.Semaphore(2 * readers)
+    next_job = itertools.count()
+    next_job_lock = threading.Lock()
+
+    def put(q: queue.Queue, item) -> bool:
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=_POLL)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def parse(i: int) -> None:
+        fp, kind = jobs[i]
+        q = queues[i]
+        events: Iterator = iter_claim_records([fp], decoder=decoder) if kind == "claim" else iter_revert_items([fp])
+        try:
+            while True:
+                batch = list(itertools.islice(events, EVENT_BATCH))
+                if not batch:
+                    break
+                if not put(q, batch):
+                    return
+        except Exception as exc:
+            put(q, exc)
+            return
+        put(q, _DONE)
+
+    def parser() -> None:
+        while not stop.is_set():
+            if not ahead.acquire(timeout=_POLL):
+                continue
+            with next_job_lock:
+                i = next(next_job)
+            if i >= len(jobs):
+                return
+            parse(i)
+
+    threads = [
+        threading.Thread(target=parser, name=f"parser-{n}", daemon=True)
+        for n in range(min(readers, len(jobs)))
+    ]
+    for t in threads:
+        t.start()
+
+    try:
+        for i, (_, kind) in enumerate(jobs):
+            apply = processor.apply_claims if kind == "claim" else processor.apply_reverts
+            q = queues[i]
+            while True:
+                with metrics.timed("parse"):
+                    item: Union[list, Exception, object] = q.get()
+                if item is _DONE:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                with metrics.timed("apply"):
+                    apply(item)
+                metrics.add_events(kind, len(item))
+            queues[i] = None
+            ahead.release()
+    finally:
+        stop.set()
+        for t in threads:
+            t.join(timeout=1)
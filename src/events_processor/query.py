@@ -0,0 +1,152 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+from events_processor.destination.incremental import IncrementalOutputs, RowsView
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 10_000
+
+
+class QuerySnapshot:
+    """
+    Output rows of all goals as of one emit. Never modified after
+    publishing, so a request reads one consistent point in time. The views
+    (Goal 2 rows also by (ndc, npi)) share unchanged row blocks with the
+    previous snapshot, so publishing costs O(changes), not O(rows).
+    """
+
+    def __init__(
+        self, version: int, goal2: RowsView, goal3: RowsView, goal4: RowsView, goal2_by_ndc: RowsView
+    ) -> None:
+        self.version = version
+        self.published_at = time.time()
+        self.goal2 = goal2
+        self.goal3 = goal3
+        self.goal4 = goal4
+        self.goal2_by_ndc = goal2_by_ndc
+
+    @classmethod
+    def empty(cls) -> "QuerySnapshot":
+        view = RowsView()
+        return cls(0, view, view, view, view)
+
+    def metrics(self, npi: Optional[str], ndc: Optional[str]) -> Sequence[dict]:
+        """Goal 2 rows of an (npi, ndc) pair, an npi, an ndc or all, in (npi, ndc) order."""
+        if npi is not None and ndc is not None:
+            row = self.goal2.get((npi, ndc))
+            return [] if row is None else [row]
+        if npi is not None:
+            # keys are sorted by (npi, ndc): one npi is a contiguous range
+            return self.goal2.range((npi,), (npi + "\0",))
+        if ndc is not None:
+            # rows of one ndc, in npi order (as in the (npi, ndc) order)
+            return self.goal2_by_ndc.range((ndc,), (ndc + "\0",))
+        return self.goal2
+
+    def per_ndc(self, view: RowsView, ndc: Optional[str]) -> Sequence[dict]:
+        if ndc is None:
+            return view
+        row = view.get(ndc)
+        return [] if row is None else [row]
+
+
+class QueryStore:
+    """Holds the latest published snapshot; the processing thread publishes, request threads read."""
+
+    def __init__(self) -> None:
+        self.snapshot = QuerySnapshot.empty()
+
+    def publish(self, outputs: IncrementalOutputs) -> None:
+        """Publishes the rows of the last build of `outputs` (created with `ndc_index`)."""
+        # a single reference swap: readers see the old or the new snapshot, never a mix
+        self.snapshot = QuerySnapshot(self.snapshot.version + 1, *outputs.views(), outputs.goal2_by_ndc_view())
+
+
+def _page(rows: Sequence[dict], params: Dict[str, List[str]]) -> Tuple[List[dict], int, int]:
+    offset = int(params.get("offset", ["0"])[0])
+    limit = int(params.get("limit", [str(DEFAULT_LIMIT)])[0])
+    if offset < 0 or not 0 < limit <= MAX_LIMIT:
+        raise ValueError(f"offset must be >= 0 and limit in 1..{MAX_LIMIT}")
+    return rows[offset:offset + limit], offset, limit
+
+
+def _param(params: Dict[str, List[str]], name: str) -> Optional[str]:
+    values = params.get(name)
+    return values[0].strip() if values else None
+
+
+ROUTES: Dict[str, Callable[[QuerySnapshot, Dict[str, List[str]]], Sequence[dict]]] = {
+    "/v1/metrics": lambda snap, params: snap.metrics(_param(params, "npi"), _param(params, "ndc")),
+    "/v1/top-chains": lambda snap, params: snap.per_ndc(snap.goal3, _param(params, "ndc")),
+    "/v1/top-quantities": lambda snap, params: snap.per_ndc(snap.goal4, _param(params, "ndc")),
+}
+
+
+def start_query_server(store: QueryStore, port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """
+    Serves the latest snapshot of `store` as JSON from a daemon thread;
+    returns the server (call shutdown() to stop):
+
+    - GET /v1/metrics?npi=&ndc=        Goal 2 rows
+    - GET /v1/top-chains?ndc=          Goal 3 rows
+    - GET /v1/top-quantities?ndc=      Goal 4 rows
+    - GET /v1/status                   snapshot version and row counts
+
+    Row queries take `offset` and `limit` (default 100) and return
+    {"version", "published_at", "total", "offset", "limit", "items"}.
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self) -> None:
+            url = urlsplit(self.path)
+            params = parse_qs(url.query)
+            snap = store.snapshot
+            if url.path == "/v1/status":
+                self._send(200, {
+                    "version": snap.version,
+                    "published_at": snap.published_at,
+                    "rows": {
+                        "metrics": len(snap.goal2),
+                        "top_chains": len(snap.goal3),
+                        "top_quantities": len(snap.goal4),
+                    },
+                })
+                return
+            route = ROUTES.get(url.path)
+            if route is None:
+                self._send(404, {"error": f"unknown path {url.path}"})
+                return
+            rows = route(snap, params)
+            try:
+                items, offset, limit = _page(rows, params)
+            except ValueError as exc:
+                self._send(400, {"error": str(exc)})
+                return
+            self._send(200, {
+                "version": snap.version,
+                "published_at": snap.published_at,
+                "total": len(rows),
+                "offset": offset,
+                "limit": limit,
+                "items": items,
+            })
+
+        def _send(self, status: int, payload: dict) -> None:
+            body = json.dumps(payload, ensure_ascii=False).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format: str, *args) -> None:
+            pass  # no access log on stdout
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="query-http", daemon=True).start()
+    return server
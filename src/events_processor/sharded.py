@@ -0,0 +1,324 @@
+import json
+import multiprocessing
+import re
+import signal
+import traceback
+import zlib
+from collections import defaultdict
+from multiprocessing.connection import Connection
+from typing import Any, DefaultDict, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from events_processor.core.goals.goal2 import Goal2Metrics
+from events_processor.core.models import ClaimRecord
+from events_processor.core.money import Money, MoneyEngine
+from events_processor.core.processor import Counters, EventProcessor, PharmacyChanges, switch_pharmacies
+from events_processor.core.state import InMemoryState
+from events_processor.metrics import Metrics
+from events_processor.pipeline import EVENT_BATCH
+from events_processor.sources.events_json import (
+    ClaimDecoder,
+    JsonInput,
+    RawRecord,
+    decode_claim_records,
+    decode_revert_items,
+    iter_raw_records,
+)
+
+# seconds to wait for a shard to exit before terminating it
+_JOIN_TIMEOUT = 5
+
+
+def shard_of(claim_id: Any, shards: int) -> int:
+    """Shard owning a claim id; uses the id as decoded (str, stripped), so raw values map consistently."""
+    key = (claim_id if type(claim_id) is str else str(claim_id)).strip()
+    return zlib.crc32(key.encode("utf-8", "surrogatepass")) % shards
+
+
+def route(records: Iterable[RawRecord], field: str, shards: int) -> Iterator[Tuple[int, RawRecord]]:
+    """
+    (shard, record) per raw record, by shard_of its `field` (the claim id).
+    The field of a flat JSON line with an unescaped string value is read
+    without decoding the line; other lines are decoded here and passed on
+    as objects, so every record is decoded once. Lines found malformed
+    here are dropped (no shard would accept them).
+    """
+    quoted = b'"' + field.encode() + b'"'
+    value_of = re.compile(rb'[{,][ \t\n\r]*' + quoted + rb'[ \t\n\r]*:[ \t\n\r]*"([^"\\]*)"').search
+    crc32 = zlib.crc32
+    for record in records:
+        if type(record) is bytes:
+            # one "{" and one occurrence of the key: it can only be the top-level key
+            m = value_of(record) if record.count(b"{") == 1 and record.count(quoted) == 1 else None
+            if m is not None:
+                value = m.group(1)
+                if value.isascii():
+                    # shard_of of the decoded value (control characters would not decode)
+                    yield crc32(value.strip()) % shards, record
+                    continue
+                try:
+                    yield shard_of(value.decode("utf-8"), shards), record
+                    continue
+                except UnicodeDecodeError:
+                    pass
+            try:
+                record = json.loads(record)
+            except ValueError:
+                continue
+            if not isinstance(record, dict):
+                continue
+        yield shard_of(record.get(field, ""), shards), record
+
+
+class _Goal3Delta:
+    """Goal 3 changes since the last emit: (count, unit price sum) per (ndc, chain)."""
+
+    def __init__(self, money: MoneyEngine) -> None:
+        self.money = money
+        self.changes: Dict[str, Dict[str, List]] = {}
+
+    def _entry(self, cr: ClaimRecord) -> List:
+        by_chain = self.changes.get(cr.ndc)
+        if by_chain is None:
+            by_chain = self.changes[cr.ndc] = {}
+        entry = by_chain.get(cr.chain)
+        if entry is None:
+            entry = by_chain[cr.chain] = [0, self.money.zero]
+        return entry
+
+    def on_claim(self, cr: ClaimRecord) -> None:
+        entry = self._entry(cr)
+        entry[0] += 1
+        entry[1] = self.money.add(entry[1], cr.unit_price)
+
+    def on_revert(self, cr: ClaimRecord) -> None:
+        entry = self._entry(cr)
+        entry[0] -= 1
+        entry[1] = self.money.subtract(entry[1], cr.unit_price)
+
+    def apply_delta(self, deltas: Dict[str, Dict[str, Tuple[int, Money]]]) -> None:
+        for ndc, by_chain in deltas.items():
+            for chain, (cnt, unit_price_sum) in by_chain.items():
+                entry = self.changes.setdefault(ndc, {}).setdefault(chain, [0, self.money.zero])
+                entry[0] += cnt
+                entry[1] = self.money.add(entry[1], unit_price_sum)
+
+    def take(self) -> Dict[str, Dict[str, Tuple[int, Money]]]:
+        changes, self.changes = self.changes, {}
+        return {ndc: {chain: (cnt, s) for chain, (cnt, s) in by_chain.items()} for ndc, by_chain in changes.items()}
+
+
+class _Goal4Delta:
+    """Goal 4 changes since the last emit: count change per (ndc, quantity)."""
+
+    def __init__(self) -> None:
+        self.changes: DefaultDict[str, DefaultDict[str, int]] = defaultdict(lambda: defaultdict(int))
+
+    def on_claim(self, cr: ClaimRecord) -> None:
+        self.changes[cr.ndc][cr.quantity_key] += 1
+
+    def on_revert(self, cr: ClaimRecord) -> None:
+        self.changes[cr.ndc][cr.quantity_key] -= 1
+
+    def apply_delta(self, deltas: Dict[str, Dict[str, int]]) -> None:
+        for ndc, qmap in deltas.items():
+            changes = self.changes[ndc]
+            for q, delta in qmap.items():
+                changes[q] += delta
+
+    def take(self) -> Dict[str, Dict[str, int]]:
+        changes, self.changes = self.changes, defaultdict(lambda: defaultdict(int))
+        return {ndc: dict(qmap) for ndc, qmap in changes.items()}
+
+
+class ShardedProcessor:
+    """
+    Streaming state split across `shards` worker processes by claim id.
+
+    Each shard owns the claims, claim-id dedup and pending reverts of the ids
+    that hash to it (shard_of), so a claim and all its reverts always meet in
+    the same process. Instead of full goal aggregates a shard only
+    accumulates the changes to them since the last emit; process_files()
+    reads the new files once and sends each shard the raw records of its
+    claim ids, which it decodes and applies (in file order), and the changes
+    are merged here into `state`, which holds just the pharmacy map and the
+    goal aggregates for building outputs. Counters and state sizes are
+    summed over the shards.
+
+    Revert-id dedup is per shard: a revert id reused for claims of two
+    different shards is not detected as a duplicate. Pending-revert and
+    bounded-dedup limits apply per shard.
+    """
+
+    def __init__(self, template: InMemoryState, shards: int) -> None:
+        """`template` is the empty state every shard starts from (pharmacies, stores, limits)."""
+        self.shards = shards
+        self.state = InMemoryState.with_money(template.money)
+        self.state.pharmacy_chain_by_npi = template.pharmacy_chain_by_npi
+        self.counters = Counters()
+        self._sizes: Dict[str, int] = {}
+        ctx = multiprocessing.get_context()
+        self._conns: List[Connection] = []
+        self._procs = []
+        for index in range(shards):
+            parent, child = ctx.Pipe()
+            proc = ctx.Process(
+                target=_shard_main,
+                args=(child, template),
+                name=f"shard-{index}",
+                daemon=True,
+            )
+            proc.start()
+            child.close()
+            self._conns.append(parent)
+            self._procs.append(proc)
+
+    def process_files(
+        self,
+        claim_files: List[JsonInput],
+        revert_files: List[JsonInput],
+        metrics: Optional[Metrics] = None,
+    ) -> None:
+        """
+        Reads the new files once, routes each record to the shard of its
+        claim id (route) in batches that the shards decode and apply while
+        the rest is read, then merges their goal changes. Claims are sent
+        before reverts, in file order. Reading, routing and waiting for the
+        shards is recorded as "apply", merging as "merge".
+        """
+        if metrics is None:
+            metrics = Metrics()
+        with metrics.timed("apply"):
+            for kind, files, field in (("claims", claim_files, "id"), ("reverts", revert_files, "claim_id")):
+                batches: List[List[RawRecord]] = [[] for _ in self._conns]
+                for fp in files:
+                    for shard, record in route(iter_raw_records(fp), field, self.shards):
+                        batch = batches[shard]
+                        batch.append(record)
+                        if len(batch) >= EVENT_BATCH:
+                            self._send(self._conns[shard], (kind, batch))
+                            batches[shard] = []
+                for conn, batch in zip(self._conns, batches):
+                    if batch:
+                        self._send(conn, (kind, batch))
+            replies = self._request("emit", None)
+        with metrics.timed("merge"):
+            self._merge(replies, metrics)
+
+    def update_pharmacies(self, pharmacies: Dict[str, str]) -> PharmacyChanges:
+        """
+        Hot reload (see EventProcessor.update_pharmacies): Goal 3 aggregates of
+        moved npis are moved here, in the merged aggregates; shards admit
+        their buffered claims of added npis.
+        """
+        changes = switch_pharmacies(self.state, pharmacies)
+        if changes:
+            self._merge(self._request("pharmacies", pharmacies), Metrics())
+        return changes
+
+    def _request(self, kind: str, payload) -> List[tuple]:
+        for conn in self._conns:
+            self._send(conn, (kind, payload))
+        return [self._receive(conn) for conn in self._conns]
+
+    def _send(self, conn: Connection, message: tuple) -> None:
+        try:
+            conn.send(message)
+        except OSError:
+            # a failed shard closes its end after sending its traceback
+            self._receive(conn)
+            raise
+
+    def _merge(self, replies: List[tuple], metrics: Metrics) -> None:
+        totals = Counters()
+        sizes: Dict[str, int] = defaultdict(int)
+        for goal2, goal3, goal4, counters, shard_sizes, events in replies:
+            self.state.goal2.merge(goal2)
+            self.state.goal3.apply_delta(goal3)
+            self.state.goal4.apply_delta(goal4)
+            for name in Counters.__slots__:
+                setattr(totals, name, getattr(totals, name) + getattr(counters, name))
+            for name, n in shard_sizes.items():
+                sizes[name] += n
+            for kind, n in events.items():
+                metrics.add_events(kind, n)
+        self.counters = totals
+        sizes["pharmacies"] = len(self.state.pharmacy_chain_by_npi)
+        self._sizes = dict(sizes)
+
+    def state_sizes(self) -> Dict[str, int]:
+        """Entries per state structure, summed over shards as of the last update."""
+        return dict(self._sizes)
+
+    def close(self) -> None:
+        for conn in self._conns:
+            try:
+                conn.send(None)
+            except OSError:
+                pass
+        for proc in self._procs:
+            proc.join(_JOIN_TIMEOUT)
+            if proc.is_alive():
+                proc.terminate()
+        for conn in self._conns:
+            conn.close()
+
+    def _receive(self, conn: Connection):
+        reply = conn.recv()
+        if isinstance(reply, str):
+            raise RuntimeError(f"shard failed:\n{reply}")
+        return reply
+
+
+def _shard_main(conn: Connection, template: InMemoryState) -> None:
+    # Ctrl+C reaches the whole process group; the coordinator shuts shards down
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    money = template.money
+    template.goal2 = Goal2Metrics(money)
+    template.goal3 = _Goal3Delta(money)
+    template.goal4 = _Goal4Delta()
+    state = template
+    processor = EventProcessor(state)
+    decoder = ClaimDecoder(money)
+    events = {"claim": 0, "revert": 0}
+
+    while True:
+        message = conn.recv()
+        if message is None:
+            break
+        kind, payload = message
+        try:
+            # raw records routed here (route): decoded and applied, no reply
+            if kind == "claims":
+                claims = decode_claim_records(payload, decoder)
+                processor.apply_claims(claims)
+                events["claim"] += len(claims)
+                continue
+            if kind == "reverts":
+                reverts = decode_revert_items(payload)
+                processor.apply_reverts(reverts)
+                events["revert"] += len(reverts)
+                continue
+            if kind == "pharmacies":
+                processor.update_pharmacies(payload, reattribute=False)
+
+            # "emit" and "pharmacies": the changes since the last reply
+            goal2, state.goal2 = state.goal2, Goal2Metrics(money)
+            conn.send((
+                goal2,
+                state.goal3.take(),
+                state.goal4.take(),
+                processor.counters,
+                {
+                    "claims": len(state.claims),
+                    "seen_claim_ids": len(state.seen_claim_ids),
+                    "seen_revert_ids": len(state.seen_revert_ids),
+                    "pending_reverts": len(state.pending_reverts),
+                    "unknown_claims": len(state.unknown_claims),
+                },
+                events,
+            ))
+            events = {"claim": 0, "revert": 0}
+        except Exception:
+            conn.send(traceback.format_exc())
+            break
+    conn.close()
@@ -0,0 +1,72 @@
+import bz2
+import gzip
+import io
+import lzma
+import zlib
+from pathlib import Path
+from typing import BinaryIO, Callable, Dict, Optional, TextIO
+
+# bytes read from the compressed file, and decompressed bytes buffered, per read
+READ_BUFFER_SIZE = 1 << 20
+
+# compressed input by file suffix: opener of a decompressing reader over a binary file
+_OPENERS: Dict[str, Callable[[BinaryIO], BinaryIO]] = {
+    ".gz": lambda raw: gzip.GzipFile(fileobj=raw, mode="rb"),
+    ".bz2": lambda raw: bz2.BZ2File(raw, mode="rb"),
+    ".xz": lambda raw: lzma.LZMAFile(raw, mode="rb"),
+}
+
+# raised when a compressed file is corrupt or truncated (e.g. still being written);
+# readers treat them like the end of the file
+DECOMPRESSION_ERRORS = (OSError, EOFError, lzma.LZMAError, zlib.error)
+
+
+def compression_of(name: str) -> Optional[str]:
+    """Compression suffix of a file name (".gz", ".bz2", ".xz"), None for a plain file."""
+    i = name.rfind(".")
+    if i <= 0:
+        return None
+    suffix = name[i:].lower()
+    return suffix if suffix in _OPENERS else None
+
+
+def strip_compression(name: str) -> str:
+    """File name without its compression suffix ("claims.json.gz" -> "claims.json")."""
+    suffix = compression_of(name)
+    return name[: -len(suffix)] if suffix else name
+
+
+def open_binary(fp: Path) -> BinaryIO:
+    """
+    Reads a file, decompressing it on the fly if its name ends in .gz, .bz2
+    or .xz. Compressed files are read in READ_BUFFER_SIZE blocks and their
+    decompressed bytes buffered as much, so decoding sees large reads.
+    """
+    suffix = compression_of(fp.name)
+    if suffix is None:
+        return fp.open("rb", buffering=READ_BUFFER_SIZE)
+    raw = fp.open("rb", buffering=READ_BUFFER_SIZE)
+    try:
+        return _Decompressed(_OPENERS[suffix](raw), raw)
+    except BaseException:
+        raw.close()
+        raise
+
+
+def open_text(fp: Path) -> TextIO:
+    """open_binary decoded as UTF-8 text."""
+    return io.TextIOWrapper(open_binary(fp), encoding="utf-8")
+
+
+class _Decompressed(io.BufferedReader):
+    """Buffered decompressing reader that also closes the underlying file."""
+
+    def __init__(self, stream: BinaryIO, raw: BinaryIO) -> None:
+        super().__init__(stream, READ_BUFFER_SIZE)
+        self._file = raw
+
+    def close(self) -> None:
+        try:
+            super().close()
+        finally:
+            self._file.close()
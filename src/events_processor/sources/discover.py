@@ -1,6 +1,22 @@
-from dataclasses import dataclass
+import os
+import re
+import time
+from dataclasses import dataclass, field
+from fnmatch import translate
 from pathlib import Path
-from typing import Iterable, List
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from .compression import strip_compression
+
+# names skipped in --streaming mode, where files are picked up while others
+# are still being written: hidden files and directories (editor swap files,
+# rsync temporaries) and files still being written by convention. Batch mode
+# reads every file, as the input directories are complete.
+DEFAULT_EXCLUDE = (".*", "*.tmp", "*.part", "*.partial", "*.inprogress", "*.crdownload")
+
+# a directory modified this recently may still change within the same mtime
+# tick, so its cached listing is not trusted yet
+_SETTLE_NS = 2_000_000_000
 
 
 @dataclass(frozen=True, slots=True)
@@ -9,31 +25,218 @@ class DiscoveredFiles:
     csv_files: List[Path]
 
 
-def discover_files(dirs: Iterable[str], recursive: bool = True) -> DiscoveredFiles:
+@dataclass(slots=True)
+class ScanStats:
+    seconds: float = 0.0
+    dirs: int = 0  # directories checked (one stat each)
+    dirs_listed: int = 0  # directories whose entries were read
+    entries: int = 0  # directory entries read
+
+
+@dataclass(slots=True)
+class _Listing:
+    mtime_ns: int
+    trusted: bool
+    # matching files (name -> inode) and subdirectories, in name order
+    files: Dict[str, int] = field(default_factory=dict)
+    dirs: List[Path] = field(default_factory=list)
+
+
+class FileFilter:
+    """
+    Which directory entries count as input: names matching any `include`
+    pattern (all if empty) and none of `exclude` (fnmatch on the name).
+    Exclude patterns also skip directories.
+    """
+    __slots__ = ("include", "exclude", "_include", "_exclude")
+
+    def __init__(self, include: Sequence[str] = (), exclude: Sequence[str] = ()) -> None:
+        self.include = tuple(include)
+        self.exclude = tuple(exclude)
+        # one compiled alternation per list (None: no patterns)
+        self._include = _compile(self.include)
+        self._exclude = _compile(self.exclude)
+
+    def excluded(self, name: str) -> bool:
+        return self._exclude is not None and self._exclude.match(name) is not None
+
+    def accepts(self, name: str) -> bool:
+        if self.excluded(name):
+            return False
+        return self._include is None or self._include.match(name) is not None
+
+
+def _compile(patterns: Sequence[str]) -> Optional["re.Pattern[str]"]:
+    if not patterns:
+        return None
+    return re.compile("|".join(f"(?:{translate(p)})" for p in patterns))
+
+
+DEFAULT_FILTER = FileFilter()
+STREAMING_FILTER = FileFilter(exclude=DEFAULT_EXCLUDE)
+
+
+# input kind by suffix (after any compression suffix)
+_KINDS = {".json": ".json", ".jsonl": ".json", ".csv": ".csv"}
+
+
+def input_kind(name: str) -> Optional[str]:
+    """Kind of an input file, plain or compressed: ".json" (JSON or JSON lines), ".csv", or None."""
+    name = strip_compression(name)
+    suffix = name[name.rfind("."):].lower() if "." in name[1:] else ""
+    return _KINDS.get(suffix)
+
+
+def _list_dir(path: Path, filters: FileFilter, stats: ScanStats) -> Tuple[Dict[str, int], List[Path]]:
+    """Matching files (name -> inode) and subdirectories of a directory, in name order."""
+    files: Dict[str, int] = {}
+    dirs: List[Path] = []
+    try:
+        with os.scandir(path) as it:
+            entries = sorted(it, key=lambda e: e.name)
+    except OSError:
+        return files, dirs
+    stats.dirs_listed += 1
+    stats.entries += len(entries)
+    for entry in entries:
+        name = entry.name
+        try:
+            # DirEntry caches the type and inode from the directory read (no stat on most filesystems)
+            if entry.is_dir():
+                if not filters.excluded(name):
+                    dirs.append(path / name)
+            elif entry.is_file() and input_kind(name) and filters.accepts(name):
+                files[name] = entry.inode()
+        except OSError:
+            continue
+    return files, dirs
+
+
+def _split(files: Iterable[Path]) -> DiscoveredFiles:
     json_files: List[Path] = []
     csv_files: List[Path] = []
+    for f in files:
+        (json_files if input_kind(f.name) == ".json" else csv_files).append(f)
+    json_files.sort()
+    csv_files.sort()
+    return DiscoveredFiles(json_files=json_files, csv_files=csv_files)
+
+
+def discover_files(
+    dirs: Iterable[str],
+    recursive: bool = True,
+    filters: FileFilter = DEFAULT_FILTER,
+    stats: Optional[ScanStats] = None,
+) -> DiscoveredFiles:
+    """
+    JSON (.json, .jsonl) and CSV files in the given directories (or the
+    given files themselves), plain or compressed (.gz, .bz2, .xz), sorted
+    by path. Optional `stats` receives the scan cost.
+    """
+    if stats is None:
+        stats = ScanStats()
+    start = time.perf_counter()
+    found: List[Path] = []
+    visited: Set[Tuple[int, int]] = set()
 
     for d in dirs:
         p = Path(d)
-        if not p.exists():
-            continue
         if p.is_file():
-            if p.suffix.lower() == ".json":
-                json_files.append(p)
-            elif p.suffix.lower() == ".csv":
-                csv_files.append(p)
+            if input_kind(p.name):
+                found.append(p)
+            continue
+        if not p.is_dir():
             continue
+        pending = [p]
+        while pending:
+            d = pending.pop()
+            try:
+                st = os.stat(d)
+            except OSError:
+                continue
+            # a directory reached twice (symlinks, possibly in a loop) is read once
+            if (st.st_dev, st.st_ino) in visited:
+                continue
+            visited.add((st.st_dev, st.st_ino))
+            stats.dirs += 1
+            files, subdirs = _list_dir(d, filters, stats)
+            found.extend(d / name for name in files)
+            if recursive:
+                pending.extend(subdirs)
+
+    stats.seconds += time.perf_counter() - start
+    return _split(found)
 
-        pattern = "**/*" if recursive else "*"
-        for f in p.glob(pattern):
-            if not f.is_file():
+
+class DirectoryIndex:
+    """
+    Cached listing of input directories for repeated scans (--streaming).
+
+    Every scan stats each directory once and reads the entries only of
+    directories whose mtime changed since they were last read (adding,
+    removing or renaming a file changes the mtime of its directory), so an
+    unchanged tree costs one stat per directory, not per file. Listings of
+    directories modified within the last 2 seconds are read again on the next
+    scan, in case they change again within the same mtime tick.
+
+    Modifying a file in place does not change its directory; callers that
+    follow appends must stat those files themselves.
+    """
+
+    def __init__(self, roots: Iterable[Path], recursive: bool = True, filters: FileFilter = STREAMING_FILTER) -> None:
+        self.roots = sorted(set(roots))
+        self.recursive = recursive
+        self.filters = filters
+        self._listings: Dict[Path, _Listing] = {}
+        self.last_stats = ScanStats()
+        # directories read by the last scan (new, changed or not settled yet)
+        self.last_listed: Set[Path] = set()
+
+    def scan(self) -> List[Path]:
+        """
+        Files that are new since the previous scan (or replaced: same name,
+        another inode), sorted by path; the first scan returns every file.
+        """
+        stats = ScanStats()
+        start = time.perf_counter()
+        now_ns = time.time_ns()
+        listings: Dict[Path, _Listing] = {}
+        visited: Set[Tuple[int, int]] = set()
+        listed: Set[Path] = set()
+        new: List[Path] = []
+
+        pending = list(reversed(self.roots))
+        while pending:
+            d = pending.pop()
+            try:
+                st = os.stat(d)
+            except OSError:
                 continue
-            suf = f.suffix.lower()
-            if suf == ".json":
-                json_files.append(f)
-            elif suf == ".csv":
-                csv_files.append(f)
+            # a directory reached twice (symlinks, possibly in a loop) is read once
+            if (st.st_dev, st.st_ino) in visited:
+                continue
+            visited.add((st.st_dev, st.st_ino))
+            mtime_ns = st.st_mtime_ns
+            stats.dirs += 1
+            listing = self._listings.get(d)
+            if listing is None or not listing.trusted or listing.mtime_ns != mtime_ns:
+                listed.add(d)
+                files, subdirs = _list_dir(d, self.filters, stats)
+                known = listing.files if listing is not None else {}
+                new.extend(d / name for name, inode in files.items() if known.get(name) != inode)
+                listing = _Listing(mtime_ns, now_ns - mtime_ns > _SETTLE_NS, files, subdirs)
+            listings[d] = listing
+            if self.recursive:
+                pending.extend(reversed(listing.dirs))
 
-    json_files.sort()
-    csv_files.sort()
-    return DiscoveredFiles(json_files=json_files, csv_files=csv_files)
+        # directories that disappeared are forgotten
+        self._listings = listings
+        self.last_listed = listed
+        stats.seconds = time.perf_counter() - start
+        self.last_stats = stats
+        new.sort()
+        return new
+
+    def files(self) -> List[Path]:
+        """Every file as of the last scan, sorted by path."""
+        return sorted(d / name for d, listing in self._listings.items() for name in listing.files)
@@ -1,39 +1,259 @@
 import json
+import re
+from dataclasses import dataclass
 from datetime import datetime
 from decimal import Decimal, InvalidOperation
 from pathlib import Path
-from typing import Dict, Iterable, Iterator, Optional, Any
+from typing import Any, Dict, Iterable, Iterator, List, Optional, TextIO, Tuple, Union
 
 from ..core.events import ClaimEvent, RevertEvent
+from ..core.models import ClaimRecord, normalize_decimal_key
+from ..core.money import DECIMAL_MONEY, MoneyEngine
+from .compression import DECOMPRESSION_ERRORS, open_binary, open_text
 
+# chars read per chunk when streaming JSON arrays
+READ_CHUNK_SIZE = 1 << 20
 
-def iter_claim_events(json_files: Iterable[Path]) -> Iterator[ClaimEvent]:
+_DECODER = json.JSONDecoder()
+_WS = re.compile(r"[ \t\n\r]*")
+_STRUCTURAL = re.compile(r'["\[\]{},]')
+_STRING_END = re.compile(r'["\\]')
+# "," before an object: where the next array element may start
+_BOUNDARY = re.compile(r",[ \t\n\r]*(?=\{)")
+# chars an array element may span before it counts as malformed
+MAX_ELEMENT_CHARS = 8 << 20
+# chars read past a malformed element before deciding where the next one starts
+RESYNC_LOOKAHEAD = 1 << 16
+
+# bytes read per step when looking for the last complete line of a growing file
+TAIL_BLOCK_SIZE = 1 << 16
+
+# ClaimDecoder caches: distinct quantities and interned npi/ndc strings
+QUANTITY_CACHE_SIZE = 4096
+STRING_CACHE_SIZE = 1 << 20
+
+# decoded revert: (revert id, claim id, timestamp)
+RevertItem = Tuple[str, str, datetime]
+
+
+@dataclass(frozen=True, slots=True)
+class FileSlice:
+    """
+    Byte range [start, end) of a plain JSON lines file that holds complete
+    lines only. end=None means the whole file, in any supported format
+    (compressed files are always read whole).
+    """
+    path: Path
+    start: int = 0
+    end: Optional[int] = None
+
+
+JsonInput = Union[Path, FileSlice]
+
+# a record as read, before decoding: a JSON line (bytes, possibly malformed),
+# or an element of a JSON array file (already decoded to find its end)
+RawRecord = Union[bytes, Dict[str, Any]]
+
+
+def iter_claim_events(
+    json_files: Iterable[JsonInput],
+    money: MoneyEngine = DECIMAL_MONEY,
+) -> Iterator[ClaimEvent]:
     for fp in json_files:
-        for obj in _iter_json_objects(fp):
-            ev = _parse_claim(obj)
+        for obj in _iter_input_objects(fp):
+            ev = _parse_claim(obj, money)
             if ev is not None:
                 yield ev
 
 
-def iter_revert_events(json_files: Iterable[Path]) -> Iterator[RevertEvent]:
+def iter_revert_events(json_files: Iterable[JsonInput]) -> Iterator[RevertEvent]:
     for fp in json_files:
-        for obj in _iter_json_objects(fp):
+        for obj in _iter_input_objects(fp):
             ev = _parse_revert(obj)
             if ev is not None:
                 yield ev
 
 
+def iter_claim_records(
+    json_files: Iterable[JsonInput],
+    money: MoneyEngine = DECIMAL_MONEY,
+    decoder: Optional["ClaimDecoder"] = None,
+) -> Iterator[Tuple[ClaimRecord, datetime]]:
+    """
+    Fast path of iter_claim_events: (stored record, timestamp) per valid claim,
+    for EventProcessor.apply_claim. Accepts exactly the same records.
+    Pass a shared `decoder` to keep its caches across calls.
+    """
+    decode = (decoder or ClaimDecoder(money)).decode
+    for fp in json_files:
+        for obj in _iter_input_objects(fp):
+            item = decode(obj)
+            if item is not None:
+                yield item
+
+
+def iter_revert_items(json_files: Iterable[JsonInput]) -> Iterator[RevertItem]:
+    """Fast path of iter_revert_events, for EventProcessor.apply_revert."""
+    for fp in json_files:
+        for obj in _iter_input_objects(fp):
+            item = _decode_revert(obj)
+            if item is not None:
+                yield item
+
+
+def iter_raw_records(item: JsonInput) -> Iterator[RawRecord]:
+    """
+    Records of an input without decoding JSON lines (see RawRecord), so they
+    can be routed and decoded elsewhere (decode_claim_records /
+    decode_revert_items) with the same result as iter_claim_records /
+    iter_revert_items.
+    """
+    if isinstance(item, FileSlice):
+        if item.end is not None:
+            yield from _iter_jsonl_lines(item.path, item.start, item.end)
+            return
+        item = item.path
+    if sniff_json_format(item) != "{":
+        yield from _iter_json_objects(item)
+        return
+    try:
+        with open_binary(item) as f:
+            for line in f:
+                # text mode also ends lines at a lone "\r"
+                for part in line.splitlines() if b"\r" in line else (line,):
+                    part = part.strip()
+                    if part:
+                        yield part
+    except DECOMPRESSION_ERRORS:
+        return
+
+
+def _load_raw(records: Iterable[RawRecord]) -> Iterator[Dict[str, Any]]:
+    for record in records:
+        if type(record) is bytes:
+            try:
+                record = json.loads(record)
+            except ValueError:
+                continue
+            if not isinstance(record, dict):
+                continue
+        yield record
+
+
+def decode_claim_records(records: Iterable[RawRecord], decoder: "ClaimDecoder") -> List[Tuple[ClaimRecord, datetime]]:
+    """Valid claims of raw records (iter_raw_records), as iter_claim_records yields them."""
+    decode = decoder.decode
+    return [item for item in map(decode, _load_raw(records)) if item is not None]
+
+
+def decode_revert_items(records: Iterable[RawRecord]) -> List[RevertItem]:
+    """Valid reverts of raw records (iter_raw_records), as iter_revert_items yields them."""
+    return [item for item in map(_decode_revert, _load_raw(records)) if item is not None]
+
+
+def _iter_input_objects(item: JsonInput) -> Iterator[Dict[str, Any]]:
+    if isinstance(item, FileSlice):
+        if item.end is None:
+            return _iter_json_objects(item.path)
+        return _iter_jsonl_range(item.path, item.start, item.end)
+    return _iter_json_objects(item)
+
+
+def sniff_json_format(fp: Path) -> Optional[str]:
+    """
+    First non-whitespace char of a file ("{" for JSON lines, "[" for arrays),
+    None if blank (or a compressed file whose first block is not complete yet).
+    """
+    try:
+        with open_binary(fp) as f:
+            while True:
+                block = f.read(4096)
+                if not block:
+                    return None
+                stripped = block.lstrip()
+                if stripped:
+                    return chr(stripped[0])
+    except DECOMPRESSION_ERRORS:
+        return None
+
+
+def complete_jsonl_end(fp: Path, start: int, size: int) -> int:
+    """
+    End offset of the complete lines of a growing JSON lines file within
+    [start, size). A trailing line without a newline counts as complete only if
+    it already parses, so a record being written is left for the next poll.
+    """
+    try:
+        with fp.open("rb") as f:
+            line_end = start
+            pos = size
+            while pos > start:
+                block_start = max(start, pos - TAIL_BLOCK_SIZE)
+                f.seek(block_start)
+                i = f.read(pos - block_start).rfind(b"\n")
+                if i >= 0:
+                    line_end = block_start + i + 1
+                    break
+                pos = block_start
+
+            if line_end < size:
+                f.seek(line_end)
+                tail = f.read(size - line_end)
+                if tail.strip():
+                    try:
+                        json.loads(tail)
+                        return size
+                    except ValueError:
+                        pass
+            return line_end
+    except OSError:
+        return start
+
+
+def _iter_jsonl_range(fp: Path, start: int, end: int) -> Iterator[Dict[str, Any]]:
+    """JSON objects from the lines in byte range [start, end) of a JSON lines file."""
+    for line in _iter_jsonl_lines(fp, start, end):
+        try:
+            obj = json.loads(line)
+        except ValueError:
+            continue
+        if isinstance(obj, dict):
+            yield obj
+
+
+def _iter_jsonl_lines(fp: Path, start: int, end: int) -> Iterator[bytes]:
+    """Non-blank lines (stripped) in byte range [start, end) of a JSON lines file."""
+    try:
+        with fp.open("rb") as f:
+            f.seek(start)
+            remaining = end - start
+            for line in f:
+                if remaining <= 0:
+                    break
+                if len(line) > remaining:
+                    line = line[:remaining]
+                remaining -= len(line)
+
+                line = line.strip()
+                if line:
+                    yield line
+    except OSError:
+        return
+
+
 def _iter_json_objects(fp: Path) -> Iterator[Dict[str, Any]]:
     """
     Iterates over JSON objects in a file.
     Supports:
     - JSON lines (one object per line)
-    - JSON arrays
+    - JSON arrays (decoded incrementally, one element at a time)
     - Single JSON object files
-    Malformed files or records are skipped.
+    Files ending in .gz, .bz2 or .xz are decompressed while reading.
+    Malformed files or records are skipped; a truncated compressed file
+    yields what was read before the truncation.
     """
     try:
-        with fp.open("r", encoding="utf-8") as f:
+        with open_text(fp) as f:
             first_char = None
             pos = f.tell()
             while True:
@@ -58,23 +278,179 @@ def _iter_json_objects(fp: Path) -> Iterator[Dict[str, Any]]:
                         yield obj
                 return
 
-            try:
-                data = json.load(f)
-            except json.JSONDecodeError:
-                return
-
-            if isinstance(data, list):
-                for item in data:
+            if first_char == "[":
+                for item in _iter_json_array(f):
                     if isinstance(item, dict):
                         yield item
-            elif isinstance(data, dict):
-                yield data
 
-    except OSError:
+    except DECOMPRESSION_ERRORS:
         return
 
 
-def _parse_claim(obj: Dict[str, Any]) -> Optional[ClaimEvent]:
+def _iter_json_array(f: TextIO, chunk_size: int = READ_CHUNK_SIZE) -> Iterator[Any]:
+    """
+    Decodes a top-level JSON array element by element from chunked reads.
+    Memory is bounded by the chunk size plus the largest single element.
+    Malformed elements are skipped up to the next top-level separator. An
+    element with unbalanced brackets (or one that does not end within
+    MAX_ELEMENT_CHARS) has no such separator: decoding resumes at the next
+    "," followed by an object that decodes, so only that element is lost.
+    A truncated array yields everything before the truncation.
+    """
+    buf = ""
+    pos = 0
+    eof = False
+
+    def read_more() -> bool:
+        nonlocal buf, pos, eof
+        if eof:
+            return False
+        chunk = f.read(chunk_size)
+        if not chunk:
+            eof = True
+            return False
+        buf = buf[pos:] + chunk
+        pos = 0
+        return True
+
+    # opening bracket
+    while True:
+        pos = _WS.match(buf, pos).end()
+        if pos < len(buf) or not read_more():
+            break
+    if pos >= len(buf) or buf[pos] != "[":
+        return
+    pos += 1
+
+    def resync(start: int) -> bool:
+        # moves `pos` to the next "," followed by an element that decodes; False if none
+        nonlocal pos
+        while True:
+            sync, keep = _resync(buf, start, final=False)
+            if sync is not None:
+                pos = sync
+                return True
+            pos = keep
+            if not read_more():
+                sync, _ = _resync(buf, pos, final=True)
+                if sync is None:
+                    return False
+                pos = sync
+                return True
+            start = 0
+
+    while True:
+        pos = _WS.match(buf, pos).end()
+        if pos >= len(buf):
+            if read_more():
+                continue
+            return
+        ch = buf[pos]
+        if ch == "]":
+            # the end of the array, unless the elements go on (a stray bracket)
+            rest = _WS.match(buf, pos + 1).end()
+            if rest >= len(buf) and read_more():
+                continue
+            if rest >= len(buf) or buf[rest] not in ",]}" or not resync(pos + 1):
+                return
+            continue
+        if ch == ",":
+            pos += 1
+            continue
+
+        try:
+            item, end = _DECODER.raw_decode(buf, pos)
+        except json.JSONDecodeError:
+            end = _find_value_end(buf, pos)
+            if end is None:
+                # element continues in the next chunk (or the file is truncated)
+                if len(buf) - pos < MAX_ELEMENT_CHARS and read_more():
+                    continue
+                # unbalanced element
+                if not resync(pos + 1):
+                    return
+                continue
+            # a separator inside the element (e.g. after a stray quote) is no end:
+            # an element that decodes before it wins
+            if len(buf) - end < RESYNC_LOOKAHEAD and read_more():
+                continue
+            sync, _ = _resync(buf, pos + 1, final=True)
+            pos = sync if sync is not None and sync < end else end  # malformed element: skip it
+            continue
+
+        if end >= len(buf) and not isinstance(item, (dict, list, str)) and read_more():
+            continue  # a number or literal may continue in the next chunk
+
+        pos = end
+        yield item
+
+
+def _resync(buf: str, start: int, final: bool) -> Tuple[Optional[int], int]:
+    """
+    Looks for the first "," at or after `start` that is followed by a
+    complete object and then "," or the final "]": returns (its index, _), or (None,
+    the index to search again from once more is read). Unless `final` (no
+    more data), a candidate within RESYNC_LOOKAHEAD of the end of `buf`
+    stops the search: it may be cut off.
+    """
+    for m in _BOUNDARY.finditer(buf, start):
+        try:
+            _, end = _DECODER.raw_decode(buf, m.end())
+        except json.JSONDecodeError:
+            if not final and len(buf) - m.start() < RESYNC_LOOKAHEAD:
+                return None, m.start()
+            continue
+        end = _WS.match(buf, end).end()
+        if end >= len(buf):
+            if not final:
+                return None, m.start()
+        elif buf[end] == ",":
+            return m.start(), m.start()
+        elif buf[end] == "]":
+            # the end of the array only if nothing follows (not a nested array)
+            if _WS.match(buf, end + 1).end() >= len(buf):
+                if final:
+                    return m.start(), m.start()
+                return None, m.start()
+    # a boundary may start with the last "," and continue in the next chunk
+    comma = buf.rfind(",", start)
+    return None, comma if comma >= 0 else len(buf)
+
+
+def _find_value_end(buf: str, pos: int) -> Optional[int]:
+    """
+    Returns the index of the "," or "]" that ends the array element starting
+    at `pos`, or None if the element is not complete within `buf`.
+    """
+    depth = 0
+    while True:
+        m = _STRUCTURAL.search(buf, pos)
+        if m is None:
+            return None
+        ch = m.group()
+        pos = m.end()
+
+        if ch == '"':
+            while True:
+                m = _STRING_END.search(buf, pos)
+                if m is None:
+                    return None
+                pos = m.end()
+                if m.group() == '"':
+                    break
+                pos += 1  # escaped char
+        elif ch in "[{":
+            depth += 1
+        elif ch in "]}":
+            if depth > 0:
+                depth -= 1
+            elif ch == "]":
+                return m.start()
+        elif depth == 0:
+            return m.start()
+
+
+def _parse_claim(obj: Dict[str, Any], money: MoneyEngine = DECIMAL_MONEY) -> Optional[ClaimEvent]:
     try:
         claim_id = str(obj.get("id", "")).strip()
         npi = str(obj.get("npi", "")).strip()
@@ -89,13 +465,13 @@ def _parse_claim(obj: Dict[str, Any]) -> Optional[ClaimEvent]:
             return None
 
         quantity = _parse_decimal(obj.get("quantity"))
-        price = _parse_decimal(obj.get("price"))
+        price = money.parse(obj.get("price"))
         if quantity is None or price is None:
             return None
         if quantity <= 0 or price < 0:
             return None
 
-        unit_price = price / quantity
+        unit_price = money.unit_price(price, quantity)
 
         return ClaimEvent(
             id=claim_id,
@@ -110,6 +486,125 @@ def _parse_claim(obj: Dict[str, Any]) -> Optional[ClaimEvent]:
         return None
 
 
+class ClaimDecoder:
+    """
+    Decodes claim objects straight into the ClaimRecord the processor stores
+    (chain is filled in by the processor), without an intermediate ClaimEvent.
+    Quantities repeat a lot, so their Decimal and normalized key are cached
+    per raw JSON value; npi/ndc strings are interned so stored records share
+    them. Validation matches _parse_claim.
+    """
+
+    def __init__(self, money: MoneyEngine = DECIMAL_MONEY) -> None:
+        self.money = money
+        # (type, raw value) -> (quantity, key), or None if rejected
+        self._quantities: Dict[Tuple[type, Any], Optional[Tuple[Decimal, str]]] = {}
+        self._strings: Dict[str, str] = {}
+
+    def decode(self, obj: Dict[str, Any]) -> Optional[Tuple[ClaimRecord, datetime]]:
+        try:
+            get = obj.get
+            claim_id = get("id", "")
+            claim_id = (claim_id if type(claim_id) is str else str(claim_id)).strip()
+            npi = get("npi", "")
+            npi = (npi if type(npi) is str else str(npi)).strip()
+            ndc = get("ndc", "")
+            ndc = (ndc if type(ndc) is str else str(ndc)).strip()
+            ts_raw = get("timestamp")
+
+            if not claim_id or not npi or not ndc or ts_raw is None:
+                return None
+
+            if type(ts_raw) is str:
+                try:
+                    ts = datetime.fromisoformat(ts_raw)
+                except ValueError:
+                    return None
+            else:
+                ts = _parse_iso_datetime(ts_raw)
+                if ts is None:
+                    return None
+
+            quantity = self._quantity(get("quantity"))
+            if quantity is None:
+                return None
+            money = self.money
+            price = money.parse(get("price"))
+            if price is None or price < 0:
+                return None
+
+            strings = self._strings
+            interned = strings.get(npi)
+            if interned is None:
+                if len(strings) < STRING_CACHE_SIZE:
+                    strings[npi] = npi
+            else:
+                npi = interned
+            interned = strings.get(ndc)
+            if interned is None:
+                if len(strings) < STRING_CACHE_SIZE:
+                    strings[ndc] = ndc
+            else:
+                ndc = interned
+
+            q, quantity_key = quantity
+            return ClaimRecord(claim_id, npi, ndc, "", price, quantity_key, money.unit_price(price, q)), ts
+        except Exception:
+            return None
+
+    def _quantity(self, raw: Any) -> Optional[Tuple[Decimal, str]]:
+        try:
+            cache_key = (type(raw), raw)
+            return self._quantities[cache_key]
+        except KeyError:
+            pass
+        except TypeError:
+            # unhashable (e.g. a list): rejected below, not cached
+            return self._parse_quantity(raw)
+
+        result = self._parse_quantity(raw)
+        if len(self._quantities) < QUANTITY_CACHE_SIZE:
+            self._quantities[cache_key] = result
+        return result
+
+    @staticmethod
+    def _parse_quantity(raw: Any) -> Optional[Tuple[Decimal, str]]:
+        q = _parse_decimal(raw)
+        try:
+            if q is None or q <= 0:
+                return None
+        except InvalidOperation:
+            return None  # NaN
+        return q, normalize_decimal_key(q)
+
+
+def _decode_revert(obj: Dict[str, Any]) -> Optional[RevertItem]:
+    try:
+        get = obj.get
+        revert_id = get("id", "")
+        revert_id = (revert_id if type(revert_id) is str else str(revert_id)).strip()
+        claim_id = get("claim_id", "")
+        claim_id = (claim_id if type(claim_id) is str else str(claim_id)).strip()
+        ts_raw = get("timestamp")
+
+        if not revert_id or not claim_id or ts_raw is None:
+            return None
+
+        if type(ts_raw) is str:
+            try:
+                ts = datetime.fromisoformat(ts_raw)
+            except ValueError:
+                return None
+        else:
+            ts = _parse_iso_datetime(ts_raw)
+            if ts is None:
+                return None
+
+        return revert_id, claim_id, ts
+    except Exception:
+        return None
+
+
 def _parse_revert(obj: Dict[str, Any]) -> Optional[RevertEvent]:
     try:
         revert_id = str(obj.get("id", "")).strip()
@@ -0,0 +1,138 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+# <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+# file written and closed, renamed into place, or appended to (tailing)
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_MODIFY | IN_DELETE_SELF | IN_MOVE_SELF
+
+_EVENT = struct.Struct("iIII")  # wd, mask, cookie, len
+READ_SIZE = 1 << 16
+
+
+def _load_libc() -> Optional[ctypes.CDLL]:
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+    except OSError:
+        return None
+    if not hasattr(libc, "inotify_init1"):
+        return None
+    libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+    return libc
+
+
+class DirectoryNotifier:
+    """
+    Linux inotify watch on a set of directories (ctypes, no dependencies).
+
+    `wait` blocks until files in the watched directories are written, closed
+    or renamed into place and returns their paths, so the caller can check
+    just those files instead of rescanning the directories. `closed` tells
+    which of them were closed after writing or renamed into place, i.e. are
+    complete, as opposed to only appended to.
+    """
+
+    def __init__(self, dirs: Iterable[Path]) -> None:
+        libc = _load_libc()
+        if libc is None:
+            raise OSError("inotify is not available on this platform")
+        self._libc = libc
+
+        self._fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+
+        self._dirs: Dict[int, Path] = {}
+        for d in dirs:
+            wd = libc.inotify_add_watch(self._fd, os.fsencode(str(d)), WATCH_MASK)
+            if wd < 0:
+                err = ctypes.get_errno()
+                self.close()
+                raise OSError(err, os.strerror(err), str(d))
+            self._dirs[wd] = d
+
+        # monotonic time of the first event of the batch returned by the last wait()
+        self.first_event_at: Optional[float] = None
+        # paths of that batch closed after writing or renamed into place
+        self.closed: Set[Path] = set()
+
+    @staticmethod
+    def available() -> bool:
+        return _load_libc() is not None
+
+    def wait(self, timeout: float, settle: float = 0.05) -> Optional[List[Path]]:
+        """
+        Waits up to `timeout` seconds for file events. After the first event,
+        keeps collecting for `settle` seconds to batch bursts of writes.
+        Returns changed file paths (sorted, possibly empty), or None if events
+        were lost (queue overflow, watched directory gone) and the caller
+        should fall back to a full rescan.
+        """
+        self.first_event_at = None
+        self.closed = set()
+        changed: Set[Path] = set()
+        rescan = False
+
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            ready, _, _ = select.select([self._fd], [], [], remaining)
+            if not ready:
+                break
+            if self.first_event_at is None:
+                self.first_event_at = time.monotonic()
+                deadline = self.first_event_at + settle
+            for path, mask in self._read_events():
+                if mask & (IN_Q_OVERFLOW | IN_DELETE_SELF | IN_MOVE_SELF | IN_IGNORED):
+                    rescan = True
+                elif path is not None and not mask & IN_ISDIR:
+                    changed.add(path)
+                    if mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+                        self.closed.add(path)
+
+        return None if rescan else sorted(changed)
+
+    def _read_events(self) -> List[Tuple[Optional[Path], int]]:
+        try:
+            data = os.read(self._fd, READ_SIZE)
+        except BlockingIOError:
+            return []
+
+        events = []
+        pos = 0
+        while pos + _EVENT.size <= len(data):
+            wd, mask, _cookie, name_len = _EVENT.unpack_from(data, pos)
+            pos += _EVENT.size
+            name = data[pos:pos + name_len].rstrip(b"\0")
+            pos += name_len
+
+            d = self._dirs.get(wd)
+            events.append((d / os.fsdecode(name) if d is not None and name else None, mask))
+        return events
+
+    def close(self) -> None:
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
@@ -1,6 +1,9 @@
 import csv
 from pathlib import Path
-from typing import Dict, Iterable
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from .compression import DECOMPRESSION_ERRORS, open_text
+from .discover import DEFAULT_FILTER, FileFilter, discover_files
 
 
 def load_pharmacies_csv(files: Iterable[Path]) -> Dict[str, str]:
@@ -8,11 +11,12 @@ def load_pharmacies_csv(files: Iterable[Path]) -> Dict[str, str]:
     Reads pharmacy snapshot from CSV files with headers like: chain,npi
     Returns: npi -> chain
     If duplicates exist, last one wins.
+    Files ending in .gz, .bz2 or .xz are decompressed while reading.
     """
     out: Dict[str, str] = {}
 
     for fp in files:
-        with fp.open("r", encoding="utf-8") as f:
+        with open_text(fp) as f:
             reader = csv.DictReader(f)
             # expected columns: chain, npi
             for row in reader:
@@ -22,3 +26,53 @@ def load_pharmacies_csv(files: Iterable[Path]) -> Dict[str, str]:
                     continue
                 out[npi] = chain
     return out
+
+
+class PharmacySnapshotWatcher:
+    """
+    Detects changes of the pharmacy CSV files (added, removed or rewritten,
+    by path, size and mtime) for hot reload in --streaming mode.
+    Replace files atomically (write, then rename) so a half-written file is not read.
+    """
+
+    def __init__(self, paths: Iterable[str], filters: FileFilter = DEFAULT_FILTER) -> None:
+        self.paths = list(paths)
+        self.filters = filters
+        self.files, self._signature = self._scan()
+        # why the last reload failed (None once the files are read or back as they were)
+        self.error: Optional[str] = None
+
+    def _scan(self) -> Tuple[List[Path], Tuple]:
+        files = discover_files(self.paths, filters=self.filters).csv_files
+        signature = []
+        for fp in files:
+            try:
+                st = fp.stat()
+            except OSError:
+                continue
+            signature.append((str(fp), st.st_size, st.st_mtime_ns))
+        return files, tuple(signature)
+
+    def poll(self) -> Optional[Dict[str, str]]:
+        """
+        The new snapshot if the files changed since the last successful
+        reload, else None. If they cannot be read (removed in between,
+        corrupt, not UTF-8, bad CSV), the current snapshot stays in use, the
+        reason is kept in `error` and the reload is tried again on the next poll.
+        """
+        files, signature = self._scan()
+        if signature == self._signature:
+            self.error = None
+            return None
+        try:
+            pharmacies = load_pharmacies_csv(files)
+        except (*DECOMPRESSION_ERRORS, UnicodeDecodeError, csv.Error) as exc:
+            self.error = f"{type(exc).__name__}: {exc}"
+            return None
+        self.error = None
+        self.files, self._signature = files, signature
+        return pharmacies
+
+    def dirs(self) -> Set[Path]:
+        """Watched directories (for file notifications)."""
+        return {Path(p).resolve() for p in self.paths if Path(p).is_dir()}
@@ -1,39 +1,246 @@
+import time
+from dataclasses import dataclass
 from pathlib import Path
-from typing import Iterable, List, Tuple, Set
+from typing import AbstractSet, Any, Dict, Iterable, List, Optional, Set, Tuple
 
-from .discover import discover_files
+from .compression import compression_of
+from .discover import STREAMING_FILTER, DirectoryIndex, FileFilter, ScanStats, input_kind
+from .events_json import FileSlice, complete_jsonl_end, sniff_json_format
+
+# seconds a JSON array or compressed file must keep its size and mtime before
+# it is taken as complete (unless it was seen closed or renamed into place)
+DEFAULT_SETTLE_SECONDS = 2.0
+# a JSON lines file idle this long is only re-checked for appends when its
+# directory changes or in a sweep of all files this often
+DEFAULT_TAIL_SWEEP_SECONDS = 30.0
+
+
+@dataclass(slots=True)
+class FilePosition:
+    inode: int
+    offset: int  # bytes already handed out
+    tailable: bool  # JSON lines: appended lines are picked up
 
 
 class FileStreamWatcher:
     """
-    Tracks newly appeared JSON files in claims and reverts directories.
+    Tracks JSON files in claims and reverts directories.
     Intended for --streaming mode.
+
+    A new file is handed out once it is non-empty. JSON lines files are then
+    tailed: complete lines appended later are handed out as byte ranges, so a
+    single growing file only costs its new bytes per poll. A file whose inode
+    changed or that shrank (rotation, truncation) is read again from the start.
+    JSON array files and compressed files (.gz, .bz2, .xz) are handed out
+    whole, once, and only when complete: when the caller saw them closed
+    after writing or renamed into place (check_files `closed`), or once
+    their size and mtime have not changed for `settle` seconds. Until then
+    they are re-checked every poll; a whole file is never read while it may
+    still grow.
+
+    Directories are scanned through a DirectoryIndex, so a poll reads only
+    directories that changed and stats only new files, pending whole files
+    and the JSON lines files in changed directories or appended to within the
+    last `sweep` seconds. Appending does not change a directory, so every
+    `sweep` seconds (and on a `full` poll) all JSON lines files are stat'ed:
+    lines appended to a file idle for longer are picked up within `sweep`
+    seconds. A JSON array file rewritten in place (same inode) is not noticed.
     """
 
-    def __init__(self, claim_dirs: Iterable[Path], revert_dirs: Iterable[Path]):
+    def __init__(
+        self,
+        claim_dirs: Iterable[Path],
+        revert_dirs: Iterable[Path],
+        filters: FileFilter = STREAMING_FILTER,
+        settle: float = DEFAULT_SETTLE_SECONDS,
+        sweep: float = DEFAULT_TAIL_SWEEP_SECONDS,
+    ):
         self.claim_dirs = {p.resolve() for p in claim_dirs}
         self.revert_dirs = {p.resolve() for p in revert_dirs}
+        self.filters = filters
+        self.settle = settle
+        self.sweep = sweep
 
-        self._seen_claim_files: Set[Path] = set()
-        self._seen_revert_files: Set[Path] = set()
+        self._claim_files: Dict[Path, FilePosition] = {}
+        self._revert_files: Dict[Path, FilePosition] = {}
+        # only direct children count; a directory listed for both holds claims
+        self._claim_index = DirectoryIndex(self.claim_dirs, recursive=False, filters=filters)
+        self._revert_index = DirectoryIndex(self.revert_dirs - self.claim_dirs, recursive=False, filters=filters)
+        # new files with nothing to hand out yet (still empty), retried every poll
+        self._claim_waiting: Set[Path] = set()
+        self._revert_waiting: Set[Path] = set()
+        # whole files not known complete yet: (size, mtime_ns, monotonic time first seen so)
+        self._claim_pending: Dict[Path, Tuple[int, int, float]] = {}
+        self._revert_pending: Dict[Path, Tuple[int, int, float]] = {}
+        # JSON lines files appended to recently: monotonic time of their last slice
+        self._active: Dict[Path, float] = {}
+        self._last_sweep: Optional[float] = None
 
-    def discover_new_files(self) -> Tuple[List[Path], List[Path]]:
-        discovered = discover_files(
-            [str(p) for p in self.claim_dirs | self.revert_dirs]
+    def discover_new_files(self, full: bool = False) -> Tuple[List[FileSlice], List[FileSlice]]:
+        """
+        New files and appended lines. `full`: stat every JSON lines file
+        (e.g. after lost file notifications); done anyway on the first poll
+        and every `sweep` seconds.
+        """
+        now = time.monotonic()
+        if full or self._last_sweep is None or now - self._last_sweep >= self.sweep:
+            full = True
+            self._last_sweep = now
+        new_claims = self._poll(self._claim_index, self._claim_files, self._claim_waiting, self._claim_pending, full)
+        new_reverts = self._poll(
+            self._revert_index, self._revert_files, self._revert_waiting, self._revert_pending, full
         )
+        self._active = {fp: t for fp, t in self._active.items() if now - t < self.sweep}
+        return new_claims, new_reverts
+
+    def has_pending(self) -> bool:
+        """True if whole files are waiting to be complete."""
+        return bool(self._claim_pending or self._revert_pending)
+
+    def scan_stats(self) -> ScanStats:
+        """Cost of the last discover_new_files (both directory sets)."""
+        a, b = self._claim_index.last_stats, self._revert_index.last_stats
+        return ScanStats(a.seconds + b.seconds, a.dirs + b.dirs, a.dirs_listed + b.dirs_listed, a.entries + b.entries)
+
+    def _poll(
+        self,
+        index: DirectoryIndex,
+        positions: Dict[Path, FilePosition],
+        waiting: Set[Path],
+        pending: Dict[Path, Tuple[int, int, float]],
+        full: bool,
+    ) -> List[FileSlice]:
+        new = index.scan()
+        candidates = set(new)
+        candidates.update(waiting)
+        candidates.update(pending)
+        if full:
+            candidates.update(fp for fp, pos in positions.items() if pos.tailable)
+        else:
+            listed, active = index.last_listed, self._active
+            candidates.update(
+                fp for fp, pos in positions.items() if pos.tailable and (fp.parent in listed or fp in active)
+            )
+
+        parts: List[FileSlice] = []
+        for fp in sorted(candidates):
+            part = self._next_slice(fp, positions, pending)
+            if part is not None:
+                parts.append(part)
+                waiting.discard(fp)
+            elif fp not in positions and fp not in pending and fp.exists():
+                waiting.add(fp)
+            else:
+                waiting.discard(fp)
+        return parts
 
-        new_claims: List[Path] = []
-        new_reverts: List[Path] = []
+    def check_files(
+        self, paths: Iterable[Path], closed: AbstractSet[Path] = frozenset()
+    ) -> Tuple[List[FileSlice], List[FileSlice]]:
+        """
+        Like discover_new_files, but only looks at the given (e.g. notified)
+        paths and the whole files still pending. `closed`: paths seen closed
+        after writing or renamed into place, so complete.
+        """
+        new_claims: List[FileSlice] = []
+        new_reverts: List[FileSlice] = []
 
-        for fp in discovered.json_files:
-            fp = fp.resolve()
+        candidates = {}
+        for fp in paths:
+            if input_kind(fp.name) != ".json" or not self.filters.accepts(fp.name):
+                continue
+            candidates[fp.resolve()] = fp in closed
+        for fp in (*self._claim_pending, *self._revert_pending):
+            candidates.setdefault(fp, False)
 
-            if fp.parent in self.claim_dirs and fp not in self._seen_claim_files:
-                new_claims.append(fp)
-                self._seen_claim_files.add(fp)
+        for fp, complete in sorted(candidates.items()):
+            if fp.parent in self.claim_dirs:
+                part = self._next_slice(fp, self._claim_files, self._claim_pending, complete)
+                if part is not None:
+                    new_claims.append(part)
 
-            elif fp.parent in self.revert_dirs and fp not in self._seen_revert_files:
-                new_reverts.append(fp)
-                self._seen_revert_files.add(fp)
+            elif fp.parent in self.revert_dirs:
+                part = self._next_slice(fp, self._revert_files, self._revert_pending, complete)
+                if part is not None:
+                    new_reverts.append(part)
 
         return new_claims, new_reverts
+
+    def _next_slice(
+        self,
+        fp: Path,
+        positions: Dict[Path, FilePosition],
+        pending: Dict[Path, Tuple[int, int, float]],
+        complete: bool = False,
+    ) -> Optional[FileSlice]:
+        try:
+            st = fp.stat()
+        except OSError:
+            positions.pop(fp, None)  # deleted
+            pending.pop(fp, None)
+            self._active.pop(fp, None)
+            return None
+
+        pos = positions.get(fp)
+        if pos is not None and (pos.inode != st.st_ino or st.st_size < pos.offset):
+            pos = None  # rotated or truncated: start over
+
+        if pos is None:
+            fmt = sniff_json_format(fp)
+            if fmt is None:
+                return None  # nothing written yet
+            if fmt != "{" or compression_of(fp.name):
+                if not complete and not self._settled(fp, st, pending):
+                    return None
+                pending.pop(fp, None)
+                positions[fp] = FilePosition(st.st_ino, st.st_size, tailable=False)
+                return FileSlice(fp)
+            pos = positions[fp] = FilePosition(st.st_ino, 0, tailable=True)
+
+        if not pos.tailable or st.st_size <= pos.offset:
+            return None
+
+        end = complete_jsonl_end(fp, pos.offset, st.st_size)
+        if end <= pos.offset:
+            return None
+        part = FileSlice(fp, pos.offset, end)
+        pos.offset = end
+        self._active[fp] = time.monotonic()
+        return part
+
+    def _settled(self, fp: Path, st, pending: Dict[Path, Tuple[int, int, float]]) -> bool:
+        """True once the size and mtime of `fp` have not changed for `settle` seconds."""
+        now = time.monotonic()
+        size, mtime, since = pending.get(fp, (-1, -1, now))
+        if (size, mtime) != (st.st_size, st.st_mtime_ns):
+            pending[fp] = (st.st_size, st.st_mtime_ns, now)
+            return False
+        return now - since >= self.settle
+
+    def export_positions(self) -> Dict[str, Any]:
+        """Per-file positions already handed out, for checkpoints."""
+        return {
+            "claim_files": {str(p): [v.inode, v.offset, v.tailable] for p, v in self._claim_files.items()},
+            "revert_files": {str(p): [v.inode, v.offset, v.tailable] for p, v in self._revert_files.items()},
+        }
+
+    def restore_positions(self, positions: Dict[str, Any]) -> None:
+        self._claim_files = self._load_positions(positions.get("claim_files", {}))
+        self._revert_files = self._load_positions(positions.get("revert_files", {}))
+
+    @staticmethod
+    def _load_positions(saved) -> Dict[Path, FilePosition]:
+        if isinstance(saved, list):
+            # older checkpoints only list fully processed files
+            out = {}
+            for p in saved:
+                fp = Path(p)
+                try:
+                    st = fp.stat()
+                except OSError:
+                    continue
+                tailable = sniff_json_format(fp) == "{" and not compression_of(fp.name)
+                out[fp] = FilePosition(st.st_ino, st.st_size, tailable=tailable)
+            return out
+
+        return {Path(p): FilePosition(inode, offset, tailable) for p, (inode, offset, tailable) in saved.items()}